@@ -1,16 +1,37 @@
 """
 This module contains a Flask application to handle incoming webhook requests.
 """
+import time
+
 
 from config.main_config import MainConfig
 from alert_manager import AlertManager
-from utils import parse_webhook
+from alert_decoder import AlertDecoder
+from metrics import MetricsRegistry
+from signal_dispatcher import SignalDispatcher
+from trade_journal import TradeJournal
 from flask import Flask, request, abort
-import threading
 
 # Create Flask object called app.
 app = Flask(__name__)
 alert_manager = AlertManager()
+hmsg = MainConfig.getinstance().message_handler
+
+# Validates the alerts and resolves their ticker before they are queued
+decoder = AlertDecoder(alert_manager.tickers)
+
+# Signals are handled on a bounded worker pool, one at a time per ticker
+dispatcher = SignalDispatcher(alert_manager.handle_alert, preempt=alert_manager.preempt)
+
+metrics = MetricsRegistry.getinstance()
+dispatcher_metrics = metrics.gauge('bybit_dispatcher', 'Signal queue state and counters.', ('value',))
+
+def collect_dispatcher_metrics():
+    stats = dispatcher.stats()
+    for name in ('queue_depth', 'running', 'dispatched', 'coalesced', 'rejected'):
+        dispatcher_metrics.set(stats[name], value=name)
+
+metrics.add_collector(collect_dispatcher_metrics)
 
 @app.route('/')
 def root():
@@ -19,34 +40,51 @@ def root():
     """
     return 'online'
 
-def handle_alert_thread(data):
+@app.route('/dispatcher', methods=['GET'])
+def dispatcher_stats():
+    """
+    A Flask route to return the signal queue depth and dispatch latency.
     """
-    A function to handle incoming alerts in a separate thread.
+    return dispatcher.stats()
 
-    :param data: a dictionary representing the incoming alert
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
     """
-    alert_manager.handle_alert(data)
+    A Flask route to expose the metrics in the Prometheus text format.
+    """
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/journal', methods=['GET'])
+def journal_stats():
+    """
+    A Flask route to return the execution statistics of every ticker from the trade journal.
+    The optional "days" argument limits them to the most recent days.
+    """
+    days = request.args.get('days', type=float)
+    since = time.time() - days * 86400 if days else None
+    return TradeJournal.stats(TradeJournal.getinstance().journal_file, since=since)
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """
     A Flask route to handle incoming webhooks.
 
-    :return: 'ok' if the webhook is successfully handled, 'nok' and a 404 error otherwise
+    :return: 'ok' if the webhook is successfully handled, 'nok' and a 404 error otherwise,
+        'busy' and a 429 error if the signal queue is saturated
     """
     if request.method == 'POST':
-        # Parse the string data from TradingView into a python dict
+        # Parse the JSON data from TradingView into a validated alert
         # Example of the data received:
         # { "ticker":"MATIC", "side":"Buy"}
-        data = parse_webhook(request.get_data(as_text=True))
+        data = decoder.decode(request.get_data())
         if data is None:
             return 'nok', 404
 
-        # Create a new thread to handle the alert
-        th = threading.Thread(target=handle_alert_thread, args=(data,))
-        th.start()
+        # Queue the alert, replacing any signal still pending for the same ticker
+        if not dispatcher.submit(data):
+            return 'busy', 429
 
-        print('POST Received:', data)
+        hmsg.msg('POST Received: %s %s %s', data['ticker'], data['side'], data['comment'], signal_id=data['signal_id'])
         return 'ok', 200
     else:
         abort(400)
@@ -60,15 +98,16 @@ def test_buy():
     """
     ticker = request.args.get('ticker')
     if request.method == 'GET':
-        # Parse the string data from TradingView into a python dict
-        mock_text = str({"ticker":ticker,"side":"buy","comment":"entry"})
-        data = parse_webhook(mock_text)
+        # Build the alert TradingView would send
+        data = decoder.build(ticker, 'buy', 'entry')
+        if data is None:
+            return 'nok', 404
 
-        print('POST Received:', data)
+        hmsg.msg('POST Received: %s %s %s', data['ticker'], data['side'], data['comment'], signal_id=data['signal_id'])
 
-        # Create a new thread to handle the alert
-        th = threading.Thread(target=handle_alert_thread, args=(data,))
-        th.start()
+        # Queue the alert, replacing any signal still pending for the same ticker
+        if not dispatcher.submit(data):
+            return 'busy', 429
         return 'ok', 200
     else:
         abort(400)
@@ -82,14 +121,16 @@ def test_sell():
     """
     ticker = request.args.get('ticker')
     if request.method == 'GET':
-        # Parse the string data from TradingView into a python dict
-        mock_text = str({"ticker":ticker,"side":"sell","comment":"close"})
-        data = parse_webhook(mock_text)
-        print('POST Received:', data)
-
-        # Create a new thread to handle the alert
-        th = threading.Thread(target=handle_alert_thread, args=(data,))
-        th.start()
+        # Build the alert TradingView would send
+        data = decoder.build(ticker, 'sell', 'close')
+        if data is None:
+            return 'nok', 404
+
+        hmsg.msg('POST Received: %s %s %s', data['ticker'], data['side'], data['comment'], signal_id=data['signal_id'])
+
+        # Queue the alert, replacing any signal still pending for the same ticker
+        if not dispatcher.submit(data):
+            return 'busy', 429
         return 'ok', 200
     else:
         abort(400)
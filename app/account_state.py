@@ -0,0 +1,190 @@
+"""
+Shared cache of wallet balances and positions.
+
+The cache is updated by the private wallet and position streams and reconciled
+over REST on a timer. Readers get the cached values without a network round
+trip as long as the stream is connected, or the last reconciliation is recent
+enough when it is not.
+"""
+import logging
+import threading
+import time
+
+from bybit_stream import BybitStream
+from message_handler import log
+
+
+class AccountState():
+
+    # Seconds between REST reconciliations
+    RECONCILE_INTERVAL = 30
+
+    # Maximum age, in seconds, of cached values while the private stream is down
+    MAX_AGE = 2
+
+    _instance = None
+
+    def __init__(self, session, collateral: str, stream=None, reconcile_interval: float = RECONCILE_INTERVAL):
+        """
+        Args:
+            session: Exchange session used for REST reconciliation.
+            collateral (str): Collateral coin, ex: "USDT".
+            stream: BybitStream or ReplayStream delivering the private "wallet" and "position" topics.
+            reconcile_interval (float): Seconds between REST reconciliations; 0 disables the timer.
+        """
+        self.session = session
+        self.collateral = collateral
+        self.stream = stream if stream is not None else BybitStream.getprivate()
+        self.reconcile_interval = reconcile_interval
+        self._balances = dict()
+        self._positions = dict()
+        self.symbols = set()
+        self._lock = threading.Lock()
+        self.stream.subscribe('wallet', self._on_wallet)
+        self.stream.subscribe('position', self._on_position)
+        self.stream.add_disconnect_handler(self._on_disconnect)
+        if reconcile_interval:
+            threading.Thread(target=self._reconcile_loop, daemon=True).start()
+
+    @classmethod
+    def getinstance(cls, session, collateral: str) -> 'AccountState':
+        """
+        Returns the account state shared by all tickers, creating it on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls(session, collateral)
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, account_state: 'AccountState') -> None:
+        """
+        Replaces the shared account state.
+        """
+        cls._instance = account_state
+
+    def is_live(self) -> bool:
+        """
+        Returns True while the private stream is connected.
+        """
+        return self.stream.is_connected()
+
+    def get_wallet_balance(self) -> float:
+        """
+        Returns the cached wallet balance of the collateral coin, or None if it is unknown or stale.
+        """
+        entry = self._balances.get(self.collateral)
+        if not self._is_fresh(entry):
+            return None
+        return float(entry['wallet_balance'])
+
+    def get_positions(self, symbol: str) -> tuple:
+        """
+        Returns the cached long and short positions of a symbol.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+
+        Returns:
+            tuple: (long_position, short_position), or None if they are unknown or stale.
+        """
+        entry = self._positions.get(symbol)
+        if not self._is_fresh(entry):
+            return None
+        return dict(entry['Buy']), dict(entry['Sell'])
+
+    def balance_age(self) -> float:
+        """
+        Returns the seconds since the wallet balance was last updated, or None if it is unknown.
+        """
+        entry = self._balances.get(self.collateral)
+        return time.time() - entry['updated_at'] if entry is not None else None
+
+    def positions_age(self, symbol: str) -> float:
+        """
+        Returns the seconds since the positions of a symbol were last updated, or None if they are unknown.
+        """
+        entry = self._positions.get(symbol)
+        return time.time() - entry['updated_at'] if entry is not None else None
+
+    def update_wallet(self, wallet: dict) -> None:
+        """
+        Stores a wallet update, either pushed or returned by get_wallet_balance.
+
+        Args:
+            wallet (dict): Wallet fields of the collateral coin; must contain wallet_balance.
+        """
+        with self._lock:
+            entry = dict(self._balances.get(self.collateral, {}))
+            entry.update(wallet)
+            entry['updated_at'] = time.time()
+            self._balances[self.collateral] = entry
+
+    def update_positions(self, positions: list) -> None:
+        """
+        Stores position updates, either pushed or returned by my_position.
+
+        Updates older than the cached position, according to position_seq, are ignored.
+
+        Args:
+            positions (list): Position dictionaries with symbol and side.
+        """
+        now = time.time()
+        with self._lock:
+            for position in positions:
+                entry = self._positions.get(position['symbol'])
+                self.symbols.add(position['symbol'])
+                if entry is None:
+                    entry = self._positions[position['symbol']] = {
+                        'Buy': {'side': 'Buy', 'size': 0},
+                        'Sell': {'side': 'Sell', 'size': 0},
+                        'updated_at': now
+                    }
+                cached = entry[position['side']]
+                if 'position_seq' in cached and 'position_seq' in position \
+                        and int(position['position_seq']) < int(cached['position_seq']):
+                    continue
+                entry[position['side']] = dict(position)
+                entry['updated_at'] = now
+                # Both sides must have been received before the entry can be served
+                entry['complete'] = 'symbol' in entry['Buy'] and 'symbol' in entry['Sell']
+
+    def reconcile(self, symbols=None) -> None:
+        """
+        Refreshes the wallet balance and the positions of the given symbols over REST.
+
+        Args:
+            symbols (iterable): Symbols to refresh; defaults to every symbol seen so far.
+        """
+        try:
+            response = self.session.get_wallet_balance(coin=self.collateral)
+            if response['ret_code'] == 0:
+                self.update_wallet(response['result'][self.collateral])
+            for symbol in list(self.symbols) if symbols is None else symbols:
+                response = self.session.my_position(symbol=symbol)
+                if response['ret_code'] == 0:
+                    self.update_positions(response['result'])
+        except Exception as ex:
+            log(logging.ERROR, 'Failed to reconcile account state: %s', ex)
+
+    def _is_fresh(self, entry: dict) -> bool:
+        if entry is None or not entry.get('complete', True):
+            return False
+        return self.is_live() or time.time() - entry['updated_at'] <= self.MAX_AGE
+
+    def _reconcile_loop(self) -> None:
+        while True:
+            time.sleep(self.reconcile_interval)
+            self.reconcile()
+
+    def _on_wallet(self, message: dict) -> None:
+        for wallet in message['data']:
+            self.update_wallet(wallet)
+
+    def _on_position(self, message: dict) -> None:
+        self.update_positions(message['data'])
+
+    def _on_disconnect(self) -> None:
+        # Pushes may be lost while disconnected: drop everything and rely on REST until reconciled
+        with self._lock:
+            self._balances.clear()
+            self._positions.clear()
@@ -0,0 +1,107 @@
+"""
+Decoder for the TradingView alerts received on the webhook.
+
+The POST body is parsed as JSON, with orjson when it is installed, and checked
+against a fixed schema: a known ticker, a buy or sell side and an optional
+comment. Anything else is rejected before it reaches the dispatcher. Ticker
+names are interned and the BybitTicker is resolved once here, so the alert
+manager does not have to look it up again. Every alert gets a signal_id that
+follows it through the log records of its order procedures.
+"""
+import itertools
+import json
+import sys
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+from utils import err
+
+
+class AlertDecoder():
+
+    # Bodies larger than this are rejected without being parsed
+    MAX_BODY_SIZE = 1024
+    MAX_COMMENT_LENGTH = 64
+
+    # Accepted spellings of the side, mapped to the exchange side
+    SIDES = {
+        'buy': 'Buy', 'Buy': 'Buy', 'BUY': 'Buy',
+        'sell': 'Sell', 'Sell': 'Sell', 'SELL': 'Sell',
+    }
+
+    FIELDS = frozenset(('ticker', 'side', 'comment'))
+
+    def __init__(self, tickers: dict):
+        """
+        Args:
+            tickers (dict): BybitTicker objects keyed by ticker name, as held by the AlertManager.
+        """
+        self.tickers = tickers
+        self._signal_ids = itertools.count(1)
+
+    def decode(self, body) -> dict:
+        """
+        Parses and validates a webhook body.
+
+        Args:
+            body (bytes | str): POST data from TradingView, ex: b'{"ticker":"ETH","side":"buy","comment":"entry"}'.
+
+        Returns:
+            dict: Alert with the "ticker", "side" ("Buy" or "Sell"), "comment", "client" (BybitTicker) and
+                "signal_id" keys, or None if the body is not a valid alert.
+        """
+        if len(body) > self.MAX_BODY_SIZE:
+            err('Alert rejected: body too large')
+            return None
+        try:
+            data = _loads(body)
+        except ValueError:
+            err('Alert rejected: body is not valid JSON')
+            return None
+        if not isinstance(data, dict) or not data.keys() <= self.FIELDS:
+            err('Alert rejected: unexpected fields')
+            return None
+        return self.build(data.get('ticker'), data.get('side'), data.get('comment', ''))
+
+    def build(self, ticker, side, comment='') -> dict:
+        """
+        Validates the fields of an alert.
+
+        Args:
+            ticker (str): Ticker name, ex: "ETH".
+            side (str): "buy" or "sell", in any of the accepted spellings.
+            comment (str): Comment carried from the Pine script.
+
+        Returns:
+            dict: Alert as returned by decode, or None if a field is invalid.
+        """
+        client = self.tickers.get(ticker) if isinstance(ticker, str) else None
+        if client is None:
+            err(f'Alert rejected: unknown ticker {ticker!r}')
+            return None
+
+        exchange_side = None
+        if isinstance(side, str):
+            exchange_side = self.SIDES.get(side) or self.SIDES.get(side.lower())
+        if exchange_side is None:
+            err(f'Alert rejected: invalid side {side!r}')
+            return None
+
+        if comment is None:
+            comment = ''
+        if not isinstance(comment, str) or len(comment) > self.MAX_COMMENT_LENGTH:
+            err('Alert rejected: invalid comment')
+            return None
+
+        return {
+            # Every alert for a ticker shares one string, so later lookups compare by identity
+            'ticker': sys.intern(ticker),
+            'side': exchange_side,
+            'comment': comment,
+            'client': client,
+            'signal_id': next(self._signal_ids),
+        }
@@ -7,9 +7,14 @@ e.g. a long position is open and a short signal is received
 the long position is closed and a short position is opened
 """
 
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from math import fabs
-import threading
+from async_engine import AsyncExecutionEngine
 from bybit_ticker import BybitTicker
+from config.main_config import MainConfig
+from message_handler import MessageHandler
+from trade_journal import TradeJournal
 from utils import handle_exchange_response
 
 
@@ -18,6 +23,12 @@ class AlertManager():
     # When setting to true, exchange return messages will be printed on the console
     DEBUG = False
 
+    # Maximum number of positions being closed at the same time
+    CLOSE_WORKERS = 16
+
+    # Maximum number of tickers warming up at the same time
+    WARM_UP_WORKERS = 8
+
     def __init__(self):
         """
         Initializes an AlertManager object with a dictionary of BybitTicker objects.
@@ -25,26 +36,69 @@ class AlertManager():
         Each BybitTicker object corresponds to a different ticker symbol and provides
         methods for fetching position information and executing limit orders.
         """
+        self.hmsg = MainConfig.getinstance().message_handler
+        self.journal = TradeJournal.getinstance()
         self.tickers = dict()
+
+        # Positions are closed on a bounded pool instead of a new thread per close
+        self.close_executor = ThreadPoolExecutor(max_workers=self.CLOSE_WORKERS)
+
+        # Tickers make their REST calls on a bounded pool, so startup does not grow with their number
+        self.warm_up_executor = ThreadPoolExecutor(max_workers=self.WARM_UP_WORKERS)
         self._init_ticker_clients()
 
+        # Order procedures run as coroutines on a single event loop when enabled in the config file
+        self.engine = None
+        if MainConfig.getinstance().get_execution_engine() == 'asyncio':
+            self.engine = AsyncExecutionEngine.getinstance()
+
     def __create_ticker(self, ticker):
         """
         Creates a BybitTicker object for the given ticker symbol and adds it to the `tickers` dictionary.
+        Its warm up, fetching the price and syncing the leverage, is queued on the warm up pool.
 
         :param ticker: A string representing the ticker symbol.
         """
         self.tickers[ticker] = BybitTicker(ticker)
+        self.warm_up_executor.submit(self._warm_up, self.tickers[ticker])
 
     def _init_ticker_clients(self):
         """
-        Initializes BybitTicker objects for each ticker symbol in a configuration file.
+        Initializes BybitTicker objects for each ticker symbol in the configuration file.
+
+        Creating a ticker makes no REST call, so the tickers are ready to receive alerts right away;
+        an alert for a ticker still warming up waits for it, or warms it up itself if its turn has not come.
+        """
+        for ticker in MainConfig.getinstance().get_ticker_list():
+            self.__create_ticker(ticker)
+
+    def _warm_up(self, ticker):
+        """
+        Warms up a ticker, logging the error instead of raising it.
+
+        :param ticker: ticker object
+        :return: True if the ticker is warmed up, False otherwise
+        """
+        try:
+            ticker.warm_up()
+            return True
+        except Exception as ex:
+            self.hmsg.err('Failed to warm up %s: %s', ticker.coin_ticker, ex)
+            return False
+
+    def preempt(self, ticker_name):
+        """
+        Cancels the entry procedure running for a ticker, as a newer signal is waiting for it.
 
-        TODO: Implement functionality to read ticker symbols from a configuration file.
+        :param ticker_name: A string representing the ticker symbol.
         """
-        # TODO: Create tickers from config file
-        self.__create_ticker('ETH')
-        self.__create_ticker('CRO')
+        ticker = self.tickers.get(ticker_name)
+        if ticker is None:
+            return
+        if self.engine is not None:
+            self.engine.cancel_entry(ticker)
+        else:
+            ticker.cancel_procedure()
 
     def handle_alert(self, data):
         """
@@ -56,21 +110,31 @@ class AlertManager():
         :param data: A dictionary containing information about the trading signal.
         :return: True if a new position is opened, False otherwise.
         """
+        # Log records of the procedures started by this signal carry its id
+        with MessageHandler.context(signal_id=data.get('signal_id'), ticker=data.get('ticker')):
+            return self._handle_alert(data)
+
+    def _handle_alert(self, data):
         # Checks if the ticker symbol in the signal corresponds to a BybitTicker object.
-        if data['ticker'] in self.tickers:
-            ticker = self.tickers[data['ticker']]
-        else:
-            print('No such ticker ', data['ticker'])
+        # Alerts from the decoder carry the BybitTicker already resolved.
+        ticker = data.get('client') or self.tickers.get(data['ticker'])
+        if ticker is None:
+            self.hmsg.err('No such ticker %s', data['ticker'])
+            return False
+        self.journal.signal(ticker.coin_ticker, data['side'], data.get('signal_id') or 0)
+
+        # The leverage must be synced before trading
+        if not ticker.warmed_up and not self._warm_up(ticker):
             return False
 
         # Fetches the current long and short positions for the ticker.
         curr_long_position, curr_short_position = ticker.fetch_ticker_positions()
         if curr_long_position is None or curr_short_position is None:
-            print('Error fetching current positions')
+            self.hmsg.err('Error fetching current positions')
             return False
 
         # If the signal is a "close" signal, closes the corresponding position.
-        if 'close' in data['comment']:
+        if 'close' in data.get('comment', ''):
             if data['side'].lower() == 'sell':
                 self.close_long_trade(ticker, curr_long_position)
             if data['side'].lower() == 'buy':
@@ -96,18 +160,23 @@ class AlertManager():
         """
         # Check if there is already an open long position
         if float(json_long['size']) > 0:
-            print('Already in a LONG position')
+            self.hmsg.msg('Already in a LONG position')
             return False
 
         # Check if there is a short position for the same ticker and close it
+        if float(json_short['size']) > 0:
+            self.cancel_all_orders(ticker)
         self.close_short_trade(ticker, json_short)
 
         # Execute the buy limit order to open a new long position
-        ticker.thread_ident = threading.get_ident()
-        ticker.execute_limit_order_procedure('Buy')
+        if self.engine is not None:
+            self.engine.execute_limit_order_procedure(ticker, 'Buy')
+        else:
+            # Supersedes, and immediately interrupts, any procedure still running for the ticker
+            ticker.execute_limit_order_procedure('Buy')
 
         # Print a message to indicate that the trade is finished and await new signals
-        print('Trade finished. Awaiting new signals...')
+        self.hmsg.msg('Trade finished. Awaiting new signals...')
 
         return True
 
@@ -122,21 +191,39 @@ class AlertManager():
         """
         # Check if there is already an open short position
         if float(json_short['size']) > 0:
-            print('Already in a SHORT position')
+            self.hmsg.msg('Already in a SHORT position')
             return False
 
         # Check if there is a long position for the same ticker and close it
+        if float(json_long['size']) > 0:
+            self.cancel_all_orders(ticker)
         self.close_long_trade(ticker, json_long)
 
         # Execute the sell limit order to open a new short position
-        ticker.thread_ident = threading.get_ident()
-        ticker.execute_limit_order_procedure('Sell')
+        if self.engine is not None:
+            self.engine.execute_limit_order_procedure(ticker, 'Sell')
+        else:
+            # Supersedes, and immediately interrupts, any procedure still running for the ticker
+            ticker.execute_limit_order_procedure('Sell')
 
         # Print a message to indicate that the trade is finished and await new signals
-        print('Trade finished. Awaiting new signals...')
+        self.hmsg.msg('Trade finished. Awaiting new signals...')
 
         return True
 
+    def cancel_all_orders(self, ticker):
+        """
+        Cancels the orders left resting on a ticker before a reversal, so none of them fills after the close.
+
+        :param ticker: ticker object
+        """
+        try:
+            for ret in ticker.cancel_all_orders(ticker.coin_ticker):
+                if ret['ret_code'] != 0:
+                    self.hmsg.debug('Nothing to cancel: %s', ret['ret_msg'])
+        except Exception as ex:
+            self.hmsg.err('Failed to cancel the orders of %s: %s', ticker.coin_ticker, ex)
+
     def close_long_trade(self, ticker, json_long):
         """
         Closes a long position if it exists.
@@ -146,9 +233,12 @@ class AlertManager():
         :return: True if a long position was closed, False otherwise
         """
         if float(json_long['size']) > 0:
-            print('Long position found! Closing...')
-            th = threading.Thread(target=ticker.cancel_all_trades_limit, args=(json_long,))
-            th.start()
+            self.hmsg.msg('Long position found! Closing...')
+            if self.engine is not None:
+                self.engine.close_position(ticker, json_long)
+            else:
+                # The close runs with the log context, ex: signal_id, of this signal
+                self.close_executor.submit(contextvars.copy_context().run, ticker.cancel_all_trades_limit, json_long)
             return True
         return False
 
@@ -161,8 +251,11 @@ class AlertManager():
         :return: True if a short position was closed, False otherwise
         """
         if float(json_short['size']) > 0:
-            print('Short position found! Closing...')
-            th = threading.Thread(target=ticker.cancel_all_trades_limit, args=(json_short,))
-            th.start()
+            self.hmsg.msg('Short position found! Closing...')
+            if self.engine is not None:
+                self.engine.close_position(ticker, json_short)
+            else:
+                # The close runs with the log context, ex: signal_id, of this signal
+                self.close_executor.submit(contextvars.copy_context().run, ticker.cancel_all_trades_limit, json_short)
             return True
         return False
@@ -0,0 +1,165 @@
+"""
+Asynchronous REST client for the subset of the Bybit API used by the bot.
+
+Method names and parameters mirror the pybit HTTP session, so procedures can
+swap `session.place_active_order(...)` for `await client.place_active_order(...)`.
+Requests share one aiohttp connection pool and go through the same rate-limit
+governor as the synchronous session. Responses are returned as decoded
+dictionaries; unlike pybit, a non-zero ret_code is not raised as an exception.
+Orders can also be placed from the precomputed templates of order_templates
+with place_order, which only signs their variable parameters.
+"""
+import asyncio
+import json
+import time
+
+import aiohttp
+
+from metrics import RequestMetrics
+from order_templates import OrderTemplates
+from signing import format_value, normalize_params, sign
+
+
+class AsyncBybitClient():
+
+    ENDPOINT = 'https://api.bybit.com'
+
+    # Maximum number of keep-alive connections to the exchange
+    POOL_SIZE = 16
+    RECV_WINDOW = 5000
+
+    # Method name: (HTTP method, path, signed)
+    ENDPOINTS = {
+        'place_active_order': ('POST', '/private/linear/order/create', True),
+        'replace_active_order': ('POST', '/private/linear/order/replace', True),
+        'cancel_active_order': ('POST', '/private/linear/order/cancel', True),
+        'cancel_all_active_orders': ('POST', '/private/linear/order/cancel-all', True),
+        'query_active_order': ('GET', '/private/linear/order/search', True),
+        'my_position': ('GET', '/private/linear/position/list', True),
+        'set_leverage': ('POST', '/private/linear/position/set-leverage', True),
+        'set_trading_stop': ('POST', '/private/linear/position/trading-stop', True),
+        'get_wallet_balance': ('GET', '/v2/private/wallet/balance', True),
+        'orderbook': ('GET', '/v2/public/orderBook/L2', False),
+        'latest_information_for_symbol': ('GET', '/v2/public/tickers', False),
+        'query_symbol': ('GET', '/v2/public/symbols', False),
+    }
+
+    def __init__(self, api_key: str, api_secret: str, governor=None, endpoint: str = ENDPOINT):
+        """
+        Args:
+            api_key (str): API key.
+            api_secret (str): API secret.
+            governor (RateLimitGovernor): Shared rate-limit governor, or None to disable rate limiting.
+            endpoint (str): Base URL of the REST API.
+        """
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self.governor = governor
+        self.endpoint = endpoint
+        self._session = None
+        self._order_templates = dict()
+        self.metrics = RequestMetrics()
+
+    def __getattr__(self, name: str):
+        if name not in self.ENDPOINTS:
+            raise AttributeError(name)
+
+        async def endpoint_call(**params):
+            return await self.request(name, **params)
+
+        return endpoint_call
+
+    async def request(self, name: str, **params) -> dict:
+        """
+        Sends a request, waiting for the rate-limit governor without blocking the event loop.
+
+        Args:
+            name (str): pybit method name, ex: "place_active_order".
+            **params: Request parameters.
+
+        Returns:
+            dict: Decoded exchange response.
+        """
+        await self._throttle(name, params)
+
+        # The body is serialized from the same values as the signed string
+        params = normalize_params(params)
+        if self.ENDPOINTS[name][2]:
+            params['api_key'] = self._api_key
+            params['recv_window'] = self.RECV_WINDOW
+            params['timestamp'] = int(time.time() * 1000)
+            params['sign'] = sign(self._api_secret, params)
+        return await self._send(name, params)
+
+    def order_templates(self, symbol: str) -> OrderTemplates:
+        """
+        Returns the signed order templates of a symbol, building them on first use.
+        """
+        templates = self._order_templates.get(symbol)
+        if templates is None:
+            templates = OrderTemplates(symbol, self._api_key, self._api_secret, self.RECV_WINDOW)
+            self._order_templates[symbol] = templates
+        return templates
+
+    async def place_order(self, template, **values) -> dict:
+        """
+        Places an order from a template, only signing its variable parameters.
+
+        Args:
+            template (OrderTemplate): Template of the order type, ex: client.order_templates("ETHUSDT").post_only.
+            **values: The variable parameters of the template, ex: side="Buy", qty=0.1, price=1800.5.
+
+        Returns:
+            dict: Decoded exchange response.
+        """
+        await self._throttle('place_active_order', template.fields)
+        params = template.signed_params(int(time.time() * 1000), **values)
+        return await self._send('place_active_order', params)
+
+    async def _throttle(self, name: str, params: dict) -> None:
+        # Waits for the rate-limit governor without blocking the event loop
+        if self.governor is not None:
+            started_at = time.monotonic()
+            wait = self.governor.try_acquire(name, params)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.governor.try_acquire(name, params)
+            self.metrics.rate_limit_wait.observe(
+                time.monotonic() - started_at, endpoint_class=self.governor.endpoint_class(name))
+
+    async def _send(self, name: str, params: dict) -> dict:
+        method, path, _ = self.ENDPOINTS[name]
+        session = self._get_session()
+        url = self.endpoint + path
+        started_at = time.monotonic()
+        try:
+            if method == 'GET':
+                query = {key: format_value(value) for key, value in params.items()}
+                async with session.get(url, params=query) as response:
+                    result = await response.json(content_type=None)
+            else:
+                async with session.post(url, data=json.dumps(params), headers={'Content-Type': 'application/json'}) as response:
+                    result = await response.json(content_type=None)
+        except Exception as ex:
+            self.metrics.record(name, time.monotonic() - started_at, exception=ex)
+            raise
+        self.metrics.record(name, time.monotonic() - started_at, result)
+
+        if self.governor is not None:
+            self.governor.update(name, result)
+        return result
+
+    async def close(self) -> None:
+        """
+        Closes the connection pool.
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> 'aiohttp.ClientSession':
+        # Created lazily, as aiohttp sessions must be created inside the running event loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.POOL_SIZE, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
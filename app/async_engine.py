@@ -0,0 +1,469 @@
+"""
+Asyncio execution engine for the order procedures.
+
+Every order procedure is a coroutine on a single event loop running in a
+background thread, instead of an OS thread spinning on sleep(). REST calls go
+through AsyncBybitClient and pushed order updates wake the coroutines through
+asyncio events, so one process can chase orders on hundreds of symbols.
+
+The synchronous methods at the top of the class are the façade used by
+AlertManager and the Flask routes: they schedule a coroutine on the loop and
+either wait for its result or return a concurrent Future.
+"""
+import asyncio
+import threading
+import uuid
+
+from async_client import AsyncBybitClient
+from bybit_base import BybitBase
+from bybit_ticker import BybitTicker
+from config.main_config import MainConfig
+from execution_policy import CROSS, REPRICE
+from http_pool import SharedSession
+from message_handler import MessageHandler
+from order_tracker import OrderTracker
+from trade_journal import TradeJournal
+from utils import handle_exchange_response
+
+
+class AsyncExecutionEngine():
+
+    # Seconds to wait for the private stream to report a newly placed order
+    ORDER_ACK_TIMEOUT = 0.25
+
+    _instance = None
+
+    def __init__(self, client=None, order_tracker: OrderTracker = None):
+        """
+        Starts the event loop thread.
+
+        Args:
+            client: Asynchronous exchange client; an AsyncBybitClient is created from the config file if omitted.
+            order_tracker (OrderTracker): Source of pushed order updates; the shared tracker if omitted.
+        """
+        if client is None:
+            user_data = MainConfig.getinstance().get_user_data()
+            client = AsyncBybitClient(user_data['api_key'], user_data['api_secret'],
+                                      SharedSession.getinstance().governor)
+        self.client = client
+        self.order_tracker = order_tracker if order_tracker is not None else OrderTracker.getinstance()
+        self.order_tracker.add_listener(self._on_order_update)
+        self.entry_tasks = dict()
+        self._order_events = dict()
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def getinstance(cls) -> 'AsyncExecutionEngine':
+        """
+        Returns the engine shared by all tickers, creating it on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, engine: 'AsyncExecutionEngine') -> None:
+        """
+        Replaces the shared engine.
+        """
+        cls._instance = engine
+
+    def submit(self, coroutine):
+        """
+        Schedules a coroutine on the engine loop from any thread.
+
+        Returns:
+            concurrent.futures.Future: Future of the coroutine result.
+        """
+        # Log records of the coroutine keep the context, ex: signal_id, of the calling thread
+        return asyncio.run_coroutine_threadsafe(self._in_context(coroutine, MessageHandler.current_context()), self.loop)
+
+    @staticmethod
+    async def _in_context(coroutine, fields: dict):
+        with MessageHandler.context(**fields):
+            return await coroutine
+
+    def execute_limit_order_procedure(self, ticker: BybitTicker, side: str) -> str:
+        """
+        Runs the entry procedure of a ticker and blocks until it ends.
+        A procedure still running for the same ticker is cancelled first.
+
+        Args:
+            ticker (BybitTicker): Ticker to trade.
+            side (str): "Buy" or "Sell".
+
+        Returns:
+            str: The side of the filled order, or an empty string if the procedure was aborted.
+        """
+        return self.submit(self._run_entry(ticker, side)).result()
+
+    def close_position(self, ticker: BybitTicker, position_data: dict):
+        """
+        Starts closing a position with a stop-limit order, without waiting for it.
+
+        Args:
+            ticker (BybitTicker): Ticker of the position.
+            position_data (dict): Position to close.
+
+        Returns:
+            concurrent.futures.Future: Future of the procedure result.
+        """
+        ticker.reversal_count += 1
+        ticker.journal.close(ticker.coin_ticker, position_data, TradeJournal.REVERSAL)
+        return self.submit(self._run_stop(ticker, position_data))
+
+    def cancel_entry(self, ticker: BybitTicker) -> None:
+        """
+        Cancels the entry procedure running for a ticker, if any.
+        """
+        task = self.entry_tasks.get(ticker.coin_ticker)
+        if task is not None:
+            self.loop.call_soon_threadsafe(task.cancel)
+
+    async def _run_entry(self, ticker: BybitTicker, side: str) -> str:
+        previous_task = self.entry_tasks.get(ticker.coin_ticker)
+        if previous_task is not None and not previous_task.done():
+            previous_task.cancel()
+        task = self.loop.create_task(self.limit_order_procedure(ticker, side))
+        self.entry_tasks[ticker.coin_ticker] = task
+        try:
+            # The depth stream of the coin runs for as long as a procedure reads it
+            with ticker.market_data.subscribe(ticker.symbol):
+                side = await task
+        except asyncio.CancelledError:
+            ticker.hmsg.debug('Entry procedure superseded by a new signal')
+            return ''
+        if side:
+            # Exchange risk management: a single REST call, kept off the loop as the position may be queried
+            await self.loop.run_in_executor(None, ticker.register_exchange_stop, side)
+        return side
+
+    async def _run_stop(self, ticker: BybitTicker, position_data: dict) -> bool:
+        with ticker.market_data.subscribe(ticker.symbol):
+            return await self.stop_limit_procedure(ticker, position_data)
+
+    async def limit_order_procedure(self, ticker: BybitTicker, side: str) -> str:
+        """
+        Coroutine version of BybitTicker.place_limit_order_with_retry.
+        """
+        count_retries = 0
+        chase_state = ticker.new_chase_state('entry', side)
+        while True:
+            # Entry sizing reads local caches, but may fall back to REST: keep it off the loop
+            qty = await self.loop.run_in_executor(None, ticker.calculate_entry_size, side)
+            order = await self._create_limit_order(ticker, side, qty, chase_state)
+            if order is None:
+                return ''
+            if order['order_status'] == 'Filled':
+                ticker.limit_count += 1
+                return side
+
+            chase_state.retries = count_retries
+            ret_code = await self._tighten_limit_order(ticker, order, count_retries, chase_state)
+            if ret_code == BybitTicker.LIMIT_ORDER_FILLED:
+                return side
+            if ret_code == BybitTicker.ABORT_LIMIT_ORDER:
+                return ''
+            # Attempts include the amendments made while tightening
+            count_retries = chase_state.retries
+
+    async def _place_order(self, ticker: BybitTicker, template, **values) -> dict:
+        # Places an order and records it in the trade journal
+        response = await self.client.place_order(template, **values)
+        ticker.journal.order(ticker.coin_ticker, values['side'], values['qty'], values.get('price', 0), response)
+        return response
+
+    async def _create_limit_order(self, ticker: BybitTicker, side: str, qty: float, chase_state) -> dict:
+        symbol = ticker.coin_ticker + ticker.collateral
+        while True:
+            best_buy_price, best_sell_price = await self._observe_book(ticker, chase_state)
+            ticker.last_known_price = best_sell_price
+            price = round(ticker.execution_policy.limit_price(chase_state), 4)
+            # The order may reach the exchange even if the task is cancelled before the response
+            order_link_id = str(uuid.uuid4())
+            try:
+                response = await self._place_order(
+                    ticker,
+                    self.client.order_templates(symbol).post_only,
+                    side=side.capitalize(),
+                    qty=qty,
+                    price=price,
+                    order_link_id=order_link_id
+                )
+            except asyncio.CancelledError:
+                await self._cancel_interrupted_order(ticker, symbol, order_link_id)
+                raise
+            chase_state.observe_order(price)
+            if not handle_exchange_response(response, 'Failed to place limit order'):
+                return None
+
+            # PostOnly orders may be cancelled right after being created: wait for their status
+            try:
+                order = await self._acknowledge(ticker, response['result']['order_id'])
+            except asyncio.CancelledError:
+                await self.client.cancel_active_order(symbol=symbol, order_id=response['result']['order_id'])
+                raise
+            if order is not None and (order['order_status'] in ('Created', 'New', 'Filled')):
+                ticker.hmsg.msg('Limit order created', order_id=order['order_id'])
+                return order
+
+    async def _cancel_interrupted_order(self, ticker: BybitTicker, symbol: str, order_link_id: str) -> None:
+        # Cancels an order whose placement was interrupted, if the exchange received it
+        try:
+            response = await self.client.cancel_active_order(symbol=symbol, order_link_id=order_link_id)
+            if response['ret_code'] == 0:
+                ticker.hmsg.debug('Cancelled limit order placed before the cancellation', order_link_id=order_link_id)
+                return
+            # Not found or no longer active: the placement may have been processed after the cancel
+            order = self.order_tracker.get(order_link_id=order_link_id)
+            if order is None:
+                return
+            if order['order_status'] in ('Created', 'New', 'PartiallyFilled'):
+                await self.client.cancel_active_order(symbol=symbol, order_id=order['order_id'])
+            elif order['order_status'] == 'Filled':
+                ticker.hmsg.err('Limit order filled before the cancellation', order_id=order['order_id'])
+        except Exception as ex:
+            ticker.hmsg.err('Failed to cancel interrupted limit order: %s', ex, order_link_id=order_link_id)
+
+    async def _tighten_limit_order(self, ticker: BybitTicker, order: dict, count_retries: int, chase_state) -> int:
+        symbol = ticker.coin_ticker + ticker.collateral
+        order_id = order['order_id']
+        ticker.hmsg.msg('Monitoring limit order slippage')
+        with ticker.order_metrics.chase(ticker.coin_ticker, 'entry') as chase:
+            try:
+                while True:
+                    chase.iteration_started()
+                    order = await self._get_order_state(ticker, order_id)
+                    if order is None:
+                        chase.iteration_done()
+                        await asyncio.sleep(ticker.execution_policy.wait_interval(chase_state))
+                        continue
+                    if order['order_status'] == 'Filled':
+                        ticker.hmsg.msg('Limit order filled!', order_id=order_id)
+                        ticker.limit_count += 1
+                        return BybitTicker.LIMIT_ORDER_FILLED
+                    # An amended PostOnly order is cancelled if it would have crossed: place a new one
+                    if order['order_status'] == 'Cancelled':
+                        ticker.hmsg.debug('Limit order cancelled by the exchange', order_id=order_id)
+                        return BybitTicker.RETRY_LIMIT_ORDER
+
+                    await self._observe_book(ticker, chase_state)
+                    decision = ticker.execution_policy.decide(chase_state)
+
+                    # Open by market on too many attempts or price slippage
+                    if decision == CROSS:
+                        chase.cross()
+                        ret = await self.client.cancel_active_order(symbol=symbol, order_id=order_id)
+                        if handle_exchange_response(ret, 'CRITICAL: Failed to cancel limit order v2'):
+                            ticker.hmsg.msg('%s limit order cancelled. Trading by market', order['side'], order_id=order_id)
+                            await self._place_order(
+                                ticker,
+                                self.client.order_templates(symbol).market,
+                                side=order['side'],
+                                qty=order['qty']
+                            )
+                            ticker.market_count += 1
+                        else:
+                            ticker.hmsg.err('Limit order might got filled meanwhile. Returning...')
+                            ticker.limit_count += 1
+                        return BybitTicker.LIMIT_ORDER_FILLED
+
+                    # Tighten the limit order according to market move
+                    if decision == REPRICE:
+                        ticker.hmsg.debug('Tightening: %s', count_retries, order_id=order_id)
+                        chase.reprice()
+                        ticker.journal.reprice(ticker.coin_ticker, order_id)
+                        count_retries += 1
+                        chase_state.retries = count_retries
+                        # Amend the order in place, or cancel it and place a new one if the amendment is rejected
+                        if not await self._amend_order(ticker, order_id, chase_state):
+                            ret = await self.client.cancel_active_order(symbol=symbol, order_id=order_id)
+                            if ret['ret_code'] != 0:
+                                ticker.hmsg.err('Failed to cancel Limit order. Might got filled meanwhile. Returning...')
+                                return BybitTicker.LIMIT_ORDER_FILLED
+                            return BybitTicker.RETRY_LIMIT_ORDER
+
+                    chase.iteration_done()
+                    await self._wait_for_order(order_id, order['order_status'],
+                                               ticker.execution_policy.wait_interval(chase_state))
+            except asyncio.CancelledError:
+                # Superseded by a new signal: do not leave the entry order resting
+                await self.client.cancel_active_order(symbol=symbol, order_id=order_id)
+                ticker.hmsg.debug('Cancelled previous order as new signal has been received', order_id=order_id)
+                raise
+
+    async def stop_limit_procedure(self, ticker: BybitTicker, position_data: dict) -> bool:
+        """
+        Coroutine version of BybitTicker.force_stop_limit_order.
+        """
+        ticker.hmsg.msg('Forcing STOP Limit order')
+        if float(position_data['size']) <= 0:
+            return True
+
+        symbol = ticker.coin_ticker + ticker.collateral
+        position_side = position_data['side']
+        counter_side = 'Sell' if position_side.lower() == 'buy' else 'Buy'
+        count_retries = 0
+        # The trailing stop references of the close are the best prices seen by the chase state
+        chase_state = ticker.new_chase_state('stop', counter_side)
+
+        while True:
+            # Stop-limit order placement
+            while True:
+                await self._observe_book(ticker, chase_state)
+                price = round(ticker.execution_policy.limit_price(chase_state), 4)
+                response = await self._place_order(
+                    ticker,
+                    self.client.order_templates(symbol).reduce_post_only,
+                    side=counter_side,
+                    qty=position_data['size'],
+                    price=price
+                )
+                chase_state.observe_order(price)
+                if response['ret_code'] != 0:
+                    ticker.hmsg.err('Failed to place SL order. Might got filled meanwhile. Returning...')
+                    ticker.limit_count += 1
+                    return True
+                order = await self._acknowledge(ticker, response['result']['order_id'])
+                if order is not None and order['order_status'] == 'Filled':
+                    ticker.hmsg.msg('Stop-limit filled immediately!', order_id=order['order_id'])
+                    ticker.limit_count += 1
+                    return True
+                if order is not None and order['order_status'] in ('Created', 'New'):
+                    ticker.hmsg.msg('Stop-limit order created', order_id=order['order_id'])
+                    break
+                ticker.hmsg.msg('Failed to place Stop-limit order. Retrying (%s)', count_retries)
+
+            ticker.hmsg.msg('Monitoring stop-limit order...')
+            order_id = order['order_id']
+            with ticker.order_metrics.chase(ticker.coin_ticker, 'stop') as chase:
+                while True:
+                    chase.iteration_started()
+                    await self._observe_book(ticker, chase_state)
+
+                    order = await self._get_order_state(ticker, order_id)
+                    if order is None:
+                        chase.iteration_done()
+                        await asyncio.sleep(ticker.execution_policy.wait_interval(chase_state))
+                        continue
+                    if order['order_status'] == 'Filled':
+                        ticker.hmsg.msg('Stop Limit order Filled, Terminating trade...', order_id=order_id)
+                        ticker.limit_count += 1
+                        ticker.print_statistics()
+                        return True
+
+                    # An amended PostOnly order is cancelled if it would have crossed: place a new one
+                    if order['order_status'] == 'Cancelled':
+                        ticker.hmsg.debug('Stop-limit order cancelled by the exchange', order_id=order_id)
+                        break
+
+                    chase_state.retries = count_retries
+                    decision = ticker.execution_policy.decide(chase_state)
+
+                    # Close by market on too many attempts or price slippage
+                    if decision == CROSS:
+                        chase.cross()
+                        ret = await self.client.cancel_active_order(symbol=symbol, order_id=order_id)
+                        if handle_exchange_response(ret, 'CRITICAL: Failed to close SL order'):
+                            ticker.hmsg.msg('Stop Limit order cancelled. Closing by market')
+                            await self._place_order(
+                                ticker,
+                                self.client.order_templates(symbol).reduce_market,
+                                side=counter_side,
+                                qty=position_data['size']
+                            )
+                            ticker.market_count += 1
+                        else:
+                            ticker.limit_count += 1
+                        return True
+
+                    # Update SL order to a tighter one
+                    if decision == REPRICE:
+                        ticker.hmsg.debug('Tightning: %s', count_retries, order_id=order_id)
+                        chase.reprice()
+                        ticker.journal.reprice(ticker.coin_ticker, order_id)
+                        count_retries += 1
+                        # Amend the order in place, or cancel it and place a new one if the amendment is rejected
+                        if not await self._amend_order(ticker, order_id, chase_state):
+                            ret = await self.client.cancel_active_order(symbol=symbol, order_id=order_id)
+                            if ret['ret_code'] != 0:
+                                ticker.hmsg.err('Failed to cancel Stop-Limit order. Might got filled meanwhile. Returning...')
+                                return True
+                            break
+
+                    chase.iteration_done()
+                    await self._wait_for_order(order_id, order['order_status'],
+                                               ticker.execution_policy.wait_interval(chase_state))
+
+    async def _amend_order(self, ticker: BybitTicker, order_id: str, chase_state) -> bool:
+        # Moves a resting order to the price of the execution policy; False if the amendment was rejected
+        price = round(ticker.execution_policy.limit_price(chase_state), 4)
+        response = await self.client.replace_active_order(
+            symbol=ticker.coin_ticker + ticker.collateral,
+            order_id=order_id,
+            p_r_price=price
+        )
+        if response['ret_code'] != 0:
+            ticker.hmsg.debug('Amendment rejected. Replacing order...', order_id=order_id)
+            return False
+        chase_state.observe_order(price)
+        return True
+
+    async def _observe_book(self, ticker: BybitTicker, chase_state) -> tuple:
+        # Depth stream first, REST order book when it is not in sync; the top of the book goes to the chase state
+        best = ticker.market_data.peek(ticker.symbol)
+        if best is None:
+            response = await self.client.orderbook(symbol=ticker.symbol)
+            best = BybitBase.get_top_of_book(response['result'])
+        chase_state.observe(best[0]['price'], best[1]['price'], best[0].get('size'), best[1].get('size'))
+        return float(best[0]['price']), float(best[1]['price'])
+
+    async def _get_order_state(self, ticker: BybitTicker, order_id: str) -> dict:
+        # Private stream cache first, REST query when the order is unknown
+        order = self.order_tracker.get(order_id)
+        if order is not None:
+            return order
+        response = await self.client.query_active_order(symbol=ticker.coin_ticker + ticker.collateral, order_id=order_id)
+        if not handle_exchange_response(response, 'Failed to retrieve order data'):
+            return None
+        self.order_tracker.record(response['result'])
+        return response['result']
+
+    async def _acknowledge(self, ticker: BybitTicker, order_id: str) -> dict:
+        # Status of a newly placed order, pushed or queried when the push is late
+        order = await self._wait_for_order(order_id, None, self.ORDER_ACK_TIMEOUT)
+        if order is not None:
+            return order
+        return await self._get_order_state(ticker, order_id)
+
+    async def _wait_for_order(self, order_id: str, status: str = None, timeout: float = None) -> dict:
+        """
+        Waits until the order is pushed in a status other than the given one.
+
+        Returns:
+            dict: The order, or None if nothing new arrived before the timeout.
+        """
+        order = self.order_tracker.get(order_id)
+        if order is None or order.get('order_status') == status:
+            event = self._order_events.setdefault(order_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._order_events.pop(order_id, None)
+            order = self.order_tracker.get(order_id)
+        if order is not None and order.get('order_status') != status:
+            return order
+        return None
+
+    def _on_order_update(self, order: dict) -> None:
+        # Called from the stream thread
+        self.loop.call_soon_threadsafe(self._wake, order['order_id'])
+
+    def _wake(self, order_id: str) -> None:
+        event = self._order_events.get(order_id)
+        if event is not None:
+            event.set()
@@ -0,0 +1,392 @@
+"""
+Parallel parameter sweeps of the Pine strategy backtester.
+
+Parameter combinations come from a grid, a random search or a sequential
+model-based search, and are run in batches on a process pool. The price series
+is written once to memory-mapped .npy files that every worker opens read-only,
+so the workers share the same pages instead of receiving a pickled copy with
+each batch. Workers also keep the ATR of the periods and the ATR trailing
+stops of the settings they have seen last. Results stream back as batches complete into a table
+ranked by the chosen summary metric.
+
+The model-based search is a small Tree-structured Parzen Estimator: after a
+random warm-up, candidates are drawn around the best results and the ones
+most likely to belong to the best results rather than to the others are run.
+
+Usage: python app/backtest_sweep.py klines.csv --risk-management TSL
+           --param long_stop_loss=0.5:5:0.25 --param short_stop_loss=0.5:5:0.25 [--random 500] [--tpe 500]
+"""
+import argparse
+import csv
+import functools
+import heapq
+import inspect
+import itertools
+import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from backtester import ATR, RISK_MANAGEMENT_NAMES, PineBacktester, atr_trailing_stops, average_true_range, load_csv
+
+COLUMNS = ('open', 'high', 'low', 'close', 'signal')
+
+# Ticker settings of the bot and the backtester arguments they correspond to
+PARAMETER_ALIASES = {'long_tsl_perc': 'long_stop_loss', 'short_tsl_perc': 'short_stop_loss'}
+
+# Series opened by each worker process
+_series = None
+
+
+def _init_worker(directory: str) -> None:
+    global _series
+    _series = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in COLUMNS}
+
+
+@functools.lru_cache(maxsize=32)
+def _average_true_range(period: int) -> np.ndarray:
+    return average_true_range(_series['high'], _series['low'], _series['close'], period)
+
+
+@functools.lru_cache(maxsize=16)
+def _atr_trailing_stops(period: int, multiplier: float) -> tuple:
+    return atr_trailing_stops(_series['high'], _series['low'], _series['close'], period, multiplier,
+                              _average_true_range(period))
+
+
+def _run_batch(base_params: dict, batch: list) -> list:
+    results = []
+    for params in batch:
+        arguments = {PARAMETER_ALIASES.get(name, name): value for name, value in params.items()}
+        backtester = PineBacktester(**dict(base_params, **arguments))
+        atr_stops = None
+        if backtester.risk_management == ATR:
+            atr_stops = _atr_trailing_stops(backtester.atr_period, backtester.atr_multiplier)
+        result = backtester.run(_series['open'], _series['high'], _series['low'], _series['close'],
+                                _series['signal'], atr_stops=atr_stops)
+        results.append((params, result.summary()))
+    return results
+
+
+class ResultTable():
+    """
+    Results of a sweep, ranked by one summary metric.
+    """
+
+    def __init__(self, metric: str = 'net_profit_perc', min_trades: int = 0):
+        """
+        Args:
+            metric (str): Summary key to maximize, ex: "net_profit_perc" or "profit_factor".
+            min_trades (int): Results with fewer trades are kept but ranked last.
+        """
+        self.metric = metric
+        self.min_trades = min_trades
+        self.results = []
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def score(self, summary: dict) -> float:
+        value = summary.get(self.metric)
+        if value is None or summary['trades'] < self.min_trades:
+            return -math.inf
+        return value
+
+    def add(self, params: dict, summary: dict) -> None:
+        self.results.append((self.score(summary), params, summary))
+
+    def ranked(self, top: int = None) -> list:
+        """
+        Returns (score, params, summary) tuples, best first.
+        """
+        key = lambda result: result[0]
+        if top is None:
+            return sorted(self.results, key=key, reverse=True)
+        return heapq.nlargest(top, self.results, key=key)
+
+    def format(self, top: int = 20) -> str:
+        lines = []
+        for rank, (score, params, summary) in enumerate(self.ranked(top), 1):
+            values = ' '.join(f'{name}={value:g}' if isinstance(value, float) else f'{name}={value}'
+                              for name, value in params.items())
+            lines.append(f'{rank:>3}. {self.metric}={score:10.4f} | trades {summary["trades"]:>5} | '
+                         f'max drawdown {summary["max_drawdown_perc"]:6.2f} % | {values}')
+        return '\n'.join(lines)
+
+    def write_csv(self, path: str) -> None:
+        ranked = self.ranked()
+        if not ranked:
+            return
+        param_names = list(ranked[0][1])
+        summary_names = [name for name, value in ranked[0][2].items() if not isinstance(value, dict)]
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(param_names + summary_names)
+            for _, params, summary in ranked:
+                writer.writerow([params[name] for name in param_names] + [summary[name] for name in summary_names])
+
+
+class ParameterSweep():
+
+    # Parameter sets sent to a worker at once
+    CHUNK_SIZE = 8
+
+    # Random evaluations before the model-based search starts
+    TPE_WARMUP = 64
+
+    # Fraction of the results considered good by the model-based search
+    TPE_GAMMA = 0.2
+
+    # Candidates drawn for every parameter set the model-based search runs
+    TPE_CANDIDATES = 32
+
+    def __init__(self, columns: dict, base_params: dict = None, processes: int = None,
+                 metric: str = 'net_profit_perc', min_trades: int = 0, chunk_size: int = CHUNK_SIZE):
+        """
+        Args:
+            columns (dict): open, high, low, close and signal arrays of the series.
+            base_params (dict): PineBacktester arguments shared by every run, ex: {"risk_management": TSL}.
+            processes (int): Worker processes; the number of CPUs by default.
+            metric (str): Summary key the results are ranked by.
+            min_trades (int): Results with fewer trades are ranked last.
+            chunk_size (int): Parameter sets per batch sent to a worker.
+        """
+        self.columns = columns
+        self.base_params = base_params or dict()
+        self.processes = processes or os.cpu_count()
+        self.metric = metric
+        self.min_trades = min_trades
+        self.chunk_size = chunk_size
+        self._directory = None
+        self._pool = None
+
+    def __enter__(self) -> 'ParameterSweep':
+        # The workers map the series from disk instead of receiving a copy
+        self._directory = tempfile.mkdtemp(prefix='sweep-')
+        for name in COLUMNS:
+            np.save(os.path.join(self._directory, name + '.npy'), np.ascontiguousarray(self.columns[name], dtype=np.float64))
+        self._pool = ProcessPoolExecutor(self.processes, initializer=_init_worker, initargs=(self._directory,))
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._pool.shutdown(cancel_futures=True)
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+    @staticmethod
+    def check_params(params: dict) -> None:
+        """
+        Raises a ValueError for parameters the backtester does not have, before any worker runs them.
+        """
+        known = set(inspect.signature(PineBacktester).parameters) | set(PARAMETER_ALIASES)
+        unknown = sorted(set(params) - known)
+        if unknown:
+            raise ValueError(f'Unknown backtester parameters: {", ".join(unknown)}')
+
+    @staticmethod
+    def grid(space: dict):
+        """
+        Yields every combination of the parameter values.
+
+        Args:
+            space (dict): Values of every parameter, ex: {"long_stop_loss": [1, 2, 3], "atr_period": [14, 21]}.
+        """
+        names = list(space)
+        for values in itertools.product(*(space[name] for name in names)):
+            yield dict(zip(names, values))
+
+    @staticmethod
+    def sample(space: dict, count: int, rng: np.random.Generator):
+        """
+        Yields random parameter sets: lists are sampled uniformly, (low, high) tuples as uniform ranges,
+        of integers when both bounds are integers.
+        """
+        for _ in range(count):
+            params = dict()
+            for name, values in space.items():
+                if isinstance(values, tuple):
+                    low, high = values
+                    if isinstance(low, int) and isinstance(high, int):
+                        params[name] = int(rng.integers(low, high + 1))
+                    else:
+                        params[name] = float(rng.uniform(low, high))
+                else:
+                    params[name] = values[int(rng.integers(len(values)))]
+            yield params
+
+    def run(self, candidates, table: ResultTable = None, on_result=None) -> ResultTable:
+        """
+        Runs parameter sets on the pool, keeping at most twice as many batches in flight as workers.
+
+        Args:
+            candidates (iterable): Parameter dictionaries, ex: from grid or sample.
+            table (ResultTable): Table the results are added to; a new one if omitted.
+            on_result (callable): Called with every (params, summary) as it arrives.
+
+        Returns:
+            ResultTable: The table holding the results.
+        """
+        candidates = iter(candidates)
+        first = next(candidates, None)
+        if first is None:
+            return table if table is not None else ResultTable(self.metric, self.min_trades)
+        self.check_params(first)
+        candidates = itertools.chain((first,), candidates)
+        table = table if table is not None else ResultTable(self.metric, self.min_trades)
+        pending = set()
+        while True:
+            while len(pending) < self.processes * 2:
+                batch = list(itertools.islice(candidates, self.chunk_size))
+                if not batch:
+                    break
+                pending.add(self._pool.submit(_run_batch, self.base_params, batch))
+            if not pending:
+                return table
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                for params, summary in future.result():
+                    table.add(params, summary)
+                    if on_result is not None:
+                        on_result(params, summary)
+
+    def optimize(self, space: dict, count: int, seed: int = None, on_result=None) -> ResultTable:
+        """
+        Sequential model-based search of `count` parameter sets.
+
+        Args:
+            space (dict): Lists of values or (low, high) ranges of every parameter.
+            count (int): Parameter sets to run.
+            seed (int): Seed of the random draws.
+            on_result (callable): Called with every (params, summary) as it arrives.
+        """
+        rng = np.random.default_rng(seed)
+        table = ResultTable(self.metric, self.min_trades)
+        warmup = min(count, max(self.TPE_WARMUP, self.processes * self.chunk_size))
+        self.run(self.sample(space, warmup, rng), table, on_result)
+        # Each round runs one batch per worker, so the model is updated while the pool stays busy
+        round_size = self.processes * self.chunk_size
+        while len(table) < count:
+            suggestions = self._suggest(space, table, min(round_size, count - len(table)), rng)
+            self.run(suggestions, table, on_result)
+        return table
+
+    def _suggest(self, space: dict, table: ResultTable, count: int, rng: np.random.Generator) -> list:
+        names = list(space)
+        ranked = table.ranked()
+        observed = np.array([[self._normalize(space[name], params[name]) for name in names]
+                             for _, params, _ in ranked])
+        good_count = max(1, int(len(ranked) * self.TPE_GAMMA))
+        good, bad = observed[:good_count], observed[good_count:]
+
+        # Candidates are drawn around good results, then ranked by their density ratio
+        bandwidth = 0.1
+        parents = good[rng.integers(len(good), size=count * self.TPE_CANDIDATES)]
+        candidates = np.clip(parents + rng.normal(0, bandwidth, parents.shape), 0, 1)
+        ratio = self._density(candidates, good, bandwidth) / (self._density(candidates, bad, bandwidth) + 1e-12)
+        chosen = candidates[np.argsort(-ratio)]
+
+        suggestions, seen = [], {tuple(params.items()) for _, params, _ in ranked}
+        for point in chosen:
+            params = {name: self._denormalize(space[name], value) for name, value in zip(names, point)}
+            key = tuple(params.items())
+            if key not in seen:
+                seen.add(key)
+                suggestions.append(params)
+                if len(suggestions) == count:
+                    break
+        # Discrete spaces can run out of unseen neighbours: top up with random draws
+        suggestions.extend(itertools.islice(self.sample(space, count - len(suggestions), rng), count - len(suggestions)))
+        return suggestions
+
+    @staticmethod
+    def _density(points: np.ndarray, samples: np.ndarray, bandwidth: float) -> np.ndarray:
+        if not len(samples):
+            return np.ones(len(points))
+        distances = ((points[:, None, :] - samples[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-distances / (2 * bandwidth ** 2)).mean(axis=1)
+
+    @staticmethod
+    def _normalize(values, value) -> float:
+        # Position of a value in its space, between 0 and 1
+        if isinstance(values, tuple):
+            low, high = values
+            return (value - low) / (high - low) if high != low else 0.5
+        return values.index(value) / (len(values) - 1) if len(values) > 1 else 0.5
+
+    @staticmethod
+    def _denormalize(values, position: float):
+        if isinstance(values, tuple):
+            low, high = values
+            value = low + position * (high - low)
+            return int(round(value)) if isinstance(low, int) and isinstance(high, int) else float(value)
+        return values[int(round(position * (len(values) - 1)))]
+
+
+def parse_param(text: str) -> tuple:
+    """
+    Parses a parameter of the command line: "name=low:high:step" for a grid range, "name=low~high"
+    for a continuous range of the random and model-based searches, or "name=a,b,c" for a list.
+    Values without a decimal point are integers.
+    """
+    name, values = text.split('=', 1)
+    number = lambda value: float(value) if '.' in value or 'e' in value.lower() else int(value)
+    if '~' in values:
+        low, high = values.split('~')
+        return name, (number(low), number(high))
+    if ':' in values:
+        low, high, step = (number(value) for value in values.split(':'))
+        count = int(round((high - low) / step)) + 1
+        values = [low + step * index for index in range(count)]
+        return name, [round(value, 10) if isinstance(value, float) else value for value in values]
+    return name, [number(value) for value in values.split(',')]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('csv', help='klines with open, high, low and close columns')
+    parser.add_argument('--signal-column', help='column of the external indicator input; the close by default')
+    parser.add_argument('--risk-management', default='ATR', choices=RISK_MANAGEMENT_NAMES)
+    parser.add_argument('--param', action='append', default=[], help='parameter values, see parse_param')
+    parser.add_argument('--random', type=int, help='run a random search of this many parameter sets')
+    parser.add_argument('--tpe', type=int, help='run a model-based search of this many parameter sets')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--metric', default='net_profit_perc')
+    parser.add_argument('--min-trades', type=int, default=0)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--output', help='CSV file receiving every result, best first')
+    args = parser.parse_args()
+
+    space = dict(parse_param(text) for text in args.param)
+    columns = load_csv(args.csv, args.signal_column)
+    base_params = {'risk_management': RISK_MANAGEMENT_NAMES[args.risk_management]}
+
+    progress = {'count': 0, 'reported_at': time.perf_counter()}
+
+    def on_result(params, summary):
+        progress['count'] += 1
+        if time.perf_counter() - progress['reported_at'] > 5:
+            progress['reported_at'] = time.perf_counter()
+            print(f'{progress["count"]} parameter sets run')
+
+    started_at = time.perf_counter()
+    with ParameterSweep(columns, base_params, args.processes, args.metric, args.min_trades) as sweep:
+        if args.tpe:
+            table = sweep.optimize(space, args.tpe, args.seed, on_result)
+        elif args.random:
+            table = sweep.run(sweep.sample(space, args.random, np.random.default_rng(args.seed)), on_result=on_result)
+        else:
+            table = sweep.run(sweep.grid(space), on_result=on_result)
+    elapsed = time.perf_counter() - started_at
+
+    print(f'{len(table)} parameter sets over {len(columns["close"])} bars in {elapsed:.1f} s')
+    print(table.format(args.top))
+    if args.output:
+        table.write_csv(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,522 @@
+"""
+NumPy backtester reproducing the 2022 LM Backtester Pine strategy (pine/2022_LM_Backtester.pine).
+
+Entry and close signals are evaluated on the external indicator input for the
+whole series at once, and the exit levels of every risk management mode are
+computed as arrays. Only the position state machine walks the series, one
+trade at a time: each step searches the bars of the open trade with vectorized
+comparisons for the first stop, limit or signal event, so the cost grows with
+the number of bars rather than with Python iterations per bar.
+
+Fills follow the strategy settings: process_orders_on_close, so entries,
+reversals and indicator closes fill at the bar close; stop and limit exits are
+placed at the close and fill intrabar on the next bars, at their level or at
+the open when the price gapped through it. When a stop and a limit are both
+touched within a bar, the one nearer to the open is assumed to be hit first,
+as TradingView's broker emulator does.
+
+Usage: python app/backtester.py klines.csv [--risk-management TSL] [--signal-column signal]
+"""
+import argparse
+import math
+
+import numpy as np
+
+# Risk management modes, named as in the Pine inputs
+SLTP = 'StopLoss/TakeProfit'
+TSL = 'Trailing Stop'
+ATR = 'ATR'
+BKOUT = 'BreakoutChannel'
+REV_SIGNAL = 'None (Indicator stops)'
+
+# Short names of the modes, for the command line
+RISK_MANAGEMENT_NAMES = {'SLTP': SLTP, 'TSL': TSL, 'ATR': ATR, 'BKOUT': BKOUT, 'NONE': REV_SIGNAL}
+
+TRADE_DTYPE = np.dtype([
+    ('direction', 'i1'),
+    ('entry_index', 'i8'),
+    ('exit_index', 'i8'),
+    ('entry_price', 'f8'),
+    ('exit_price', 'f8'),
+    ('qty', 'f8'),
+    ('commission', 'f8'),
+    ('pnl', 'f8'),
+    ('exit_reason', 'i1'),
+])
+
+# Exit reasons of the trades
+STOP = 0
+LIMIT = 1
+CLOSE_SIGNAL = 2
+REVERSAL = 3
+OPEN = 4
+
+EXIT_REASONS = ('stop', 'limit', 'close_signal', 'reversal', 'open')
+
+
+def evaluate_condition(values: np.ndarray, operator: str, value: float, default: bool = True) -> np.ndarray:
+    """
+    Vectorized f_eval_cond of the Pine strategy.
+
+    Args:
+        values (np.ndarray): External indicator input.
+        operator (str): One of "==", "<", ">", "<=", ">=", "!=", "crossover", "crossunder", "mod2", "mod3",
+            "mod10", "/10" or "noop".
+        value (float): Value the input is compared to.
+        default (bool): Result of the "noop" operator.
+
+    Returns:
+        np.ndarray: Boolean array, False where the input is NaN.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid='ignore'):
+        if operator == '==':
+            return values == value
+        if operator == '<':
+            return values < value
+        if operator == '>':
+            return values > value
+        if operator == '<=':
+            return values <= value
+        if operator == '>=':
+            return values >= value
+        if operator == '!=':
+            return ~np.isnan(values) & (values != value)
+        if operator in ('crossover', 'crossunder'):
+            previous = np.concatenate(([np.nan], values[:-1]))
+            if operator == 'crossover':
+                return (values > value) & (previous <= value)
+            return (values < value) & (previous >= value)
+        if operator in ('mod2', 'mod3', 'mod10'):
+            return np.fmod(values, int(operator[3:])) == value
+        if operator == '/10':
+            return np.trunc(values / 10) == value
+        if operator == 'noop':
+            return np.full(len(values), default)
+    raise ValueError(f'Unknown operator: {operator}')
+
+
+def rolling_extreme(values: np.ndarray, length: int, function) -> np.ndarray:
+    """
+    Lowest or highest value of the last `length` bars, current bar included.
+    The first bars use the bars available so far.
+
+    Args:
+        function: np.min or np.max.
+    """
+    fill = np.inf if function is np.min else -np.inf
+    padded = np.concatenate((np.full(length - 1, fill), values))
+    return function(np.lib.stride_tricks.sliding_window_view(padded, length), axis=1)
+
+
+def average_true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int) -> np.ndarray:
+    """
+    Wilder's moving average of the true range, seeded with the simple average of its first `period` values,
+    as ta.atr. NaN until it is defined.
+    """
+    previous_close = np.concatenate(([np.nan], close[:-1]))
+    true_range = np.fmax(high - low, np.fmax(np.abs(high - previous_close), np.abs(low - previous_close)))
+    true_range[0] = high[0] - low[0]
+
+    count = len(close)
+    averages = [math.nan] * count
+    if count >= period:
+        average = float(np.mean(true_range[:period]))
+        averages[period - 1] = average
+        for index, value in enumerate(true_range[period:].tolist(), period):
+            average = (average * (period - 1) + value) / period
+            averages[index] = average
+    return np.array(averages)
+
+
+def atr_trailing_stops(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int, multiplier: float,
+                       atr: np.ndarray = None) -> tuple:
+    """
+    ATRTrailingStop1 (long) and ATRTrailingStop2 (short) of the Pine strategy, NaN until the ATR is defined.
+
+    The trailing stops are a recurrence over the previous stop, computed once per series with plain floats.
+
+    Args:
+        atr (np.ndarray): average_true_range of the series for `period`, computed here when omitted.
+    """
+    if atr is None:
+        atr = average_true_range(high, low, close, period)
+    stop = (atr * multiplier).tolist()
+
+    count = len(close)
+    long_stops = [math.nan] * count
+    short_stops = [math.nan] * count
+    closes = close.tolist()
+    long_stop = short_stop = previous = math.nan
+    for index, price in enumerate(closes):
+        # Comparisons with NaN are False, as na comparisons in Pine
+        if price > long_stop and previous > long_stop:
+            long_stop = max(long_stop, price - stop[index])
+        else:
+            long_stop = price - stop[index]
+        if price < short_stop and previous < short_stop:
+            short_stop = min(short_stop, price + stop[index])
+        else:
+            short_stop = price + stop[index]
+        long_stops[index] = long_stop
+        short_stops[index] = short_stop
+        previous = price
+    return np.array(long_stops), np.array(short_stops)
+
+
+class BacktestResult():
+    """
+    Trades and equity curve of a backtest.
+    """
+
+    def __init__(self, trades: np.ndarray, equity: np.ndarray, initial_capital: float):
+        """
+        Args:
+            trades (np.ndarray): Structured array of TRADE_DTYPE, in entry order.
+            equity (np.ndarray): Equity at the close of every bar, open positions marked to the close.
+            initial_capital (float): Equity before the first bar.
+        """
+        self.trades = trades
+        self.equity = equity
+        self.initial_capital = initial_capital
+
+    def summary(self) -> dict:
+        """
+        Returns the strategy performance figures, as in the TradingView strategy tester.
+        """
+        closed = self.trades[self.trades['exit_reason'] != OPEN]
+        wins = closed['pnl'][closed['pnl'] > 0]
+        losses = closed['pnl'][closed['pnl'] <= 0]
+        peak = np.maximum.accumulate(np.concatenate(([self.initial_capital], self.equity)))
+        drawdown = (peak - np.concatenate(([self.initial_capital], self.equity))) / peak
+        final_equity = float(self.equity[-1]) if len(self.equity) else self.initial_capital
+        return {
+            'net_profit': final_equity - self.initial_capital,
+            'net_profit_perc': (final_equity / self.initial_capital - 1) * 100,
+            'trades': len(closed),
+            'win_rate': len(wins) / len(closed) if len(closed) else None,
+            'profit_factor': float(wins.sum() / -losses.sum()) if losses.sum() < 0 else None,
+            'max_drawdown_perc': float(drawdown.max()) * 100,
+            'commission': float(self.trades['commission'].sum()),
+            'exit_reasons': {reason: int((closed['exit_reason'] == code).sum())
+                             for code, reason in enumerate(EXIT_REASONS) if code != OPEN},
+        }
+
+
+class PineBacktester():
+
+    # Bars searched at once for an exit; doubled while the trade stays open
+    SEARCH_CHUNK = 256
+
+    def __init__(self, risk_management: str = ATR, long_stop_loss: float = 3, long_take_profit: float = 3,
+                 short_stop_loss: float = 3, short_take_profit: float = 3, atr_period: int = 21,
+                 atr_multiplier: float = 2.8, breakout_length: int = 4, breakout_r2r: float = 2.25,
+                 start_long=('/10', 2.0), end_long=('/10', 1.0), start_short=('mod10', 2.0),
+                 end_short=('mod10', 1.0), indicator_close_events: bool = True, wait_reversal_candle: bool = False,
+                 uninterrupted_trades: bool = False, start_time: float = None, end_time: float = None,
+                 initial_capital: float = 100, qty_perc: float = 50, commission_perc: float = 0.025):
+        """
+        Defaults are those of the Pine strategy inputs.
+
+        Args:
+            risk_management (str): SLTP, TSL, ATR, BKOUT or REV_SIGNAL.
+            long_stop_loss (float): Long stop loss, or trailing stop with TSL, in percent.
+            long_take_profit (float): Long take profit in percent.
+            short_stop_loss (float): Short stop loss, or trailing stop with TSL, in percent.
+            short_take_profit (float): Short take profit in percent.
+            atr_period (int): ATR length of the ATR trailing stop.
+            atr_multiplier (float): ATR multiple of the ATR trailing stop.
+            breakout_length (int): Bars of the breakout channel.
+            breakout_r2r (float): Take profit of the breakout channel, as a multiple of the risk.
+            start_long (tuple): Operator and value starting a long deal, ex: ("/10", 2.0).
+            end_long (tuple): Operator and value ending a long deal.
+            start_short (tuple): Operator and value starting a short deal.
+            end_short (tuple): Operator and value ending a short deal.
+            indicator_close_events (bool): Close positions on the end deal conditions.
+            wait_reversal_candle (bool): Only enter long above the previous low, short below the previous high.
+            uninterrupted_trades (bool): Positions are only closed by their exits, never reversed.
+            start_time (float): First bar timestamp traded, in the unit of the timestamps passed to run.
+            end_time (float): Last bar timestamp traded.
+            initial_capital (float): Initial equity.
+            qty_perc (float): Position size, in percent of the equity.
+            commission_perc (float): Commission of every fill, in percent of its value.
+        """
+        if risk_management not in (SLTP, TSL, ATR, BKOUT, REV_SIGNAL):
+            raise ValueError(f'Unknown risk management: {risk_management}')
+        self.risk_management = risk_management
+        self.long_stop_loss = long_stop_loss
+        self.long_take_profit = long_take_profit
+        self.short_stop_loss = short_stop_loss
+        self.short_take_profit = short_take_profit
+        self.atr_period = atr_period
+        self.atr_multiplier = atr_multiplier
+        self.breakout_length = breakout_length
+        self.breakout_r2r = breakout_r2r
+        self.start_long = start_long
+        self.end_long = end_long
+        self.start_short = start_short
+        self.end_short = end_short
+        self.indicator_close_events = indicator_close_events
+        self.wait_reversal_candle = wait_reversal_candle
+        self.uninterrupted_trades = uninterrupted_trades
+        self.start_time = start_time
+        self.end_time = end_time
+        self.initial_capital = initial_capital
+        self.qty_perc = qty_perc
+        self.commission_perc = commission_perc
+
+    def signals(self, high: np.ndarray, low: np.ndarray, close: np.ndarray, signal: np.ndarray,
+                timestamps: np.ndarray = None) -> tuple:
+        """
+        Returns the long entry, short entry, long close and short close conditions of every bar.
+        Entries include the date range and reversal candle filters, not the uninterrupted trades one.
+        """
+        long_entry = evaluate_condition(signal, *self.start_long, default=False)
+        short_entry = evaluate_condition(signal, *self.start_short, default=False)
+        if timestamps is not None:
+            in_range = np.ones(len(close), dtype=bool)
+            if self.start_time is not None:
+                in_range &= timestamps >= self.start_time
+            if self.end_time is not None:
+                in_range &= timestamps <= self.end_time
+            long_entry &= in_range
+            short_entry &= in_range
+        if self.wait_reversal_candle:
+            long_entry[1:] &= close[1:] > low[:-1]
+            short_entry[1:] &= close[1:] < high[:-1]
+            long_entry[0] = short_entry[0] = False
+        if self.indicator_close_events:
+            long_close = evaluate_condition(signal, *self.end_long, default=True)
+            short_close = evaluate_condition(signal, *self.end_short, default=True)
+        else:
+            long_close = short_close = np.zeros(len(close), dtype=bool)
+        return long_entry, short_entry, long_close, short_close
+
+    def run(self, open_: np.ndarray, high: np.ndarray, low: np.ndarray, close: np.ndarray, signal: np.ndarray = None,
+            timestamps: np.ndarray = None, atr_stops: tuple = None) -> BacktestResult:
+        """
+        Runs the strategy over a price series.
+
+        Args:
+            open_, high, low, close (np.ndarray): OHLC prices of every bar.
+            signal (np.ndarray): External indicator input; defaults to the close, as in the Pine script.
+            timestamps (np.ndarray): Bar timestamps, only needed with start_time or end_time.
+            atr_stops (tuple): Long and short ATR trailing stops already computed for these prices and the
+                ATR settings, to share them between runs.
+
+        Returns:
+            BacktestResult: Trades and equity curve.
+        """
+        open_, high, low, close = (np.ascontiguousarray(prices, dtype=np.float64) for prices in (open_, high, low, close))
+        signal = close if signal is None else np.asarray(signal, dtype=np.float64)
+        count = len(close)
+        long_entry, short_entry, long_close, short_close = self.signals(high, low, close, signal, timestamps)
+
+        # Bars where something happens at the close, to jump from one to the next
+        entry_bars = np.flatnonzero(long_entry | short_entry)
+        long_exit_bars = np.flatnonzero(long_close if self.uninterrupted_trades else long_close | short_entry)
+        short_exit_bars = np.flatnonzero(short_close if self.uninterrupted_trades else short_close | long_entry)
+
+        if self.risk_management == ATR and atr_stops is None:
+            atr_stops = atr_trailing_stops(high, low, close, self.atr_period, self.atr_multiplier)
+        if self.risk_management == BKOUT:
+            lowest = rolling_extreme(low, self.breakout_length, np.min)
+            highest = rolling_extreme(high, self.breakout_length, np.max)
+
+        trades = []
+        equity = self.initial_capital
+        commission_rate = self.commission_perc / 100
+        position = 0
+        bar = 0
+        while True:
+            if position == 0:
+                # Flat: the next entry signal opens a position at its close
+                next_entry = np.searchsorted(entry_bars, bar)
+                if next_entry == len(entry_bars):
+                    break
+                entry_index = int(entry_bars[next_entry])
+                # Both entries on one bar: strategy.entry("S") runs last and wins
+                position = -1 if short_entry[entry_index] else 1
+            entry_price = close[entry_index]
+            qty = equity * self.qty_perc / 100 / entry_price
+            entry_commission = qty * entry_price * commission_rate
+
+            if self.risk_management == BKOUT:
+                if position > 0:
+                    channel = (lowest[entry_index], entry_price + (entry_price - lowest[entry_index]) * self.breakout_r2r)
+                else:
+                    channel = (highest[entry_index], entry_price - (highest[entry_index] - entry_price) * self.breakout_r2r)
+            else:
+                channel = None
+
+            # Next close event of the position: indicator close or reversal
+            exit_bars = long_exit_bars if position > 0 else short_exit_bars
+            next_exit = np.searchsorted(exit_bars, entry_index + 1)
+            close_event = int(exit_bars[next_exit]) if next_exit < len(exit_bars) else None
+
+            last_bar = close_event if close_event is not None else count - 1
+            hit = self._find_exit(position, entry_index, entry_price, last_bar, open_, high, low, close, atr_stops, channel)
+
+            if hit is not None:
+                exit_index, exit_price, reason = hit
+                next_position, bar = 0, exit_index
+            elif close_event is not None:
+                exit_index, exit_price = close_event, close[close_event]
+                reversal = not self.uninterrupted_trades and (short_entry if position > 0 else long_entry)[close_event]
+                reason = REVERSAL if reversal else CLOSE_SIGNAL
+                next_position, bar = (-position if reversal else 0), close_event + 1
+            else:
+                exit_index, exit_price, reason = count - 1, close[-1], OPEN
+                next_position = None
+
+            exit_commission = qty * exit_price * commission_rate if reason != OPEN else 0.0
+            pnl = position * qty * (exit_price - entry_price) - entry_commission - exit_commission
+            trades.append((position, entry_index, exit_index, entry_price, exit_price, qty,
+                           entry_commission + exit_commission, pnl, reason))
+            if next_position is None:
+                break
+            equity += pnl
+            position = next_position
+            if position != 0:
+                entry_index = exit_index
+
+        trades = np.array(trades, dtype=TRADE_DTYPE)
+        return BacktestResult(trades, self._equity_curve(trades, close), self.initial_capital)
+
+    def _exit_levels(self, position: int, entry_index: int, entry_price: float, start: int, stop: int,
+                     close: np.ndarray, atr_stops: tuple, channel: tuple) -> tuple:
+        """
+        Stop and limit prices active during bars [start, stop) of a trade, None where the mode has none.
+        Orders are placed at the close, so the levels of a bar come from the previous close.
+        """
+        previous_close = close[start - 1:stop - 1]
+        if self.risk_management == SLTP:
+            if position > 0:
+                return (entry_price - previous_close * self.long_stop_loss / 100,
+                        entry_price + previous_close * self.long_take_profit / 100)
+            return (entry_price + previous_close * self.short_stop_loss / 100,
+                    entry_price - previous_close * self.short_take_profit / 100)
+        if self.risk_management == TSL:
+            # The trail starts on the bar after the entry: strategy.position_size is still 0 on the entry bar
+            closes = close[entry_index + 1:stop - 1]
+            if position > 0:
+                trail = np.maximum.accumulate(closes) * (1 - self.long_stop_loss / 100) if len(closes) else closes
+                levels = np.concatenate(([0.0], trail))
+            else:
+                trail = np.minimum.accumulate(closes) * (1 + self.short_stop_loss / 100) if len(closes) else closes
+                levels = np.concatenate(([np.inf], trail))
+            return levels[start - entry_index - 1:], None
+        if self.risk_management == ATR:
+            return atr_stops[0 if position > 0 else 1][start - 1:stop - 1], None
+        if self.risk_management == BKOUT:
+            return (np.full(stop - start, channel[0]), np.full(stop - start, channel[1]))
+        return None, None
+
+    def _find_exit(self, position: int, entry_index: int, entry_price: float, last_bar: int, open_: np.ndarray,
+                   high: np.ndarray, low: np.ndarray, close: np.ndarray, atr_stops: tuple, channel: tuple) -> tuple:
+        """
+        Returns the bar, price and reason of the first stop or limit fill in (entry_index, last_bar],
+        or None if no order is filled.
+        """
+        if self.risk_management == REV_SIGNAL:
+            return None
+        start = entry_index + 1
+        chunk = self.SEARCH_CHUNK
+        while start <= last_bar:
+            stop = min(start + chunk, last_bar + 1)
+            stop_levels, limit_levels = self._exit_levels(
+                position, entry_index, entry_price, start, stop, close, atr_stops, channel)
+            bar_high, bar_low = high[start:stop], low[start:stop]
+            with np.errstate(invalid='ignore'):
+                stop_hits = bar_low <= stop_levels if position > 0 else bar_high >= stop_levels
+                if limit_levels is not None:
+                    limit_hits = bar_high >= limit_levels if position > 0 else bar_low <= limit_levels
+                else:
+                    limit_hits = np.zeros(stop - start, dtype=bool)
+            hits = np.flatnonzero(stop_hits | limit_hits)
+            if len(hits):
+                offset = int(hits[0])
+                index = start + offset
+                bar_open = open_[index]
+                stop_level = stop_levels[offset]
+                limit_level = limit_levels[offset] if limit_levels is not None else None
+                stop_hit, limit_hit = bool(stop_hits[offset]), bool(limit_hits[offset])
+                if stop_hit and limit_hit:
+                    # The extreme nearer to the open is reached first
+                    high_first = high[index] - bar_open < bar_open - low[index]
+                    stop_hit = high_first != (position > 0)
+                if stop_hit:
+                    gapped = bar_open <= stop_level if position > 0 else bar_open >= stop_level
+                    return index, (bar_open if gapped else stop_level), STOP
+                gapped = bar_open >= limit_level if position > 0 else bar_open <= limit_level
+                return index, (bar_open if gapped else limit_level), LIMIT
+            start = stop
+            chunk *= 2
+        return None
+
+    def _equity_curve(self, trades: np.ndarray, close: np.ndarray) -> np.ndarray:
+        """
+        Equity at the close of every bar: realized PnL plus the open position marked to the close.
+        """
+        realized = np.zeros(len(close))
+        open_pnl = np.zeros(len(close))
+        for trade in trades:
+            entry_index, exit_index = trade['entry_index'], trade['exit_index']
+            entry_commission = trade['qty'] * trade['entry_price'] * self.commission_perc / 100
+            if trade['exit_reason'] == OPEN:
+                held = slice(entry_index, exit_index + 1)
+            else:
+                held = slice(entry_index, exit_index)
+                realized[exit_index] += trade['pnl']
+            open_pnl[held] += (trade['direction'] * trade['qty'] * (close[held] - trade['entry_price'])
+                               - entry_commission)
+        return self.initial_capital + np.cumsum(realized) + open_pnl
+
+
+def load_csv(path: str, signal_column: str = None) -> dict:
+    """
+    Loads klines from a CSV file with a header row holding at least open, high, low and close columns.
+
+    Returns:
+        dict: Column arrays, with "signal" set to the given column, or to the close when omitted.
+    """
+    data = np.genfromtxt(path, delimiter=',', names=True, dtype=np.float64)
+    columns = {name: np.ascontiguousarray(data[name]) for name in data.dtype.names}
+    columns['signal'] = columns[signal_column] if signal_column else columns['close']
+    return columns
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('csv', help='klines with open, high, low and close columns')
+    parser.add_argument('--signal-column', help='column of the external indicator input; the close by default')
+    parser.add_argument('--risk-management', default='ATR', choices=RISK_MANAGEMENT_NAMES)
+    parser.add_argument('--long-stop-loss', type=float, default=3)
+    parser.add_argument('--short-stop-loss', type=float, default=3)
+    parser.add_argument('--long-take-profit', type=float, default=3)
+    parser.add_argument('--short-take-profit', type=float, default=3)
+    parser.add_argument('--atr-period', type=int, default=21)
+    parser.add_argument('--atr-multiplier', type=float, default=2.8)
+    parser.add_argument('--breakout-length', type=int, default=4)
+    parser.add_argument('--breakout-r2r', type=float, default=2.25)
+    args = parser.parse_args()
+
+    columns = load_csv(args.csv, args.signal_column)
+    backtester = PineBacktester(
+        risk_management=RISK_MANAGEMENT_NAMES[args.risk_management],
+        long_stop_loss=args.long_stop_loss,
+        long_take_profit=args.long_take_profit,
+        short_stop_loss=args.short_stop_loss,
+        short_take_profit=args.short_take_profit,
+        atr_period=args.atr_period,
+        atr_multiplier=args.atr_multiplier,
+        breakout_length=args.breakout_length,
+        breakout_r2r=args.breakout_r2r
+    )
+    result = backtester.run(columns['open'], columns['high'], columns['low'], columns['close'], columns['signal'])
+    for key, value in result.summary().items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,19 +1,49 @@
-from pybit import HTTP
 from config.main_config import MainConfig
 from pybit.exceptions import InvalidRequestError
+from account_state import AccountState
+from http_pool import SharedSession
+from instrument_registry import InstrumentRegistry
+from market_data_hub import MarketDataHub, top_of_book
+from metrics import OrderMetrics
+from order_book import OrderBookFeed
+from order_templates import OrderTemplates
+from order_tracker import OrderTracker
+from trade_journal import TradeJournal
 
 
 class BybitBase():
 
     def __init__(self):
         """
-        Initializes the BybitBase class with the API key, secret, collateral and session objects.
+        Initializes the BybitBase class with the collateral and the shared session and caches.
+        The HTTP session is shared by all tickers and rate limited per endpoint class.
         """
-        self._api_key = MainConfig.getinstance().get_user_data()['api_key']
-        self._api_secret = MainConfig.getinstance().get_user_data()['api_secret']
         self.collateral = MainConfig.getinstance().get_user_data()['collateral']
-        self.session = HTTP("https://api.bybit.com",
-                api_key=self._api_key, api_secret=self._api_secret)
+        # Records are only queued here, the log listener thread writes them
+        self.hmsg = MainConfig.getinstance().message_handler
+        self.session = SharedSession.getinstance()
+        self.order_book_feed = OrderBookFeed.getinstance()
+        # Top of book shared by the procedures of all tickers, fed by the depth stream of the subscribed symbols
+        self.market_data = MarketDataHub.getinstance(self.session)
+        self.order_tracker = OrderTracker.getinstance()
+        self.instruments = InstrumentRegistry.getinstance(self.session)
+        self.account_state = AccountState.getinstance(self.session, self.collateral)
+        self.order_templates = dict()
+        self.order_metrics = OrderMetrics()
+        # Fills are journaled from the execution stream, whichever procedure placed the order
+        self.journal = TradeJournal.getinstance()
+        self.order_tracker.add_execution_listener(self.journal.on_execution)
+
+    def get_order_templates(self, coin_ticker: str) -> OrderTemplates:
+        """
+        Returns the order templates of a coin, building them on first use.
+        The fixed parameters of each order type are only built once per symbol.
+        """
+        templates = self.order_templates.get(coin_ticker)
+        if templates is None:
+            templates = OrderTemplates(coin_ticker + self.collateral)
+            self.order_templates[coin_ticker] = templates
+        return templates
 
     def place_order(self, coin_ticker, _side, _qty):
         """
@@ -23,15 +53,11 @@ class BybitBase():
         :param _qty: Trade quantity, ex: 0.1
         :return: Exchange response object
         """
-        return self.session.place_active_order(
-            symbol= coin_ticker + self.collateral,
-            side=_side,
-            order_type="Market",
-            qty=_qty,
-            time_in_force="GoodTillCancel",
-            reduce_only=False,
-            close_on_trigger=False
+        response = self.session.place_active_order(
+            **self.get_order_templates(coin_ticker).market.params(side=_side, qty=_qty)
         )
+        self.journal.order(coin_ticker, _side, _qty, 0, response)
+        return response
 
     def reduce_position(self, coin_ticker, counter_side, _qty):
         """
@@ -41,15 +67,11 @@ class BybitBase():
         :param _qty: Quantity to be reduced, ex: 0.1
         :return: Exchange response object
         """
-        return self.session.place_active_order(
-            symbol= coin_ticker + self.collateral,
-            side=counter_side,
-            order_type="Market",
-            qty=_qty,
-            time_in_force="GoodTillCancel",
-            reduce_only=True,
-            close_on_trigger=True
+        response = self.session.place_active_order(
+            **self.get_order_templates(coin_ticker).reduce_market.params(side=counter_side, qty=_qty)
         )
+        self.journal.order(coin_ticker, counter_side, _qty, 0, response)
+        return response
 
     def place_limit_order_po(self, coin_ticker, _side, _qty, _price):
         """
@@ -60,16 +82,11 @@ class BybitBase():
         :param _price: Limit price, ex: 50000.0
         :return: Exchange response object
         """
-        return self.session.place_active_order(
-            symbol= coin_ticker + self.collateral,
-            side=_side,
-            order_type="Limit",
-            price=_price,
-            qty=_qty,
-            time_in_force="PostOnly",
-            reduce_only=False,
-            close_on_trigger=False
+        response = self.session.place_active_order(
+            **self.get_order_templates(coin_ticker).post_only.params(side=_side, qty=_qty, price=_price)
         )
+        self.journal.order(coin_ticker, _side, _qty, _price, response)
+        return response
     
     def reduce_position_limit(self, coin_ticker: str, counter_side: str, qty: float, price: float) -> dict:
         """
@@ -84,30 +101,32 @@ class BybitBase():
         Returns:
             dict: A dictionary containing information about the placed order.
         """
-        return self.session.place_active_order(
-            symbol=coin_ticker + self.collateral,
-            side=counter_side,
-            order_type="Limit",
-            price=price,
-            qty=qty,
-            time_in_force="PostOnly",
-            reduce_only=True,
-            close_on_trigger=True
+        response = self.session.place_active_order(
+            **self.get_order_templates(coin_ticker).reduce_post_only.params(side=counter_side, qty=qty, price=price)
         )
+        self.journal.order(coin_ticker, counter_side, qty, price, response)
+        return response
     
     def get_wallet_balance(self) -> float:
         """
         Get the available balance in the trading account.
+
+        The balance kept by the account state cache is used when it is fresh,
+        otherwise it is fetched over REST.
         
         Returns:
             float: The available balance in the trading account.
         """
+        cached_balance = self.account_state.get_wallet_balance()
+        if cached_balance is not None:
+            return cached_balance
         json_result = self.session.get_wallet_balance(coin=self.collateral)
         if json_result['ret_code'] != 0:
-            print('Error while returning wallet balance!')
+            self.hmsg.err('Error while returning wallet balance!')
             return -1
+        self.account_state.update_wallet(json_result['result'][self.collateral])
         available_balance = json_result['result'][self.collateral]['wallet_balance']
-        print('Available balance: ', available_balance)
+        self.hmsg.debug('Available balance: %s', available_balance)
         return available_balance       
 
     def get_position_by_symbol(self, coin_ticker: str) -> dict:
@@ -143,10 +162,32 @@ class BybitBase():
                 buy_leverage=long_lev,
                 sell_leverage=short_lev
             )
-            print(f'Leverage successfully set - Buy: {long_lev}x | Sell: {short_lev}x')
-        except InvalidRequestError:
-            # If setting the leverage fails, print an error message
-            print('Failed to set leverage')
+            self.hmsg.msg('Leverage successfully set - Buy: %sx | Sell: %sx', long_lev, short_lev)
+        except InvalidRequestError as ex:
+            # If setting the leverage fails, log an error message
+            self.hmsg.err('Failed to set leverage: %s', ex)
+
+    def set_trading_stop(self, coin_ticker: str, side: str, take_profit: float = None, stop_loss: float = None,
+                         trailing_stop: float = None) -> dict:
+        """
+        Sets the stops of a position on the exchange, which closes the position by market when they trigger.
+
+        Args:
+            coin_ticker (str): The ticker symbol of the coin.
+            side (str): Side of the position, "Buy" or "Sell".
+            take_profit (float): Take profit price, 0 to remove it, unchanged if omitted.
+            stop_loss (float): Stop loss price, 0 to remove it, unchanged if omitted.
+            trailing_stop (float): Trailing stop distance in price, 0 to remove it, unchanged if omitted.
+
+        Returns:
+            dict: The result of the request.
+        """
+        params = {'take_profit': take_profit, 'stop_loss': stop_loss, 'trailing_stop': trailing_stop}
+        return self.session.set_trading_stop(
+            symbol=coin_ticker + self.collateral,
+            side=side,
+            **{name: value for name, value in params.items() if value is not None}
+        )
 
     def get_order_book(self, coin_ticker: str) -> dict:
         """
@@ -164,22 +205,29 @@ class BybitBase():
         """
         Retrieves the latest buy and sell orders for a given coin pair.
 
+        The top of book kept by the depth stream is used when the symbol is subscribed and in sync,
+        otherwise the order book is fetched over REST, once for all the procedures reading it meanwhile.
+
         Args:
             coin_ticker (str): The ticker symbol for the coin pair to retrieve the latest buy and sell orders for.
 
         Returns:
             A tuple containing the latest buy order and the latest sell order for the specified coin pair.
         """
-        latest_buy_order = None
-        latest_sell_order = None
-        orders = self.get_order_book(coin_ticker)['result']
-        for order in orders:
-            if latest_buy_order is None and order['side'] == 'Buy':
-                latest_buy_order = order
-            if latest_sell_order is None and order['side'] == 'Sell':
-                latest_sell_order = order
-            if latest_buy_order is not None and latest_sell_order is not None:
-                return latest_buy_order, latest_sell_order
+        return self.market_data.top_of_book(coin_ticker + self.collateral)
+
+    @staticmethod
+    def get_top_of_book(orders: list) -> tuple:
+        """
+        Finds the best buy and sell entries of a REST order book.
+
+        Args:
+            orders (list): The 'result' list of an order book response.
+
+        Returns:
+            A tuple containing the latest buy order and the latest sell order.
+        """
+        return top_of_book(orders)
 
     def get_order_by_link_id(self, coin_ticker: str, order_link_id: str) -> dict:
         """Query an active order by order link ID.
@@ -213,6 +261,49 @@ class BybitBase():
         )
 
 
+    def get_order_state(self, coin_ticker: str, order_id: str) -> dict:
+        """Get the current state of an order, preferring the private stream cache.
+
+        The order is queried over REST when the cache does not know it.
+
+        Args:
+            coin_ticker (str): The ticker symbol of the coin.
+            order_id (str): The unique identifier of the order.
+
+        Returns:
+            dict: The order details, shaped like the query_active_order response.
+        """
+        order = self.order_tracker.get(order_id)
+        if order is not None:
+            return {'ret_code': 0, 'ret_msg': 'OK', 'result': order}
+        response = self.get_order_by_id(coin_ticker, order_id)
+        if response['ret_code'] == 0:
+            self.order_tracker.record(response['result'])
+        return response
+
+
+    def wait_for_order(self, coin_ticker: str, order_id: str, status: str = None, timeout: float = None,
+                       token=None) -> dict:
+        """Wait for the private stream to report an order in a new status.
+
+        The order is queried over REST when nothing is pushed before the timeout.
+
+        Args:
+            coin_ticker (str): The ticker symbol of the coin.
+            order_id (str): The unique identifier of the order.
+            status (str): Last known status of the order; None waits for any status.
+            timeout (float): Maximum number of seconds to wait for the stream.
+            token (CancellationToken): Stops waiting as soon as the token is cancelled.
+
+        Returns:
+            dict: The order details, shaped like the query_active_order response.
+        """
+        order = self.order_tracker.wait(order_id, status, timeout, token)
+        if order is not None:
+            return {'ret_code': 0, 'ret_msg': 'OK', 'result': order}
+        return self.get_order_by_id(coin_ticker, order_id)
+
+
     def cancel_limit_order(self, coin_ticker: str, order_id: str) -> dict:
         """Cancel an active limit order.
 
@@ -228,9 +319,49 @@ class BybitBase():
             order_id=order_id
         )
 
+    def amend_limit_order(self, coin_ticker: str, order_id: str, price: float = None, qty: float = None) -> dict:
+        """Amend the price and/or quantity of an active limit order in place.
+
+        The order keeps its order id, so a single request moves it without leaving the book.
+        A PostOnly order amended to a price that would cross is cancelled by the exchange.
+
+        Args:
+            coin_ticker (str): The ticker symbol of the coin.
+            order_id (str): The unique identifier of the order.
+            price (float): The new limit price, unchanged if omitted.
+            qty (float): The new quantity, unchanged if omitted.
+
+        Returns:
+            dict: The result of the amendment request.
+        """
+        params = {'symbol': coin_ticker + self.collateral, 'order_id': order_id}
+        if price is not None:
+            params['p_r_price'] = price
+        if qty is not None:
+            params['p_r_qty'] = qty
+        return self.session.replace_active_order(**params)
+
+    def cancel_all_orders(self, coin_ticker: str) -> list:
+        """Cancel every active order of a coin.
+
+        While the order tracker is live, no request is sent if it knows no active order.
+        Otherwise a single cancel-all request is sent.
+
+        Args:
+            coin_ticker (str): The ticker symbol of the coin.
+
+        Returns:
+            list: The responses of the cancellation requests.
+        """
+        symbol = coin_ticker + self.collateral
+        open_orders = self.order_tracker.open_orders(symbol)
+        if open_orders is not None and not open_orders:
+            return []
+        return [self.session.cancel_all_active_orders(symbol=symbol)]
+
 
     def get_symbol_info(self, coin_ticker: str) -> dict:
-        """Get the details of a symbol.
+        """Get the details of a symbol from the instrument registry.
 
         Args:
             coin_ticker (str): The ticker symbol of the coin.
@@ -238,11 +369,11 @@ class BybitBase():
         Returns:
             dict: The details of the symbol.
         """
-        for result in self.session.query_symbol()['result']:
-            if result['name'] == coin_ticker + self.collateral:
-                return result
-        print('[!] Error while returning data from symbol', coin_ticker + self.collateral)
-        return {}
+        symbol_info = self.instruments.get(coin_ticker + self.collateral)
+        if symbol_info is None:
+            self.hmsg.err('Error while returning data from symbol %s', coin_ticker + self.collateral)
+            return {}
+        return symbol_info
 
 
     def get_qty_step(self, coin_ticker: str) -> float:
@@ -254,5 +385,15 @@ class BybitBase():
         Returns:
             float: The minimum quantity step for the coin.
         """
-        symbol_info = self.get_symbol_info(coin_ticker)
-        return symbol_info.get('lot_size_filter', {}).get('qty_step', 0.0)
+        return self.instruments.qty_step(coin_ticker + self.collateral)
+
+    def get_tick_size(self, coin_ticker: str) -> float:
+        """Get the price tick size for a coin.
+
+        Args:
+            coin_ticker (str): The ticker symbol of the coin.
+
+        Returns:
+            float: The tick size of the coin.
+        """
+        return self.instruments.tick_size(coin_ticker + self.collateral)
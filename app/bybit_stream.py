@@ -0,0 +1,266 @@
+"""
+WebSocket stream clients for Bybit public and private topics.
+
+A stream keeps a single connection open, subscribes to topics and routes every
+incoming message to the handler registered for its topic. ReplayStream exposes
+the same interface but feeds recorded messages instead of a live connection,
+so stream consumers can be exercised offline.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+
+import websocket
+
+from config.main_config import MainConfig
+from message_handler import log
+
+
+class BybitStream():
+
+    PUBLIC_URL = 'wss://stream.bybit.com/realtime_public'
+    PRIVATE_URL = 'wss://stream.bybit.com/realtime_private'
+
+    # Seconds between keep-alive pings and between reconnection attempts
+    PING_INTERVAL = 20
+    RECONNECT_DELAY = 1
+
+    _private = None
+
+    def __init__(self, url: str = PUBLIC_URL, api_key: str = None, api_secret: str = None):
+        """
+        Initializes the stream. The connection is only opened on the first subscription.
+
+        Args:
+            url (str): WebSocket endpoint.
+            api_key (str): API key, required for private topics only.
+            api_secret (str): API secret, required for private topics only.
+        """
+        self.url = url
+        self._api_key = api_key
+        self._api_secret = api_secret
+        self._handlers = dict()
+        self._disconnect_handlers = []
+        self._lock = threading.Lock()
+        self._ws = None
+        self._thread = None
+        self._running = False
+        self._connected = threading.Event()
+
+    @classmethod
+    def getprivate(cls) -> 'BybitStream':
+        """
+        Returns the authenticated stream shared by every consumer of private topics.
+        """
+        if cls._private is None:
+            user_data = MainConfig.getinstance().get_user_data()
+            cls._private = cls(cls.PRIVATE_URL, user_data['api_key'], user_data['api_secret'])
+        return cls._private
+
+    def subscribe(self, topic: str, handler) -> None:
+        """
+        Subscribes to a topic, routing its messages to the given handler.
+
+        Args:
+            topic (str): Topic name, ex: "orderBookL2_25.ETHUSDT" or "order".
+            handler (callable): Called with every decoded message of the topic.
+        """
+        with self._lock:
+            self._handlers[topic] = handler
+        self._start()
+        if self._connected.is_set():
+            self._send({'op': 'subscribe', 'args': [topic]})
+
+    def unsubscribe(self, topic: str) -> None:
+        """
+        Stops receiving messages for a topic.
+
+        Args:
+            topic (str): Topic name.
+        """
+        with self._lock:
+            self._handlers.pop(topic, None)
+        if self._connected.is_set():
+            self._send({'op': 'unsubscribe', 'args': [topic]})
+
+    def resubscribe(self, topic: str) -> None:
+        """
+        Subscribes to a topic again so the exchange sends a fresh snapshot.
+
+        Args:
+            topic (str): Topic name.
+        """
+        if self._connected.is_set():
+            self._send({'op': 'unsubscribe', 'args': [topic]})
+            self._send({'op': 'subscribe', 'args': [topic]})
+
+    def add_disconnect_handler(self, handler) -> None:
+        """
+        Registers a callable to be invoked whenever the connection drops.
+
+        Args:
+            handler (callable): Called without arguments.
+        """
+        self._disconnect_handlers.append(handler)
+
+    def is_connected(self) -> bool:
+        """
+        Returns True while the connection is open.
+        """
+        return self._connected.is_set()
+
+    def close(self) -> None:
+        """
+        Closes the connection and stops reconnecting.
+        """
+        self._running = False
+        if self._ws is not None:
+            self._ws.close()
+
+    def _start(self) -> None:
+        # Starts the connection thread once
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        # Keeps the connection alive, reconnecting whenever it drops
+        while self._running:
+            self._ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_close=self._on_close,
+                on_error=self._on_error
+            )
+            self._ws.run_forever(ping_interval=self.PING_INTERVAL)
+            self._on_close(self._ws)
+            if self._running:
+                time.sleep(self.RECONNECT_DELAY)
+
+    def _send(self, payload: dict) -> None:
+        try:
+            self._ws.send(json.dumps(payload))
+        except Exception:
+            log(logging.ERROR, 'Failed to send stream message: %s', payload.get('op'))
+
+    def _auth_args(self) -> list:
+        # Signature for the private stream: HMAC-SHA256 of "GET/realtime" + expires
+        expires = int((time.time() + 10) * 1000)
+        signature = hmac.new(
+            self._api_secret.encode('utf-8'),
+            f'GET/realtime{expires}'.encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+        return [self._api_key, expires, signature]
+
+    def _on_open(self, ws) -> None:
+        self._connected.set()
+        if self._api_key and self._api_secret:
+            self._send({'op': 'auth', 'args': self._auth_args()})
+        with self._lock:
+            topics = list(self._handlers.keys())
+        if topics:
+            self._send({'op': 'subscribe', 'args': topics})
+
+    def _on_message(self, ws, raw: str) -> None:
+        message = json.loads(raw)
+        topic = message.get('topic')
+        if topic is None:
+            # Subscription acknowledgements and pongs
+            if message.get('success') is False:
+                log(logging.ERROR, 'Stream request failed: %s', message.get('ret_msg'))
+            return
+        handler = self._handlers.get(topic)
+        if handler is not None:
+            handler(message)
+
+    def _on_error(self, ws, error) -> None:
+        log(logging.ERROR, 'Stream error: %s', error)
+
+    def _on_close(self, ws, *args) -> None:
+        if not self._connected.is_set():
+            return
+        self._connected.clear()
+        for handler in self._disconnect_handlers:
+            handler()
+
+
+class ReplayStream():
+    """
+    Offline stand-in for BybitStream that delivers recorded messages synchronously.
+    """
+
+    def __init__(self, messages=()):
+        """
+        Args:
+            messages (iterable): Recorded messages, as decoded dictionaries.
+        """
+        self.messages = list(messages)
+        self.resync_requests = []
+        self._handlers = dict()
+        self._disconnect_handlers = []
+
+    @staticmethod
+    def from_file(path: str) -> 'ReplayStream':
+        """
+        Builds a replay stream from a file holding one JSON message per line.
+
+        Args:
+            path (str): Path to the recording.
+        """
+        with open(path, 'r') as file:
+            return ReplayStream(json.loads(line) for line in file if line.strip())
+
+    def subscribe(self, topic: str, handler) -> None:
+        self._handlers[topic] = handler
+
+    def unsubscribe(self, topic: str) -> None:
+        self._handlers.pop(topic, None)
+
+    def resubscribe(self, topic: str) -> None:
+        # A live stream would answer with a snapshot; the recording is expected to contain it
+        self.resync_requests.append(topic)
+
+    def add_disconnect_handler(self, handler) -> None:
+        self._disconnect_handlers.append(handler)
+
+    def is_connected(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        pass
+
+    def push(self, message: dict) -> None:
+        """
+        Delivers a single message to the handler of its topic.
+
+        Args:
+            message (dict): Decoded stream message.
+        """
+        handler = self._handlers.get(message.get('topic'))
+        if handler is not None:
+            handler(message)
+
+    def disconnect(self) -> None:
+        """
+        Simulates a dropped connection.
+        """
+        for handler in self._disconnect_handlers:
+            handler()
+
+    def replay(self, messages=None) -> None:
+        """
+        Delivers every recorded message, in order.
+
+        Args:
+            messages (iterable): Messages to deliver instead of the recorded ones.
+        """
+        for message in (self.messages if messages is None else messages):
+            self.push(message)
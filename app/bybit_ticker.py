@@ -1,9 +1,12 @@
 import math
 import threading
-from time import sleep
 
 from bybit_base import BybitBase
+from cancellation import CancellationSource
 from config.main_config import MainConfig
+from execution_policy import CROSS, REPRICE, ChaseState, create_policy
+from metrics import MetricsRegistry
+from trade_journal import TradeJournal
 from utils import handle_exchange_response, round_down
 
 
@@ -14,19 +17,31 @@ class BybitTicker(BybitBase):
     LIMIT_ORDER_FILLED = 0
     RETRY_LIMIT_ORDER = 1
 
+    # Seconds to wait for the private stream to report a newly placed order
+    ORDER_ACK_TIMEOUT = 0.25
+
+    # Risk management modes: stops watched by the bot, or registered on the exchange after every entry
+    RISK_MANAGEMENT = ('TSL', 'SLTP', 'EXCHANGE_TSL', 'EXCHANGE_SLTP')
+    EXCHANGE_RISK_MANAGEMENT = ('EXCHANGE_TSL', 'EXCHANGE_SLTP')
+
     def __init__(self, coin_ticker):
         super(BybitTicker, self).__init__()
 
         self.coin_ticker = coin_ticker
 
         # Get the message handler from the main config singleton
-        self.hmsg = MainConfig.getinstance().message_handler
+        self.hmsg = MainConfig.getinstance().message_handler.bind(ticker=coin_ticker)
+
+        # Cancellation tokens: a new procedure supersedes the one currently running
+        self.cancellation = CancellationSource()
 
-        # Unique thread identifier
-        self.thread_ident = 0
+        ticker_config = MainConfig.getinstance().get_ticker_data(coin_ticker)
 
-        # Risk management type
-        self.risk_management = 'TSL'  # SLTP
+        # Risk management type, one of RISK_MANAGEMENT
+        self.risk_management = ticker_config.get('risk_management', 'TSL')
+        if self.risk_management not in self.RISK_MANAGEMENT:
+            raise ValueError(f'Unknown risk management {self.risk_management!r} for {coin_ticker}, '
+                             f'expected one of {", ".join(self.RISK_MANAGEMENT)}')
 
         # Default values for take profit and stop loss multipliers
         self.long_tp_mul_val = 1.004
@@ -35,33 +50,53 @@ class BybitTicker(BybitBase):
         self.short_sl_mul_val = 1.00125
 
         # Default values for take profit and stop loss percentages for TSL
-        self.long_tsl_perc = 10
-        self.short_tsl_perc = 10
+        self.long_tsl_perc = ticker_config.get('long_tsl_perc', 10)
+        self.short_tsl_perc = ticker_config.get('short_tsl_perc', 10)
 
         # Default slippage percentage when trading at market
         self.trade_market_on_slippage_perc = 0.0375
 
-        # Statistics counters
-        # TODO: Create a class to manage statistics
-        #  this class should export trade data to a CSV file when trades are finished
+        # Decides when the order procedures wait, reprice or cross, as set for the ticker in the config file
+        self.execution_policy = create_policy(ticker_config.get('execution_policy'))
+
+        # Statistics counters of the current run; the trade journal keeps the full history
         self.sl_count = 0
         self.tp_count = 0
         self.reversal_count = 0
         self.market_count = 0
         self.limit_count = 0
+        MetricsRegistry.getinstance().add_collector(self.collect_metrics)
 
-        # Update the last known price of the coin
-        self.last_known_price = self.get_ticker_price()
-        self.hmsg.msg('Price for ' + self.coin_ticker + ': ' + self.last_known_price)
+        # The depth stream of the coin runs while procedures are subscribed to it on the market data hub
+        self.symbol = self.coin_ticker + self.collateral
 
-        # Adjust leverage on the exchange according to the config file
-        self.sync_leverage()
+        # Set by warm_up, which makes the REST calls needed before the first trade
+        self.last_known_price = None
+        self.qty_step = None
+        self.warmed_up = False
+        self._warm_up_lock = threading.Lock()
+
+    def warm_up(self):
+        """
+        Fetches the price and quantity step of the coin and adjusts its leverage on the exchange.
+        Runs once: concurrent calls wait for the first one, and a failed warm up is retried on the next call.
+        """
+        with self._warm_up_lock:
+            if self.warmed_up:
+                return
+            # Update the last known price of the coin
+            self.last_known_price = self.get_ticker_price()
+            self.hmsg.msg('Price for %s: %s', self.coin_ticker, self.last_known_price)
+
+            # Adjust leverage on the exchange according to the config file
+            self.sync_leverage()
+
+            # Calculate entry size for long and short trades
+            self.qty_step = self.get_qty_step(self.coin_ticker)
+            # self.long_entry_qty = self.calculate_entry_size('buy')
+            # self.short_entry_qty = self.calculate_entry_size('sell')
+            self.warmed_up = True
 
-        # Calculate entry size for long and short trades
-        self.qty_step = self.get_qty_step(self.coin_ticker)
-        # self.long_entry_qty = self.calculate_entry_size('buy')
-        # self.short_entry_qty = self.calculate_entry_size('sell')
-        
 
     def get_ticker_price(self):
         """
@@ -73,6 +108,17 @@ class BybitTicker(BybitBase):
         return ask_price
 
 
+    def get_best_ask_price(self):
+        """
+        Get the best ask price from the depth stream, or from the ticker endpoint
+        when no procedure keeps the stream of the coin running.
+        """
+        best = self.market_data.peek(self.symbol)
+        if best is not None:
+            return best[1]['price']
+        return self.get_ticker_price()
+
+
     def get_ticker_info(self):
         """
         Get the latest information for the current ticker.
@@ -85,11 +131,7 @@ class BybitTicker(BybitBase):
         """
         Reduce position on the current ticker.
         """
-        return self.reduce_position(
-            symbol=self.coin_ticker,
-            side=side,
-            qty=qty+1
-        )
+        return self.reduce_position(self.coin_ticker, side, qty+1)
 
 
     def calculate_entry_size(self, side):
@@ -105,8 +147,8 @@ class BybitTicker(BybitBase):
             leverage = ticker_config['short_leverage']
         perc = ticker_config['wallet_perc']
 
-        # Using last known price for optimization purposes
-        last_known_price = self.get_ticker_price()
+        # Price and balance come from the local caches, avoiding REST calls in the common case
+        last_known_price = self.get_best_ask_price()
         available_balance = self.get_wallet_balance() * 0.6
         non_rounded_entry_size = (
             float(available_balance) / float(last_known_price)
@@ -115,7 +157,7 @@ class BybitTicker(BybitBase):
         )
         qty_step = self.get_qty_step(self.coin_ticker)
         rounded_entry_size = round(round_down(non_rounded_entry_size, qty_step), 3)
-        print('Estimated entry size:', rounded_entry_size)
+        self.hmsg.msg('Estimated entry size: %s', rounded_entry_size)
         return rounded_entry_size
 
     def get_position(self):
@@ -136,11 +178,24 @@ class BybitTicker(BybitBase):
 
     def fetch_ticker_positions(self):
         """
-        Retrieves all positions for coin_ticker from the exchange
+        Retrieves all positions for coin_ticker, from the account state cache when fresh
+        or from the exchange otherwise
+        Returns the long and short positions if they exist, otherwise returns False
+        """
+        cached_positions = self.account_state.get_positions(self.coin_ticker + self.collateral)
+        if cached_positions is not None:
+            return cached_positions
+        return self.fetch_exchange_positions()
+
+    def fetch_exchange_positions(self):
+        """
+        Retrieves all positions for coin_ticker from the exchange, bypassing the account state cache,
+        and stores them in the cache
         Returns the long and short positions if they exist, otherwise returns False
         """
         json_positions = self.get_position()
         if json_positions['ret_code'] == 0:
+            self.account_state.update_positions(json_positions['result'])
             # All ok, start digging the data
             long_position = None
             short_position = None
@@ -191,14 +246,53 @@ class BybitTicker(BybitBase):
     def has_price_increased(self, curr_price, org_price, slippage_perc):
         return curr_price - org_price > slippage_perc / 100 * org_price
 
+    def new_chase_state(self, kind, side):
+        """
+        Returns the state the execution policy reads while an order of the given kind ("entry" or "stop")
+        and side is chased. A stop-limit close tolerates the trailing stop percentage on top of the slippage.
+        """
+        slippage_perc = self.trade_market_on_slippage_perc
+        if kind == 'stop':
+            slippage_perc += self.long_tsl_perc if side.lower() == 'sell' else self.short_tsl_perc
+        return ChaseState(kind, side, self.get_tick_size(self.coin_ticker), slippage_perc)
+
+    def observe_book(self, chase_state):
+        """
+        Records the top of the book in the chase state and returns the best buy and sell orders
+        """
+        ob_latest_buy_order, ob_latest_sell_order = self.get_latest_buy_and_sell_orders(self.coin_ticker)
+        chase_state.observe(ob_latest_buy_order['price'], ob_latest_sell_order['price'],
+                            ob_latest_buy_order.get('size'), ob_latest_sell_order.get('size'))
+        return ob_latest_buy_order, ob_latest_sell_order
+
+    def start_procedure(self):
+        """
+        Cancels the procedure currently running for this ticker and returns the token of a new one
+        """
+        token = self.cancellation.renew()
+        # Threads blocked on the order tracker must wake up as soon as the token is cancelled
+        token.add_callback(self.order_tracker.interrupt)
+        return token
+
+    def cancel_procedure(self):
+        """
+        Cancels the procedure currently running for this ticker, if any
+        """
+        self.cancellation.current.cancel()
+
     def execute_limit_order_procedure(self, side):
         """
         Places a limit order, tightens it if necessary, and waits for it to fill
+        Any procedure still running for this ticker is superseded
         """
-        side = self.place_limit_order_with_retry(side)
+        token = self.start_procedure()
+        side = self.place_limit_order_with_retry(side, token)
         if not side:
-            self.logger.debug('limit order not placed')
+            self.hmsg.debug('limit order not placed')
             return
+
+        # Exchange risk management: the exchange watches the position from now on
+        self.register_exchange_stop(side)
         """
         # Wait for limit order to fill
         if not self.wait_for_limit_order():
@@ -211,25 +305,81 @@ class BybitTicker(BybitBase):
             return
         """
         # Monitor current ticker price for stop loss placement
-        #self.check_for_stop_limit_tsl(side)
+        #self.check_for_stop_limit_tsl(side, token)
+
+    def register_exchange_stop(self, side):
+        """
+        Registers the stop of the position opened on the given side on the exchange, for the EXCHANGE_TSL and
+        EXCHANGE_SLTP risk management modes. Called after every entry, so a re-entry moves the stop to the new
+        entry price; the stop of a closed position goes away with it, so a reversal only registers the new one.
+        Returns the exchange response, or None if no stop was registered
+        """
+        if self.risk_management not in self.EXCHANGE_RISK_MANAGEMENT:
+            return None
+        try:
+            # Read over REST: the position push of the fill may not have reached the account state yet
+            positions = self.fetch_exchange_positions()
+            if not positions:
+                self.hmsg.err('Failed to retrieve the position to protect, side: %s', side)
+                return None
+            position = positions[0] if side.lower() == 'buy' else positions[1]
+            if position is None or float(position['size']) <= 0:
+                self.hmsg.err('No open position found after the entry filled, no exchange stop registered, side: %s',
+                              side)
+                return None
+            params = self.exchange_stop_params(position)
+            ret = self.set_trading_stop(self.coin_ticker, position['side'], **params)
+        except Exception as ex:
+            self.hmsg.err('Failed to register the stop on the exchange: %s', ex)
+            return None
+        if handle_exchange_response(ret, 'Failed to register the stop on the exchange'):
+            self.hmsg.msg('Exchange stop registered: %s', params)
+        return ret
 
-    def place_limit_order_with_retry(self, side: str) -> str:
+    def exchange_stop_params(self, position_data):
+        """
+        Returns the stops of a position for the exchange, from its entry price: the trailing distance of
+        long_tsl_perc / short_tsl_perc for EXCHANGE_TSL, the stop loss and take profit multipliers for EXCHANGE_SLTP
+        """
+        tick_size = self.get_tick_size(self.coin_ticker)
+        entry_price = float(position_data['entry_price'])
+        is_long = position_data['side'].lower() == 'buy'
+
+        def to_tick(price):
+            return round(round(price / tick_size) * tick_size, 8)
+
+        if self.risk_management == 'EXCHANGE_TSL':
+            tsl_perc = self.long_tsl_perc if is_long else self.short_tsl_perc
+            return {'trailing_stop': max(tick_size, to_tick(entry_price * tsl_perc / 100))}
+        if is_long:
+            return {'stop_loss': to_tick(entry_price * self.long_sl_mul_val),
+                    'take_profit': to_tick(entry_price * self.long_tp_mul_val)}
+        return {'stop_loss': to_tick(entry_price * self.short_sl_mul_val),
+                'take_profit': to_tick(entry_price * self.short_tp_mul_val)}
+
+    def place_limit_order_with_retry(self, side: str, token=None) -> str:
         """
         Attempts to place limit order according to the signal received from tradingView.
         Will tighten the limit order every time the market moves away from it
         At x attempts or high price slippage, a market order will be placed
         :param side: string representing the side of the order ("Buy" or "Sell")
+        :param token: cancellation token of the procedure, the current one by default
         :return: a string indicating the side of the order ("Buy" or "Sell") if the order was filled, or an empty string otherwise
         """
+        with self.market_data.subscribe(self.symbol):
+            return self.__place_limit_order_with_retry(side, token)
 
+    def __place_limit_order_with_retry(self, side: str, token) -> str:
         # Initialize variables
         count_retries = 0
+        token = token or self.cancellation.current
+        chase_state = self.new_chase_state('entry', side)
 
         # Attempt to place and monitor a new limit order while not receiving a new signal
-        while self.thread_ident == threading.get_ident():
+        while not token.cancelled:
 
             # Create limit order
-            main_limit_order_data = self.__create_limit_order(side, self.calculate_entry_size(side))
+            main_limit_order_data = self.__create_limit_order(side, self.calculate_entry_size(side), token, chase_state)
             if main_limit_order_data is None:
                 return ''
             
@@ -239,58 +389,65 @@ class BybitTicker(BybitBase):
                 return side
 
             # Monitor and update previously created limit order
-            ret_code = self.tighten_limit_order(main_limit_order_data, count_retries)
+            ret_code = self.tighten_limit_order(main_limit_order_data, count_retries, token, chase_state)
             if ret_code == BybitTicker.LIMIT_ORDER_FILLED:
                 return side
             elif ret_code == BybitTicker.ABORT_LIMIT_ORDER:
                 return ''
             else:
-                count_retries += 1
+                # Attempts include the amendments made while tightening
+                count_retries = chase_state.retries
                 continue
 
         # The while loop has ended, indicating that a new signal has been received
         return ''
 
-    def __create_limit_order(self, side: str, qty: float):
+    def __create_limit_order(self, side: str, qty: float, token, chase_state):
         """
-        Creates a Limit order using params: side, qty
+        Creates a Limit order using params: side, qty, at the price given by the execution policy
         Returns:
             order_data if successful, otherwise None
         """
 
-        while self.thread_ident == threading.get_ident():
+        while not token.cancelled:
 
             # Get the latest buy and sell orders from the order book
-            ob_latest_buy_order, ob_latest_sell_order = self.get_latest_buy_and_sell_orders(self.coin_ticker)
+            ob_latest_buy_order, ob_latest_sell_order = self.observe_book(chase_state)
 
             # Use the latest sell order to measure future entry size
             self.last_known_price = float(ob_latest_sell_order['price'])
 
+            price = round(self.execution_policy.limit_price(chase_state), 4)
             if side.lower() == 'buy':
-                main_limit_order_data = self.place_limit_order_po(self.coin_ticker, 'Buy', qty, round((float(ob_latest_buy_order['price'])), 4))
+                main_limit_order_data = self.place_limit_order_po(self.coin_ticker, 'Buy', qty, price)
             elif side.lower() == 'sell':
-                main_limit_order_data = self.place_limit_order_po(self.coin_ticker, 'Sell', qty, round((float(ob_latest_sell_order['price'])), 4))
+                main_limit_order_data = self.place_limit_order_po(self.coin_ticker, 'Sell', qty, price)
             else:
                 return None
+            chase_state.observe_order(price)
 
             # It has been found that, while using PostOnly, limit orders might be cancelled AFTER being created
             # Querying the most updated order status allows the verification of orders being cancelled by PostOnly
             # If that is the case, this routine will loop until the order enters to the order book
             # Otherwise, order data will be returned
-            main_limit_order_data = self.get_order_by_id(self.coin_ticker, main_limit_order_data['result']['order_id'])
+            main_limit_order_data = self.wait_for_order(
+                self.coin_ticker, main_limit_order_data['result']['order_id'], timeout=self.ORDER_ACK_TIMEOUT,
+                token=token)
             if self.is_order_created(main_limit_order_data) or main_limit_order_data['result']['order_status'] == 'Filled':
-                self.hmsg.msg('Limit order created')
+                self.hmsg.msg('Limit order created', order_id=main_limit_order_data['result']['order_id'])
                 return main_limit_order_data
 
-        # When the while loop exits, a new thread has started so no order was created
-        self.hmsg.debug('I am not creating a limit order, new thread in')
+        # When the while loop exits, a new signal has been received so no order was created
+        self.hmsg.debug('I am not creating a limit order, new signal in')
         return None
 
 
 
-    def tighten_limit_order(self, main_limit_order_data, count_retries) -> int:
+    def tighten_limit_order(self, main_limit_order_data, count_retries, token=None, chase_state=None) -> int:
         """
         # Takes the first created limit order data and tightens it according to market conditions.
+        # The execution policy decides when to wait, reprice or cross, from the chase state.
+        # The order is cancelled if the procedure is superseded by a new signal.
         # Returns:
         # -1 : Abort limit order placement
         #  0 : Limit order filled
@@ -298,102 +455,148 @@ class BybitTicker(BybitBase):
         """
 
         self.hmsg.msg('Monitoring limit order slippage')
-        while self.thread_ident == threading.get_ident():
-            
-            # Update order data
-            main_limit_order_data = self.get_order_by_id(self.coin_ticker, main_limit_order_data['result']['order_id'])
-            handle_exchange_response(main_limit_order_data, 'Failed to retrieve Limit order data')
+        token = token or self.cancellation.current
+        if chase_state is None:
+            chase_state = self.new_chase_state('entry', main_limit_order_data['result']['side'])
+            chase_state.order_price = float(main_limit_order_data['result']['price'])
+        chase_state.retries = count_retries
+        try:
+            return self.__tighten_limit_order(main_limit_order_data, count_retries, token, chase_state)
+        except Exception:
+            # Unexpected failure: do not leave the order resting
+            self.__cancel_owned_order(main_limit_order_data['result']['order_id'])
+            raise
 
-            # Check if the main limit order has been filled
-            if main_limit_order_data['result']['order_status'] == 'Filled':
-                self.hmsg.msg('Limit order filled!')
-                self.limit_count += 1
-                return BybitTicker.LIMIT_ORDER_FILLED
+    def __cancel_owned_order(self, order_id):
+        """
+        Cancels an order left resting by a superseded or failed procedure
+        """
+        try:
+            ret = self.cancel_limit_order(self.coin_ticker, order_id)
+            if ret['ret_code'] == 0:
+                self.hmsg.debug('Cancelled previous order as new signal has been received', order_id=order_id)
+        except Exception:
+            self.hmsg.debug('Nothing to cancel. Returning...')
 
-            # Latest buy and sell orders from the order book
-            ob_latest_buy_order, ob_latest_sell_order = self.get_latest_buy_and_sell_orders(self.coin_ticker)
-            
-            # Open Buy order by market on too many attempts or price slippage
-            if (count_retries > 3 \
-                or self.has_price_increased(
-                    curr_price=float(ob_latest_buy_order['price']),
-                    org_price=main_limit_order_data['result']['price'],
-                    slippage_perc=self.trade_market_on_slippage_perc
-                    )) \
-                and main_limit_order_data['result']['side'].lower() == 'buy':
-                try:
-                    # Cancel Limit order as the position will be opened by market instead
-                    ret = self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
-                    handle_exchange_response(ret,'CRITICAL: Failed to cancel limit order v2')
-                    if ret['ret_code'] == 0:
-                        self.hmsg.msg('Buy limit order cancelled. Buying by market')
-
-                    # Place Limit Buy order
-                    main_limit_order_data = self.place_order(self.coin_ticker, 'Buy', main_limit_order_data['result']['qty'])
-                    self.market_count += 1
-                    return BybitTicker.LIMIT_ORDER_FILLED
-                except Exception:
-                    self.hmsg.err('Exception ocurred while opening by market. Limit order might got filled meanwhile. Returning...')
+    def __amend_limit_order(self, order_id, chase_state):
+        """
+        Moves a resting order to the price given by the execution policy, keeping its place in the book
+        Returns True if amended, False if the exchange rejected the amendment
+        """
+        price = round(self.execution_policy.limit_price(chase_state), 4)
+        try:
+            ret = self.amend_limit_order(self.coin_ticker, order_id, price)
+        except Exception:
+            ret = None
+        if ret is None or ret['ret_code'] != 0:
+            self.hmsg.debug('Amendment rejected. Replacing order...', order_id=order_id)
+            return False
+        chase_state.observe_order(price)
+        return True
+
+    def __tighten_limit_order(self, main_limit_order_data, count_retries, token, chase_state) -> int:
+        with self.order_metrics.chase(self.coin_ticker, 'entry') as chase:
+            while not token.cancelled:
+                chase.iteration_started()
+
+                # Update order data
+                main_limit_order_data = self.get_order_state(self.coin_ticker, main_limit_order_data['result']['order_id'])
+                handle_exchange_response(main_limit_order_data, 'Failed to retrieve Limit order data')
+
+                # Check if the main limit order has been filled
+                if main_limit_order_data['result']['order_status'] == 'Filled':
+                    self.hmsg.msg('Limit order filled!', order_id=main_limit_order_data['result']['order_id'])
                     self.limit_count += 1
-                finally:
                     return BybitTicker.LIMIT_ORDER_FILLED
+
+                # An amended PostOnly order is cancelled if it would have crossed: place a new one
+                if main_limit_order_data['result']['order_status'] == 'Cancelled':
+                    self.hmsg.debug('Limit order cancelled by the exchange', order_id=main_limit_order_data['result']['order_id'])
+                    return BybitTicker.RETRY_LIMIT_ORDER
+
+                # Latest buy and sell orders from the order book
+                self.observe_book(chase_state)
+                decision = self.execution_policy.decide(chase_state)
+                cross_to_market = decision == CROSS
+
+                # Open Buy order by market on too many attempts or price slippage
+                if cross_to_market and main_limit_order_data['result']['side'].lower() == 'buy':
+                    chase.cross()
+                    try:
+                        # Cancel Limit order as the position will be opened by market instead
+                        ret = self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
+                        handle_exchange_response(ret,'CRITICAL: Failed to cancel limit order v2')
+                        if ret['ret_code'] == 0:
+                            self.hmsg.msg('Buy limit order cancelled. Buying by market')
+
+                        # Place Limit Buy order
+                        main_limit_order_data = self.place_order(self.coin_ticker, 'Buy', main_limit_order_data['result']['qty'])
+                        self.market_count += 1
+                        return BybitTicker.LIMIT_ORDER_FILLED
+                    except Exception:
+                        self.hmsg.err('Exception ocurred while opening by market. Limit order might got filled meanwhile. Returning...')
+                        self.limit_count += 1
+                    finally:
+                        return BybitTicker.LIMIT_ORDER_FILLED
             
-            # Open Sell order by market on too many attempts or price slippage
-            if (count_retries > 3 \
-                or self.has_price_decreased(
-                    curr_price=float(ob_latest_sell_order['price']),
-                    org_price=main_limit_order_data['result']['price'],
-                    slippage_perc=self.trade_market_on_slippage_perc
-                    )) \
-                and main_limit_order_data['result']['side'].lower() == 'sell':
-                try:
-                    # Cancel Limit order as the position will be opened by market instead
-                    ret = self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
-                    handle_exchange_response(ret,'CRITICAL: Failed to cancel limit order v2')
-                    if ret['ret_code'] == 0:
-                        self.hmsg.msg('Sell limit order cancelled. Selling by market')
+                # Open Sell order by market on too many attempts or price slippage
+                if cross_to_market and main_limit_order_data['result']['side'].lower() == 'sell':
+                    chase.cross()
+                    try:
+                        # Cancel Limit order as the position will be opened by market instead
+                        ret = self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
+                        handle_exchange_response(ret,'CRITICAL: Failed to cancel limit order v2')
+                        if ret['ret_code'] == 0:
+                            self.hmsg.msg('Sell limit order cancelled. Selling by market')
                     
-                    # Place Limit Sell order
-                    main_limit_order_data = self.place_order(self.coin_ticker, 'Sell', main_limit_order_data['result']['qty'])
-                    self.market_count += 1
+                        # Place Limit Sell order
+                        main_limit_order_data = self.place_order(self.coin_ticker, 'Sell', main_limit_order_data['result']['qty'])
+                        self.market_count += 1
+                    except Exception:
+                        self.hmsg.err('Exception ocurred while opening by market. Limit order might got filled meanwhile. Returning...')
+                        self.limit_count += 1
+                    finally:
+                        return BybitTicker.LIMIT_ORDER_FILLED
+
+                # Tightens main limit order according to market move            
+                try:
+                    if decision == REPRICE:
+                        self.hmsg.debug('Tightening: %s', count_retries, order_id=main_limit_order_data['result']['order_id'])
+                        chase.reprice()
+                        self.journal.reprice(self.coin_ticker, main_limit_order_data['result']['order_id'])
+                        count_retries += 1
+                        chase_state.retries = count_retries
+                        # Amend the order in place, or cancel it and place a new one if the amendment is rejected
+                        if not self.__amend_limit_order(main_limit_order_data['result']['order_id'], chase_state):
+                            self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
+                            return BybitTicker.RETRY_LIMIT_ORDER
                 except Exception:
-                    self.hmsg.err('Exception ocurred while opening by market. Limit order might got filled meanwhile. Returning...')
-                    self.limit_count += 1
-                finally:
+                    self.hmsg.err('Exception ocurred while tightening Limit order. Might got filled meanwhile. Returning...')
                     return BybitTicker.LIMIT_ORDER_FILLED
 
-            # Tightens main limit order according to market move            
-            order_price = float(main_limit_order_data['result']['price'])
-            try:
-                if main_limit_order_data['result']['side'].lower() == 'buy' \
-                    and (float(ob_latest_buy_order['price']) > order_price):
-                    self.hmsg.debug('Tightening: ' + str(count_retries))
-                    self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
-                    count_retries += 1
-                    return BybitTicker.RETRY_LIMIT_ORDER
-                if main_limit_order_data['result']['side'].lower() == 'sell' \
-                    and (float(ob_latest_sell_order['price']) < order_price):
-                    self.hmsg.debug('Tightening: ' + str(count_retries))
-                    self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
-                    count_retries += 1
-                    return BybitTicker.RETRY_LIMIT_ORDER
-            except Exception:
-                self.hmsg.err('Exception ocurred while tightening Limit order. Might got filled meanwhile. Returning...')
-                return BybitTicker.LIMIT_ORDER_FILLED
-            sleep(128/1000)
-        # while ends - Limit order monitoring
-        # self.hmsg.debug('I am no longer the thread ident and will revert the order placement')
-        try:
+                # Wait for the next poll, waking up as soon as the order status changes
+                chase.iteration_done()
+                self.order_tracker.wait(
+                    main_limit_order_data['result']['order_id'],
+                    main_limit_order_data['result']['order_status'],
+                    self.execution_policy.wait_interval(chase_state),
+                    token
+                )
+            # while ends - Limit order monitoring
             # Cancel Limit order as new signal trade has been received
-            #self.cancel_limit_order(self.coin_ticker, main_limit_order_data['result']['order_id'])
-            self.hmsg.debug('Cancelled previous order as new signal has been received SQN')
-        except Exception:
-            self.hmsg.debug('Nothing to cancel. Returning...')
-        finally:
+            self.__cancel_owned_order(main_limit_order_data['result']['order_id'])
             return BybitTicker.ABORT_LIMIT_ORDER
     # def ends
 
-    def check_for_stop_limit_tsl(self, side :str):
+    def check_for_stop_limit_tsl(self, side :str, token=None):
+        """
+        Watches the position with the client side trailing stop and closes it once the price moves back
+        Runs until the procedure is cancelled, and keeps the depth stream of the coin meanwhile
+        """
+        with self.market_data.subscribe(self.symbol):
+            return self.__check_for_stop_limit_tsl(side, token)
+
+    def __check_for_stop_limit_tsl(self, side :str, token=None):
         # Log that we're checking for stop-limit
         self.hmsg.msg('Checking for stop-limit...')
 
@@ -404,8 +607,9 @@ class BybitTicker(BybitBase):
         tsl_long_upper_price = 0.5
         tsl_short_lower_price = 99999.5
 
-        # Loop until thread is stopped
-        while self.thread_ident == threading.get_ident():
+        # Loop until a new signal is received
+        token = token or self.cancellation.current
+        while not token.cancelled:
 
             # Get latest buy and sell orders from order book
             latest_buy_order, latest_sell_order = self.get_latest_buy_and_sell_orders(self.coin_ticker)
@@ -426,7 +630,7 @@ class BybitTicker(BybitBase):
             # Check if position has been closed by thread or user
             if (side.lower() == 'buy' and long_size == 0) \
                 or side.lower() == 'sell' and short_size == 0:
-                self.hmsg.err(f'Position no longer open. Closed by thread or user... side: {side}')
+                self.hmsg.err('Position no longer open. Closed by thread or user... side: %s', side)
                 return False
 
             # Check if TSL has been triggered for long position
@@ -441,6 +645,7 @@ class BybitTicker(BybitBase):
                 self.hmsg.msg('Forcing stop limit order...')
                 # Increment stop-loss count
                 self.sl_count += 1
+                self.journal.close(self.coin_ticker, curr_long_position, TradeJournal.STOP_LOSS)
                 # Force stop-limit order
                 self.force_stop_limit_order(curr_long_position)
                 flag_sl_triggered = True
@@ -456,6 +661,7 @@ class BybitTicker(BybitBase):
                 self.hmsg.msg('Forcing stop limit order...')
                 # Increment stop-loss count
                 self.sl_count += 1
+                self.journal.close(self.coin_ticker, curr_short_position, TradeJournal.STOP_LOSS)
                 # Force stop-limit order
                 self.force_stop_limit_order(curr_short_position)
                 return None
@@ -464,8 +670,8 @@ class BybitTicker(BybitBase):
             if flag_sl_triggered:
                 return None
 
-            # Sleep for a short period of time before checking again
-            sleep(128 / 1000)
+            # Sleep for a short period of time before checking again, waking up on a new signal
+            token.wait(128 / 1000)
 
             # Increment check counter
             check_count += 1
@@ -479,6 +685,13 @@ class BybitTicker(BybitBase):
 
 
     def force_stop_limit_order(self, position_data):
+        """
+        Closes the position with a limit order chased until it fills, on the depth stream of the coin
+        """
+        with self.market_data.subscribe(self.symbol):
+            return self.__force_stop_limit_order(position_data)
+
+    def __force_stop_limit_order(self, position_data):
         
         # Beware that 'position_data' param already has the 'result' scope
         
@@ -491,15 +704,16 @@ class BybitTicker(BybitBase):
         # self.hmsg.debug('Locking stop loss')
         # self.STOP_LOCK = True
 
-        tsl_long_upper_price = 0.5
-        tsl_short_lower_price = 99999.5
+        # The trailing stop references of the close are the best prices seen by the chase state
+        chase_state = self.new_chase_state('stop', 'Sell' if position_data['side'].lower() == 'buy' else 'Buy')
 
         while True:
             sl_order_data = None
 
             while True:
                 # Latest buy and sell orders from the order book
-                ob_latest_buy_order, ob_latest_sell_order = self.get_latest_buy_and_sell_orders(self.coin_ticker)
+                self.observe_book(chase_state)
+                price = round(self.execution_policy.limit_price(chase_state), 4)
 
                 try:
                     if position_data['side'].lower() == 'buy' \
@@ -510,7 +724,7 @@ class BybitTicker(BybitBase):
                             self.coin_ticker,
                             'Sell',
                             position_data['size'],
-                            round(float(ob_latest_sell_order['price']), 4)
+                            price
                         )
                     if position_data['side'].lower() == 'sell' \
                         and position_data['size'] > 0:
@@ -520,125 +734,129 @@ class BybitTicker(BybitBase):
                             self.coin_ticker,
                             'Buy',
                             position_data['size'],
-                            round(float(ob_latest_buy_order['price']), 4)
+                            price
                         )
+                    chase_state.observe_order(price)
                 except Exception:
                     self.hmsg.err('Exception ocurred while replacing SL order. Might got filled meanwhile. Returning...')
                     self.limit_count += 1
                     # self.STOP_LOCK = False
                     return True
-                    
-                sl_order_data = self.get_order_by_id(self.coin_ticker, sl_order_data['result']['order_id'])
+                if not sl_order_data or not sl_order_data['result']:
+                    self.hmsg.err('Failed to place SL order. Might got filled meanwhile. Returning...')
+                    self.limit_count += 1
+                    return True
+
+                sl_order_data = self.wait_for_order(
+                    self.coin_ticker, sl_order_data['result']['order_id'], timeout=self.ORDER_ACK_TIMEOUT)
                 if sl_order_data['result']['order_status'] == 'Filled':
-                    self.hmsg.msg('Stop-limit filled immediately!')
+                    self.hmsg.msg('Stop-limit filled immediately!', order_id=sl_order_data['result']['order_id'])
                     self.limit_count += 1
                     # self.STOP_LOCK = False
                     return True
                 if self.is_order_created(sl_order_data):
-                    self.hmsg.msg('Stop-limit order created')
+                    self.hmsg.msg('Stop-limit order created', order_id=sl_order_data['result']['order_id'])
                     break
                 else:
-                    self.hmsg.msg(f'Failed to place Stop-limit order. Retrying ({count_retries})')
+                    self.hmsg.msg('Failed to place Stop-limit order. Retrying (%s)', count_retries)
                     #sleep(128 / 1000)
             # WHILE ENDS - Stop Limit order placement
                     
             self.hmsg.msg('Monitoring stop-limit order...')
-            while True:
-                
-                # Get latest orderbook data
-                ob_latest_buy_order, ob_latest_sell_order = self.get_latest_buy_and_sell_orders(self.coin_ticker)
+            with self.order_metrics.chase(self.coin_ticker, 'stop') as chase:
+                while True:
+                    chase.iteration_started()
 
-                if float(ob_latest_buy_order['price']) > tsl_long_upper_price:
-                    tsl_long_upper_price = float(ob_latest_buy_order['price'])
-                if float(ob_latest_sell_order['price']) < tsl_short_lower_price:
-                    tsl_short_lower_price = float(ob_latest_sell_order['price'])
+                    # Get latest orderbook data
+                    self.observe_book(chase_state)
 
-                # Update Stop-limit order data
-                sl_order_data = self.get_order_by_id(self.coin_ticker, sl_order_data['result']['order_id'])
-                handle_exchange_response(sl_order_data, 'Failed to retrieve SL limit order data')
+                    # Update Stop-limit order data
+                    sl_order_data = self.get_order_state(self.coin_ticker, sl_order_data['result']['order_id'])
+                    handle_exchange_response(sl_order_data, 'Failed to retrieve SL limit order data')
                 
-                # Check if the main limit order has been filled, if so, return
-                if sl_order_data['result']['order_status'] == 'Filled':
-                    self.hmsg.msg('Stop Limit order Filled, Terminating trade...')
-                    self.limit_count += 1
-                    # self.hmsg.debug('Retries: ' + str(count_retries))
-                    self.print_statistics()
-                    # self.hmsg.debug('Unlocking stop loss')
-                    # self.STOP_LOCK = False
-                    return True
-                
-                # If the attempt to close a trade by limit order fails, i.e., price slippage has occured,
-                #  close it by market order.
-                if (count_retries > 1 \
-                    or self.has_price_decreased(
-                        curr_price=float(ob_latest_buy_order['price']),
-                        org_price=tsl_long_upper_price,
-                        slippage_perc=(self.trade_market_on_slippage_perc + self.long_tsl_perc)
-                        )) \
-                    and position_data['side'].lower() == 'buy':
-                    try:
-                        ret = self.cancel_limit_order(self.coin_ticker, sl_order_data['result']['order_id'])
-                        handle_exchange_response(ret,'CRITICAL: Failed to close SL order')
-                        if ret['ret_code'] == 0:
-                            self.hmsg.msg('Stop Limit order cancelled. Closing by market')
-                        self.close_position_qty('Sell', position_data['size'])
-                        self.market_count += 1
-                    except Exception as ex:
-                        self.hmsg.err('Market sell: Exception ocurred while closing long by market. Limit order might got filled meanwhile. Returning...')
-                        self.hmsg.err(ex)
-                        self.limit_count += 1
-                    finally:
-                        return True
-                # Open Sell order by market on too many attempts or price slippage
-                if (count_retries > 1 \
-                    or self.has_price_increased(
-                        curr_price=float(ob_latest_sell_order['price']),
-                        org_price=tsl_short_lower_price,
-                        slippage_perc=(self.trade_market_on_slippage_perc + self.short_tsl_perc)
-                        )) \
-                    and position_data['side'].lower() == 'sell':
-                    try:
-                        # Cancel Limit order as the position will be opened by market instead
-                        ret = self.cancel_limit_order(self.coin_ticker, sl_order_data['result']['order_id'])
-                        handle_exchange_response(ret,'CRITICAL: Failed to cancel limit order v2')
-                        if ret['ret_code'] == 0:
-                            self.hmsg.msg('Stop Limit order cancelled. Closing by market')
-                        self.close_position_qty('Buy', position_data['size'])
-                        self.market_count += 1
-                    except Exception as ex:
-                        self.hmsg.err('Market buy: Exception ocurred while closing short position by market. Limit order might got filled meanwhile. Returning...')
-                        self.hmsg.err(ex)
+                    # Check if the main limit order has been filled, if so, return
+                    if sl_order_data['result']['order_status'] == 'Filled':
+                        self.hmsg.msg('Stop Limit order Filled, Terminating trade...', order_id=sl_order_data['result']['order_id'])
                         self.limit_count += 1
-                    finally:
+                        # self.hmsg.debug('Retries: ' + str(count_retries))
+                        self.print_statistics()
+                        # self.hmsg.debug('Unlocking stop loss')
+                        # self.STOP_LOCK = False
                         return True
+                
+                    # An amended PostOnly order is cancelled if it would have crossed: place a new one
+                    if sl_order_data['result']['order_status'] == 'Cancelled':
+                        self.hmsg.debug('Stop-limit order cancelled by the exchange', order_id=sl_order_data['result']['order_id'])
+                        break
 
+                    chase_state.retries = count_retries
+                    decision = self.execution_policy.decide(chase_state)
+                    cross_to_market = decision == CROSS
+
+                    # If the attempt to close a trade by limit order fails, i.e., price slippage has occured,
+                    #  close it by market order.
+                    if cross_to_market and position_data['side'].lower() == 'buy':
+                        chase.cross()
+                        try:
+                            ret = self.cancel_limit_order(self.coin_ticker, sl_order_data['result']['order_id'])
+                            handle_exchange_response(ret,'CRITICAL: Failed to close SL order')
+                            if ret['ret_code'] == 0:
+                                self.hmsg.msg('Stop Limit order cancelled. Closing by market')
+                            self.close_position_qty('Sell', position_data['size'])
+                            self.market_count += 1
+                        except Exception as ex:
+                            self.hmsg.err('Market sell: Exception ocurred while closing long by market. Limit order might got filled meanwhile. Returning...')
+                            self.hmsg.err(ex)
+                            self.limit_count += 1
+                        finally:
+                            return True
+                    # Open Sell order by market on too many attempts or price slippage
+                    if cross_to_market and position_data['side'].lower() == 'sell':
+                        chase.cross()
+                        try:
+                            # Cancel Limit order as the position will be opened by market instead
+                            ret = self.cancel_limit_order(self.coin_ticker, sl_order_data['result']['order_id'])
+                            handle_exchange_response(ret,'CRITICAL: Failed to cancel limit order v2')
+                            if ret['ret_code'] == 0:
+                                self.hmsg.msg('Stop Limit order cancelled. Closing by market')
+                            self.close_position_qty('Buy', position_data['size'])
+                            self.market_count += 1
+                        except Exception as ex:
+                            self.hmsg.err('Market buy: Exception ocurred while closing short position by market. Limit order might got filled meanwhile. Returning...')
+                            self.hmsg.err(ex)
+                            self.limit_count += 1
+                        finally:
+                            return True
+
+
+                    # Update SL order to a tighter one
+                    # position_side = position_data['side'].lower()
+                    # latest_sell_price = ob_latest_sell_order['price']
+                    # latest_buy_price = ob_latest_buy_order['price']
+                    #self.hmsg.debug(f'position-side: {position_side}, ob_buy: {latest_buy_price}, \
+                    #  ob_sell: {latest_sell_price}, sl_price: {order_price}')
 
-                order_price = float(sl_order_data['result']['price'])
-
-                # Update SL order to a tighter one
-                # position_side = position_data['side'].lower()
-                # latest_sell_price = ob_latest_sell_order['price']
-                # latest_buy_price = ob_latest_buy_order['price']
-                #self.hmsg.debug(f'position-side: {position_side}, ob_buy: {latest_buy_price}, \
-                #  ob_sell: {latest_sell_price}, sl_price: {order_price}')
+                    try:
+                        if decision == REPRICE:
+                            self.hmsg.debug('Tightning: %s', count_retries, order_id=sl_order_data['result']['order_id'])
+                            chase.reprice()
+                            self.journal.reprice(self.coin_ticker, sl_order_data['result']['order_id'])
+                            count_retries += 1
+                            # Amend the order in place, or cancel it and place a new one if the amendment is rejected
+                            if not self.__amend_limit_order(sl_order_data['result']['order_id'], chase_state):
+                                self.cancel_limit_order(self.coin_ticker, sl_order_data['result']['order_id'])
+                                break
+                    except Exception:
+                        self.hmsg.err('Exception ocurred while tightening Stop-Limit order. Might got filled meanwhile. Returning...')
+                        return True
 
-                try:
-                    if position_data['side'].lower() == 'buy' \
-                        and (float(ob_latest_sell_order['price']) < order_price):
-                        self.hmsg.debug('Tightning: ' + str(count_retries))
-                        self.cancel_limit_order(self.coin_ticker, sl_order_data['result']['order_id'])
-                        count_retries += 1
-                        break
-                    if position_data['side'].lower() == 'sell' \
-                        and (float(ob_latest_buy_order['price']) > order_price):
-                        self.hmsg.debug('Tightning: ' + str(count_retries))
-                        self.cancel_limit_order(self.coin_ticker, sl_order_data['result']['order_id'])
-                        count_retries += 1
-                        break
-                except Exception:
-                    self.hmsg.err('Exception ocurred while tightening Stop-Limit order. Might got filled meanwhile. Returning...')
-                    return True
-                sleep(64/1000)
+                    # Wait for the next poll, waking up as soon as the order status changes
+                    chase.iteration_done()
+                    self.order_tracker.wait(
+                        sl_order_data['result']['order_id'],
+                        sl_order_data['result']['order_status'],
+                        self.execution_policy.wait_interval(chase_state)
+                    )
             # WHILE ENDS - Stop-limit order monitoring
         # WHILE ENDS - Main while ends  
     # DEF ENDS
@@ -662,16 +880,25 @@ class BybitTicker(BybitBase):
             position_data (dict): A dictionary containing position data for the current ticker.
         """
         self.reversal_count += 1
+        self.journal.close(self.coin_ticker, position_data, TradeJournal.REVERSAL)
         # self.cancel_tp_limit_order() - Commented out as it is not being used in the code
         self.force_stop_limit_order(position_data)
         
 
+    def collect_metrics(self):
+        """
+        Exports the statistics counters to the metrics registry.
+        """
+        for trade_type, count in (('tp', self.tp_count), ('sl', self.sl_count), ('reversal', self.reversal_count),
+                                  ('market', self.market_count), ('limit', self.limit_count)):
+            self.order_metrics.trades.set(count, ticker=self.coin_ticker, type=trade_type)
+
     def print_statistics(self):
         """
         This method prints out the statistics for the trading bot, such as TP count, SL count, reversal count, and 
         market and limit order counts.
         """
-        self.hmsg.msg(f'TPs: {self.tp_count}, SL: {self.sl_count}')
-        self.hmsg.msg(f'Reversals: {self.reversal_count}')
-        self.hmsg.msg(f'Limit: {self.limit_count}, Market: {self.market_count}')
+        self.hmsg.msg('TPs: %s, SL: %s', self.tp_count, self.sl_count)
+        self.hmsg.msg('Reversals: %s', self.reversal_count)
+        self.hmsg.msg('Limit: %s, Market: %s', self.limit_count, self.market_count)
 
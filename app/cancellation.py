@@ -0,0 +1,94 @@
+"""
+Cooperative cancellation for the order procedures.
+
+Each ticker owns a CancellationSource. Starting a procedure takes a new token
+from it, which cancels the token of the procedure it supersedes. Cancelling a
+token interrupts its waits immediately and runs its callbacks, e.g. to wake
+threads blocked on the order tracker, so a superseded procedure stops within
+one network call instead of one poll cycle.
+"""
+import threading
+
+
+class CancellationToken():
+
+    def __init__(self, generation: int):
+        """
+        Args:
+            generation (int): Sequence number of the procedure owning the token.
+        """
+        self.generation = generation
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        """
+        Cancels the token and runs its callbacks once.
+        """
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback) -> None:
+        """
+        Registers a callable to run when the token is cancelled, or right away if it already is.
+
+        Args:
+            callback (callable): Called without arguments.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        Sleeps for the given time, returning early if the token is cancelled.
+
+        Args:
+            timeout (float): Seconds to sleep.
+
+        Returns:
+            bool: True if the token was cancelled.
+        """
+        return self._event.wait(timeout)
+
+
+class CancellationSource():
+
+    def __init__(self, token_factory=CancellationToken):
+        """
+        Args:
+            token_factory (callable): Builds the token of a generation, ex: a token waiting on a virtual clock.
+        """
+        self._token_factory = token_factory
+        self._token = token_factory(0)
+        self._lock = threading.Lock()
+
+    @property
+    def current(self) -> CancellationToken:
+        return self._token
+
+    def renew(self) -> CancellationToken:
+        """
+        Cancels the current token and returns a token for the next generation.
+
+        Returns:
+            CancellationToken: Token of the new procedure.
+        """
+        with self._lock:
+            previous = self._token
+            # Returned from a local: a concurrent renew may replace self._token once the lock is released
+            token = self._token = self._token_factory(previous.generation + 1)
+        previous.cancel()
+        return token
@@ -1,5 +1,3 @@
-import logging
-import time
 from datetime import datetime
 import json
 from message_handler import MessageHandler
@@ -13,6 +11,15 @@ class MainConfig:
     CONFIG_FILENAME = "./app/config/config.json"
     DEBUG = False
 
+    # Logging used when the configuration file has no "logging" section, or leaves out some of its keys
+    LOGGING_DEFAULTS = {
+        'level': 'INFO',
+        'file': './app/log/bot.jsonl',
+        'max_bytes': 10 * 1024 * 1024,
+        'backup_count': 5,
+        'console': True,
+    }
+
     __instance = None
 
     def __new__(cls, *args, **kwargs):
@@ -32,14 +39,15 @@ class MainConfig:
         self.config_file_contents = None
         self.get_config_file_contents()
 
-        # Sets up the Logger
-        logging.getLogger().setLevel('INFO')
-        logging.basicConfig(filename='./app/log/' + time.strftime("%Y_%m_%d-%H_%M_%S") + '.log',
-                            level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s %(message)s',
-                            filemode="w")
-
-        # Sets up the message handler
-        self.message_handler = MessageHandler()
+        # Sets up the message handler and its logging pipeline
+        logging_config = self.get_logging_config()
+        self.message_handler = MessageHandler(
+            level=logging_config['level'],
+            log_file=logging_config['file'],
+            max_bytes=logging_config['max_bytes'],
+            backup_count=logging_config['backup_count'],
+            console=logging_config['console']
+        )
 
     @staticmethod
     def getinstance():
@@ -71,6 +79,18 @@ class MainConfig:
         """
         return self.config_file_contents['tickers'][pair]
 
+    def get_execution_engine(self):
+        """
+        Returns the engine running the order procedures: "threads" (default) or "asyncio".
+        """
+        return self.config_file_contents.get('execution_engine', 'threads')
+
+    def get_logging_config(self):
+        """
+        Returns the logging settings: minimum level, JSON log file, its rotation size and backups, and console output.
+        """
+        return dict(self.LOGGING_DEFAULTS, **self.config_file_contents.get('logging', {}))
+
     def get_ticker_list(self):
         """
         Returns a list of ticker pairs from the configuration file.
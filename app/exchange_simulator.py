@@ -0,0 +1,640 @@
+"""
+In-process stand-in for the Bybit linear perpetual API, for offline load tests.
+
+The simulator implements the pybit methods used by BybitBase: order book,
+ticker, symbols, leverage, wallet, positions, and placing, amending, querying
+and cancelling active orders. Each symbol has a one-tick spread that moves on a
+random walk; resting limit orders fill when the market trades through them,
+and may fill while they sit at the top of the book. Fills can be partial.
+PostOnly orders that would cross, when placed or amended, are accepted and
+then cancelled, as on the exchange. Take profit, stop loss and trailing stops
+set on a position close it by market when the quotes or trades reach them. Every call waits for a configurable latency, and every change is
+pushed on a private stream in the format of the exchange topics, so the order
+tracker and the account state run as they do in production.
+
+The market can also be driven from recorded quotes and trades with set_price
+and trade. Latency and timestamps follow the given clock, so that a replay on
+a virtual clock does not wait in real time.
+
+Errors are returned as responses with a non-zero ret_code; they are not raised
+as pybit does.
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+from account_state import AccountState
+from bybit_stream import ReplayStream
+from http_pool import RateLimitGovernor, SharedSession
+from instrument_registry import InstrumentRegistry
+from market_data_hub import MarketDataHub
+from order_book import OrderBookFeed
+from order_tracker import OrderTracker
+from trade_journal import TradeJournal
+
+
+class ExchangeSimulator():
+
+    # Default symbols: {symbol: (initial best bid, tick size, qty step)}
+    SYMBOLS = {
+        'BTCUSDT': (30000.0, 0.5, 0.001),
+        'ETHUSDT': (1800.0, 0.05, 0.01),
+        'CROUSDT': (0.07, 0.00001, 1.0),
+        'MATICUSDT': (1.0, 0.0001, 1.0),
+    }
+
+    MAKER_FEE = -0.00025
+    TAKER_FEE = 0.00075
+    MAX_LEVERAGE = 100
+
+    # Levels returned on each side of the book
+    DEPTH = 25
+
+    def __init__(self, symbols: dict = None, collateral: str = 'USDT', balance: float = 10000.0,
+                 latency: float = 0.0, jitter: float = 0.0, partial_fill_ratio: float = 1.0,
+                 touch_fill_probability: float = 0.1, seed: int = None, clock=time):
+        """
+        Args:
+            symbols (dict): Listed symbols, as in SYMBOLS.
+            collateral (str): Collateral coin of the wallet.
+            balance (float): Initial wallet balance.
+            latency (float): Seconds every call waits before being handled.
+            jitter (float): Maximum random seconds added to the latency.
+            partial_fill_ratio (float): Share of the remaining quantity filled on each match; 1 fills orders at once.
+            touch_fill_probability (float): Probability, on each market step, that an order at the best price fills.
+            seed (int): Seed of the random generator, for reproducible runs.
+            clock: Provides time() and sleep(); the time module by default.
+        """
+        self.collateral = collateral
+        self.latency = latency
+        self.jitter = jitter
+        self.partial_fill_ratio = partial_fill_ratio
+        self.touch_fill_probability = touch_fill_probability
+        self.clock = clock
+        self.private_stream = ReplayStream()
+        self.calls = dict()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._market_thread = None
+        self._running = False
+
+        self._symbols = dict()
+        for name, (bid, tick_size, qty_step) in (symbols or self.SYMBOLS).items():
+            self._symbols[name] = {'bid': bid, 'ask': None, 'bid_size': None, 'ask_size': None,
+                                   'tick_size': tick_size, 'qty_step': qty_step}
+        self._orders = dict()
+        self._open_orders = {name: dict() for name in self._symbols}
+        self._positions = {name: {side: self._empty_position(name, side) for side in ('Buy', 'Sell')}
+                           for name in self._symbols}
+        self._wallet = {'wallet_balance': balance, 'available_balance': balance, 'realised_pnl': 0.0}
+
+    def install(self, governor: RateLimitGovernor = None) -> None:
+        """
+        Replaces the shared session, order tracker, order book feed, account state, instrument
+        registry and trade journal with instances running on the simulator.
+
+        Args:
+            governor (RateLimitGovernor): Rate limit governor of the session; unthrottled if omitted.
+        """
+        if governor is None:
+            governor = RateLimitGovernor({name: (10 ** 9, 1, 0) for name in RateLimitGovernor.LIMITS})
+        session = SharedSession(session=self, governor=governor)
+        SharedSession.setinstance(session)
+        OrderTracker.setinstance(OrderTracker(self.private_stream))
+        # No depth stream: prices are read from the simulated REST order book
+        OrderBookFeed.setinstance(OrderBookFeed(ReplayStream()))
+        AccountState.setinstance(AccountState(session, self.collateral, self.private_stream, reconcile_interval=0))
+        temp_dir = tempfile.mkdtemp()
+        InstrumentRegistry.setinstance(InstrumentRegistry(session, cache_file=os.path.join(temp_dir, 'instruments.json')))
+        TradeJournal.setinstance(TradeJournal(os.path.join(temp_dir, 'trades.bin')))
+        # Created again on first use, on the simulator session and depth feed
+        MarketDataHub.setinstance(None)
+
+    # Market
+
+    def set_price(self, symbol: str, bid: float, ask: float = None, bid_size: float = None,
+                  ask_size: float = None) -> None:
+        """
+        Moves the best bid of a symbol and fills the resting orders the market traded through.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+            bid (float): New best bid.
+            ask (float): New best ask; one tick above the bid if omitted.
+            bid_size (float): Size at the best bid in the order book; random if omitted.
+            ask_size (float): Size at the best ask in the order book; random if omitted.
+        """
+        with self._lock:
+            market = self._symbols[symbol]
+            market['bid_size'], market['ask_size'] = bid_size, ask_size
+            events = self._move(symbol, bid, ask)
+        self._publish(events)
+
+    def trade(self, symbol: str, price: float) -> None:
+        """
+        Prints a trade: resting orders priced through it fill, and orders at its price may fill.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+            price (float): Price of the trade.
+        """
+        events = []
+        with self._lock:
+            market = self._symbols[symbol]
+            for order in list(self._open_orders[symbol].values()):
+                through = price < order['price'] if order['side'] == 'Buy' else price > order['price']
+                if through or (price == order['price'] and self._random.random() < self.touch_fill_probability):
+                    self._fill(order, self._match_qty(order, market), order['price'], True, events)
+            self._trigger_stops(symbol, price, price, events)
+        self._publish(events)
+
+    def quote(self, symbol: str) -> tuple:
+        """
+        Returns the best bid and ask of a symbol.
+        """
+        with self._lock:
+            return self._best_prices(self._symbols[symbol])
+
+    def has_open_orders(self, symbol: str) -> bool:
+        """
+        Returns True while orders of the symbol rest in the book.
+        """
+        return bool(self._open_orders[symbol])
+
+    def has_open_stops(self, symbol: str) -> bool:
+        """
+        Returns True while a position of the symbol has a stop loss, take profit or trailing stop set.
+        """
+        return any(position['size'] > 0 and (position['stop_loss'] or position['take_profit'] or position['trailing_stop'])
+                   for position in self._positions[symbol].values())
+
+    def step(self, ticks: int = 1) -> None:
+        """
+        Moves every symbol by a random number of ticks, between -ticks and ticks.
+        """
+        events = []
+        with self._lock:
+            for name, market in self._symbols.items():
+                move = self._random.randint(-ticks, ticks) * market['tick_size']
+                events.extend(self._move(name, max(market['bid'] + move, market['tick_size'])))
+        self._publish(events)
+
+    def run(self, interval: float = 0.05, ticks: int = 1) -> None:
+        """
+        Starts moving the market on a background thread.
+
+        Args:
+            interval (float): Seconds between market steps.
+            ticks (int): Maximum move of a step, in ticks.
+        """
+        self._running = True
+
+        def market_loop():
+            while self._running:
+                self.step(ticks)
+                time.sleep(interval)
+
+        self._market_thread = threading.Thread(target=market_loop, daemon=True)
+        self._market_thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the background market thread.
+        """
+        self._running = False
+        if self._market_thread is not None:
+            self._market_thread.join()
+            self._market_thread = None
+
+    # pybit HTTP methods
+
+    def orderbook(self, symbol: str) -> dict:
+        self._enter('orderbook')
+        with self._lock:
+            market = self._symbols.get(symbol)
+            if market is None:
+                return self._error(10001, 'symbol not exists')
+            tick_size = market['tick_size']
+            bid, ask = self._best_prices(market)
+            levels = [self._level(symbol, 'Buy', bid - i * tick_size, tick_size) for i in range(self.DEPTH)]
+            levels += [self._level(symbol, 'Sell', ask + i * tick_size, tick_size) for i in range(self.DEPTH)]
+            if market['bid_size'] is not None:
+                levels[0]['size'] = market['bid_size']
+            if market['ask_size'] is not None:
+                levels[self.DEPTH]['size'] = market['ask_size']
+        return self._response(levels)
+
+    def latest_information_for_symbol(self, symbol: str) -> dict:
+        self._enter('latest_information_for_symbol')
+        with self._lock:
+            market = self._symbols.get(symbol)
+            if market is None:
+                return self._error(10001, 'symbol not exists')
+            bid, ask = self._best_prices(market)
+        return self._response([{
+            'symbol': symbol,
+            'bid_price': self._format_price(bid, market['tick_size']),
+            'ask_price': self._format_price(ask, market['tick_size']),
+            'last_price': self._format_price(bid, market['tick_size']),
+        }])
+
+    def query_symbol(self) -> dict:
+        self._enter('query_symbol')
+        return self._response([{
+            'name': name,
+            'alias': name,
+            'status': 'Trading',
+            'base_currency': name[:-len(self.collateral)],
+            'quote_currency': self.collateral,
+            'price_scale': self._decimals(market['tick_size']),
+            'leverage_filter': {'min_leverage': 1, 'max_leverage': self.MAX_LEVERAGE, 'leverage_step': '0.01'},
+            'price_filter': {'min_price': str(market['tick_size']), 'max_price': '999999',
+                             'tick_size': str(market['tick_size'])},
+            'lot_size_filter': {'max_trading_qty': 1000000, 'min_trading_qty': market['qty_step'],
+                                'qty_step': market['qty_step']},
+        } for name, market in self._symbols.items()])
+
+    def set_leverage(self, symbol: str, buy_leverage: float, sell_leverage: float) -> dict:
+        self._enter('set_leverage')
+        with self._lock:
+            if symbol not in self._symbols:
+                return self._error(10001, 'symbol not exists')
+            if max(buy_leverage, sell_leverage) > self.MAX_LEVERAGE:
+                return self._error(34015, 'cannot set leverage gt maxLeverage')
+            self._positions[symbol]['Buy']['leverage'] = buy_leverage
+            self._positions[symbol]['Sell']['leverage'] = sell_leverage
+        return self._response(None)
+
+    def get_wallet_balance(self, coin: str = None) -> dict:
+        self._enter('get_wallet_balance')
+        with self._lock:
+            return self._response({self.collateral: dict(self._wallet)})
+
+    def my_position(self, symbol: str) -> dict:
+        self._enter('my_position')
+        with self._lock:
+            positions = self._positions.get(symbol)
+            if positions is None:
+                return self._error(10001, 'symbol not exists')
+            return self._response([dict(positions['Buy']), dict(positions['Sell'])])
+
+    def place_active_order(self, symbol: str, side: str, order_type: str, qty: float, time_in_force: str,
+                           price: float = None, reduce_only: bool = False, close_on_trigger: bool = False,
+                           order_link_id: str = None, **kwargs) -> dict:
+        self._enter('place_active_order')
+        return self._place(symbol, side, order_type, qty, time_in_force, price, reduce_only, close_on_trigger,
+                           order_link_id)
+
+    def _place(self, symbol: str, side: str, order_type: str, qty: float, time_in_force: str, price: float = None,
+               reduce_only: bool = False, close_on_trigger: bool = False, order_link_id: str = None,
+               **kwargs) -> dict:
+        events = []
+        with self._lock:
+            market = self._symbols.get(symbol)
+            if market is None:
+                return self._error(10001, 'symbol not exists')
+            if side not in ('Buy', 'Sell') or float(qty) < market['qty_step']:
+                return self._error(10001, 'params error')
+            if order_type == 'Limit' and price is None:
+                return self._error(10001, 'price is required for limit orders')
+            qty = float(qty)
+            if reduce_only:
+                position = self._positions[symbol][self._opposite(side)]
+                if position['size'] <= 0:
+                    return self._error(130125, 'current position is zero, cannot fix reduce-only order qty')
+                qty = min(qty, position['size'])
+
+            order = self._new_order(symbol, side, order_type, qty, time_in_force, price, reduce_only,
+                                    close_on_trigger, order_link_id)
+            response = self._response(dict(order))
+
+            bid, ask = self._best_prices(market)
+            if order_type == 'Market':
+                self._fill(order, qty, ask if side == 'Buy' else bid, False, events)
+            elif (side == 'Buy' and order['price'] >= ask) or (side == 'Sell' and order['price'] <= bid):
+                if time_in_force == 'PostOnly':
+                    # Accepted, then cancelled as it would take liquidity
+                    self._set_status(order, 'Cancelled', events)
+                else:
+                    self._fill(order, qty, ask if side == 'Buy' else bid, False, events)
+            else:
+                self._open_orders[symbol][order['order_id']] = order
+                self._set_status(order, 'New', events)
+        self._publish(events)
+        return response
+
+    def query_active_order(self, symbol: str, order_id: str = None, order_link_id: str = None) -> dict:
+        self._enter('query_active_order')
+        with self._lock:
+            order = self._find(symbol, order_id, order_link_id)
+            if order is None:
+                return self._error(20001, 'order not exists')
+            return self._response(dict(order))
+
+    def replace_active_order(self, symbol: str, order_id: str = None, order_link_id: str = None,
+                             p_r_qty: float = None, p_r_price: float = None, **kwargs) -> dict:
+        """
+        Amends the price and/or quantity of a resting order, keeping its order id.
+        """
+        self._enter('replace_active_order')
+        events = []
+        with self._lock:
+            order = self._find(symbol, order_id, order_link_id)
+            if order is None or order['order_id'] not in self._open_orders[symbol]:
+                return self._error(20001, 'order not exists or too late to replace')
+            if p_r_qty is not None:
+                if float(p_r_qty) <= order['cum_exec_qty']:
+                    return self._error(10001, 'params error')
+                order['qty'] = float(p_r_qty)
+                order['leaves_qty'] = round(order['qty'] - order['cum_exec_qty'], 8)
+            if p_r_price is not None:
+                order['price'] = float(p_r_price)
+            response = self._response({'order_id': order['order_id']})
+
+            bid, ask = self._best_prices(self._symbols[symbol])
+            if (order['side'] == 'Buy' and order['price'] >= ask) or (order['side'] == 'Sell' and order['price'] <= bid):
+                del self._open_orders[symbol][order['order_id']]
+                if order['time_in_force'] == 'PostOnly':
+                    # Amended, then cancelled as it would take liquidity
+                    self._set_status(order, 'Cancelled', events)
+                else:
+                    self._fill(order, order['leaves_qty'], ask if order['side'] == 'Buy' else bid, False, events)
+            else:
+                self._set_status(order, 'New' if order['cum_exec_qty'] == 0 else 'PartiallyFilled', events)
+        self._publish(events)
+        return response
+
+    def cancel_active_order(self, symbol: str, order_id: str = None, order_link_id: str = None) -> dict:
+        self._enter('cancel_active_order')
+        return self._cancel(symbol, order_id, order_link_id)
+
+    def _cancel(self, symbol: str, order_id: str = None, order_link_id: str = None) -> dict:
+        events = []
+        with self._lock:
+            order = self._find(symbol, order_id, order_link_id)
+            if order is None or order['order_id'] not in self._open_orders[symbol]:
+                return self._error(20001, 'order not exists or too late to cancel')
+            del self._open_orders[symbol][order['order_id']]
+            self._set_status(order, 'Cancelled', events)
+            response = self._response({'order_id': order['order_id']})
+        self._publish(events)
+        return response
+
+    def cancel_all_active_orders(self, symbol: str) -> dict:
+        self._enter('cancel_all_active_orders')
+        events = []
+        with self._lock:
+            if symbol not in self._symbols:
+                return self._error(10001, 'symbol not exists')
+            cancelled = list(self._open_orders[symbol].values())
+            self._open_orders[symbol].clear()
+            for order in cancelled:
+                self._set_status(order, 'Cancelled', events)
+            response = self._response([order['order_id'] for order in cancelled])
+        self._publish(events)
+        return response
+
+    def set_trading_stop(self, symbol: str, side: str, take_profit: float = None, stop_loss: float = None,
+                         trailing_stop: float = None, **kwargs) -> dict:
+        """
+        Sets the take profit, stop loss and trailing stop of a position; 0 removes them.
+        The trailing stop is a price distance: the stop loss follows the best price at that distance.
+        A triggered stop closes the whole position by market.
+        """
+        self._enter('set_trading_stop')
+        events = []
+        with self._lock:
+            positions = self._positions.get(symbol)
+            if positions is None or side not in positions:
+                return self._error(10001, 'params error')
+            position = positions[side]
+            if position['size'] <= 0:
+                return self._error(130024, 'can not set tp/sl/ts for zero position')
+            market = self._symbols[symbol]
+            bid, ask = self._best_prices(market)
+            # Long positions close on the bid, short positions on the ask
+            price, direction = (bid, 1) if side == 'Buy' else (ask, -1)
+            if (stop_loss and (float(stop_loss) - price) * direction >= 0) \
+                    or (take_profit and (float(take_profit) - price) * direction <= 0):
+                return self._error(10001, 'params error')
+            if take_profit is not None:
+                position['take_profit'] = float(take_profit)
+            if stop_loss is not None:
+                position['stop_loss'] = float(stop_loss)
+            if trailing_stop is not None:
+                position['trailing_stop'] = float(trailing_stop)
+                if position['trailing_stop']:
+                    position['stop_loss'] = round(price - direction * position['trailing_stop'],
+                                                  self._decimals(market['tick_size']))
+            events.append(('position', dict(position)))
+            response = self._response(None)
+        self._publish(events)
+        return response
+
+    # Matching, must be called with the lock held
+
+    def _new_order(self, symbol: str, side: str, order_type: str, qty: float, time_in_force: str, price: float,
+                   reduce_only: bool, close_on_trigger: bool, order_link_id: str) -> dict:
+        now = self._timestamp()
+        order = {
+            'order_id': str(uuid.uuid4()),
+            'user_id': 1,
+            'symbol': symbol,
+            'side': side,
+            'order_type': order_type,
+            'price': float(price) if price is not None else 0,
+            'qty': qty,
+            'time_in_force': time_in_force,
+            'order_status': 'Created',
+            'last_exec_price': 0,
+            'cum_exec_qty': 0,
+            'cum_exec_value': 0,
+            'cum_exec_fee': 0,
+            'leaves_qty': qty,
+            'reduce_only': reduce_only,
+            'close_on_trigger': close_on_trigger,
+            'order_link_id': order_link_id or '',
+            'created_time': now,
+            'updated_time': now,
+        }
+        self._orders[order['order_id']] = order
+        return order
+
+    def _trigger_stops(self, symbol: str, bid: float, ask: float, events: list) -> None:
+        decimals = self._decimals(self._symbols[symbol]['tick_size'])
+        for side, position in self._positions[symbol].items():
+            if position['size'] <= 0:
+                continue
+            price, direction = (bid, 1) if side == 'Buy' else (ask, -1)
+            if position['trailing_stop']:
+                trailed = round(price - direction * position['trailing_stop'], decimals)
+                if (trailed - position['stop_loss']) * direction > 0:
+                    position['stop_loss'] = trailed
+            stop_loss, take_profit = position['stop_loss'], position['take_profit']
+            if (stop_loss and (price - stop_loss) * direction <= 0) or (take_profit and (price - take_profit) * direction >= 0):
+                order = self._new_order(symbol, self._opposite(side), 'Market', position['size'], 'ImmediateOrCancel',
+                                        None, True, True, None)
+                self._fill(order, order['qty'], price, False, events)
+
+    def _move(self, symbol: str, bid: float, ask: float = None) -> list:
+        market = self._symbols[symbol]
+        decimals = self._decimals(market['tick_size'])
+        market['bid'] = round(bid, decimals)
+        market['ask'] = round(ask, decimals) if ask is not None else None
+        bid, ask = self._best_prices(market)
+        events = []
+        for order in list(self._open_orders[symbol].values()):
+            if order['side'] == 'Buy':
+                crossed, touched = ask <= order['price'], bid == order['price']
+            else:
+                crossed, touched = bid >= order['price'], ask == order['price']
+            if crossed or (touched and self._random.random() < self.touch_fill_probability):
+                self._fill(order, self._match_qty(order, market), order['price'], True, events)
+        self._trigger_stops(symbol, bid, ask, events)
+        return events
+
+    def _match_qty(self, order: dict, market: dict) -> float:
+        leaves_qty = order['leaves_qty']
+        qty_step = market['qty_step']
+        # The epsilon keeps float error from leaving a one-step remainder, ex: 8.29 / 0.01 = 828.999...
+        qty = int(leaves_qty * self.partial_fill_ratio / qty_step + 1e-9) * qty_step
+        return leaves_qty if qty < qty_step else round(qty, 8)
+
+    def _fill(self, order: dict, qty: float, price: float, is_maker: bool, events: list) -> None:
+        symbol = order['symbol']
+        fee = price * qty * (self.MAKER_FEE if is_maker else self.TAKER_FEE)
+        order['cum_exec_qty'] = round(order['cum_exec_qty'] + qty, 8)
+        order['cum_exec_value'] += price * qty
+        order['cum_exec_fee'] += fee
+        order['leaves_qty'] = round(order['qty'] - order['cum_exec_qty'], 8)
+        order['last_exec_price'] = price
+        if order['leaves_qty'] <= 0:
+            self._open_orders[symbol].pop(order['order_id'], None)
+        self._set_status(order, 'Filled' if order['leaves_qty'] <= 0 else 'PartiallyFilled', events)
+        events.append(('execution', {
+            'symbol': symbol,
+            'side': order['side'],
+            'order_id': order['order_id'],
+            'exec_id': str(uuid.uuid4()),
+            'order_link_id': order['order_link_id'],
+            'price': price,
+            'order_qty': order['qty'],
+            'exec_type': 'Trade',
+            'exec_qty': qty,
+            'exec_fee': fee,
+            'leaves_qty': order['leaves_qty'],
+            'is_maker': is_maker,
+            'trade_time': order['updated_time'],
+        }))
+
+        # Hedge mode: each side has its own position, reduce-only orders close the opposite side
+        position = self._positions[symbol][self._opposite(order['side']) if order['reduce_only'] else order['side']]
+        if order['reduce_only']:
+            qty = min(qty, position['size'])
+            direction = 1 if position['side'] == 'Buy' else -1
+            pnl = (price - position['entry_price']) * qty * direction
+            position['size'] = round(position['size'] - qty, 8)
+            position['realised_pnl'] += pnl
+            self._wallet['realised_pnl'] += pnl
+            self._wallet['wallet_balance'] += pnl
+            if position['size'] <= 0:
+                position['size'] = 0
+                position['entry_price'] = 0
+                # The stops of a position go away with it
+                position['take_profit'] = position['stop_loss'] = position['trailing_stop'] = 0
+        else:
+            size = position['size'] + qty
+            position['entry_price'] = (position['entry_price'] * position['size'] + price * qty) / size
+            position['size'] = round(size, 8)
+        position['position_value'] = position['entry_price'] * position['size']
+        position['position_seq'] += 1
+        self._wallet['wallet_balance'] -= fee
+        self._wallet['available_balance'] = self._wallet['wallet_balance']
+        events.append(('position', dict(position)))
+        events.append(('wallet', dict(self._wallet)))
+
+    def _set_status(self, order: dict, status: str, events: list) -> None:
+        order['order_status'] = status
+        order['updated_time'] = self._timestamp()
+        events.append(('order', dict(order)))
+
+    def _find(self, symbol: str, order_id: str, order_link_id: str) -> dict:
+        if order_id is not None:
+            order = self._orders.get(order_id)
+        else:
+            order = next((order for order in self._orders.values()
+                          if order_link_id and order['order_link_id'] == order_link_id), None)
+        return order if order is not None and order['symbol'] == symbol else None
+
+    # Helpers
+
+    def _publish(self, events: list) -> None:
+        # Pushed outside the lock, in the order the changes happened
+        for topic, data in events:
+            self.private_stream.push({'topic': topic, 'data': [data]})
+
+    def _enter(self, method: str) -> None:
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            self.clock.sleep(delay)
+
+    def _level(self, symbol: str, side: str, price: float, tick_size: float) -> dict:
+        return {
+            'symbol': symbol,
+            'price': self._format_price(price, tick_size),
+            'size': round(self._random.uniform(1, 100), 3),
+            'side': side,
+        }
+
+    def _empty_position(self, symbol: str, side: str) -> dict:
+        return {
+            'user_id': 1,
+            'symbol': symbol,
+            'side': side,
+            'size': 0,
+            'position_value': 0,
+            'entry_price': 0,
+            'leverage': 1,
+            'realised_pnl': 0,
+            'position_seq': 0,
+            'take_profit': 0,
+            'stop_loss': 0,
+            'trailing_stop': 0,
+        }
+
+    @staticmethod
+    def _best_prices(market: dict) -> tuple:
+        if market['ask'] is not None:
+            return market['bid'], market['ask']
+        return market['bid'], round(market['bid'] + market['tick_size'], ExchangeSimulator._decimals(market['tick_size']))
+
+    @staticmethod
+    def _decimals(tick_size: float) -> int:
+        text = f'{tick_size:.10f}'.rstrip('0')
+        return len(text.split('.')[1]) if '.' in text else 0
+
+    @staticmethod
+    def _format_price(price: float, tick_size: float) -> str:
+        return f'{price:.{ExchangeSimulator._decimals(tick_size)}f}'
+
+    @staticmethod
+    def _opposite(side: str) -> str:
+        return 'Sell' if side == 'Buy' else 'Buy'
+
+    def _timestamp(self) -> str:
+        return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(self.clock.time()))
+
+    @staticmethod
+    def _response(result) -> dict:
+        return {'ret_code': 0, 'ret_msg': 'OK', 'ext_code': '', 'ext_info': '', 'result': result,
+                'time_now': f'{time.time():.6f}'}
+
+    @staticmethod
+    def _error(ret_code: int, ret_msg: str) -> dict:
+        return {'ret_code': ret_code, 'ret_msg': ret_msg, 'ext_code': '', 'ext_info': '', 'result': None,
+                'time_now': f'{time.time():.6f}'}
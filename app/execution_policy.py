@@ -0,0 +1,281 @@
+"""
+Execution policies deciding how the order procedures chase their limit orders.
+
+On every poll of the entry and stop-limit chase loops, the procedure records
+the top of the book in a ChaseState and asks the policy of its ticker whether
+to wait, reprice the order at the new top of the book, or cross the spread
+with a market order, and how long to wait before the next poll. The price of
+each new limit order also comes from the policy.
+
+StaticPolicy keeps the original rules: reprice whenever the top of the book
+moves away, and cross after a number of attempts or when the price slips by
+the ticker's trade_market_on_slippage_perc. AdaptivePolicy reads the spread,
+the imbalance of the top of the book, the recent volatility and the estimated
+queue ahead of the order.
+
+The policy of a ticker is set by the "execution_policy" key of its entry in
+config.json, ex: {"name": "adaptive", "imbalance_cross": 0.9}; the static
+policy is used without it. execution_replay.py runs the procedures with any
+policy against recorded book data.
+"""
+import math
+from collections import deque
+
+# Decisions
+WAIT = 'wait'
+REPRICE = 'reprice'
+CROSS = 'cross'
+
+
+class ChaseState():
+    """
+    What a policy knows about an order being chased: the book observed by the procedure, the attempts so far
+    and the estimated queue ahead of the resting order.
+    """
+
+    # Number of mid prices kept for the volatility estimate
+    VOLATILITY_WINDOW = 32
+
+    def __init__(self, kind: str, side: str, tick_size: float, slippage_perc: float):
+        """
+        Args:
+            kind (str): "entry" for an entry order, "stop" for a stop-limit close.
+            side (str): Side of the orders, "Buy" or "Sell".
+            tick_size (float): Tick size of the symbol.
+            slippage_perc (float): Price slippage, in percent, tolerated before crossing.
+        """
+        self.kind = kind
+        self.side = side.capitalize()
+        self.tick_size = tick_size
+        self.slippage_perc = slippage_perc
+        self.retries = 0
+        self.bid = self.ask = None
+        self.bid_size = self.ask_size = None
+        # Best bid and ask since the chase started, the trailing stop references of a close
+        self.highest_bid = 0.5
+        self.lowest_ask = 99999.5
+        self.order_price = None
+        self.queue_ahead = None
+        self._mids = deque(maxlen=self.VOLATILITY_WINDOW)
+
+    def observe(self, bid: float, ask: float, bid_size: float = None, ask_size: float = None) -> None:
+        """
+        Records the top of the book.
+        """
+        self.bid, self.ask = float(bid), float(ask)
+        self.bid_size = float(bid_size) if bid_size is not None else None
+        self.ask_size = float(ask_size) if ask_size is not None else None
+        self.highest_bid = max(self.highest_bid, self.bid)
+        self.lowest_ask = min(self.lowest_ask, self.ask)
+        self._mids.append((self.bid + self.ask) / 2)
+        # The queue ahead can only shrink while the order rests at the best price
+        if self.queue_ahead is not None:
+            level_size = self._level_size(self.order_price)
+            self.queue_ahead = min(self.queue_ahead, level_size) if level_size is not None else 0
+
+    def observe_order(self, price: float) -> None:
+        """
+        Records a newly placed order, joining the back of the queue at its price.
+        """
+        self.order_price = float(price)
+        level_size = self._level_size(self.order_price)
+        self.queue_ahead = level_size if level_size is not None else 0
+
+    @property
+    def spread_ticks(self) -> float:
+        return round((self.ask - self.bid) / self.tick_size) if self.tick_size else 1
+
+    @property
+    def imbalance(self) -> float:
+        """
+        Imbalance of the top of the book, from -1 (only sellers) to 1 (only buyers), 0 when the sizes are unknown.
+        """
+        if not self.bid_size or not self.ask_size:
+            return 0.0
+        return (self.bid_size - self.ask_size) / (self.bid_size + self.ask_size)
+
+    @property
+    def volatility_bps(self) -> float:
+        """
+        Standard deviation of the mid price changes between observations, in basis points.
+        """
+        if len(self._mids) < 3:
+            return 0.0
+        changes = [math.log(current / previous) for previous, current in zip(self._mids, list(self._mids)[1:])]
+        mean = sum(changes) / len(changes)
+        return math.sqrt(sum((change - mean) ** 2 for change in changes) / len(changes)) * 10000
+
+    def _level_size(self, price: float) -> float:
+        if self.side == 'Buy':
+            return self.bid_size if self.bid == price else None
+        return self.ask_size if self.ask == price else None
+
+
+class StaticPolicy():
+    """
+    The original chase rules: fixed retries, slippage and poll intervals.
+    """
+
+    name = 'static'
+
+    def __init__(self, entry_max_retries: int = 3, stop_max_retries: int = 1, poll_interval: float = 128/1000,
+                 stop_poll_interval: float = 64/1000):
+        """
+        Args:
+            entry_max_retries (int): Entry attempts before crossing.
+            stop_max_retries (int): Stop-limit attempts before crossing.
+            poll_interval (float): Seconds between polls of an entry order.
+            stop_poll_interval (float): Seconds between polls of a stop-limit order.
+        """
+        self.entry_max_retries = entry_max_retries
+        self.stop_max_retries = stop_max_retries
+        self.poll_interval = poll_interval
+        self.stop_poll_interval = stop_poll_interval
+
+    def decide(self, state: ChaseState) -> str:
+        """
+        Decides what to do with the resting order.
+
+        Returns:
+            str: WAIT, REPRICE or CROSS.
+        """
+        if self.should_cross(state):
+            return CROSS
+        if self.should_reprice(state):
+            return REPRICE
+        return WAIT
+
+    def limit_price(self, state: ChaseState) -> float:
+        """
+        Returns the price of a new limit order: the best bid to buy, the best ask to sell.
+        """
+        return state.bid if state.side == 'Buy' else state.ask
+
+    def wait_interval(self, state: ChaseState) -> float:
+        """
+        Returns the maximum seconds to wait for an order update before the next poll.
+        """
+        return self.poll_interval if state.kind == 'entry' else self.stop_poll_interval
+
+    def should_cross(self, state: ChaseState) -> bool:
+        """
+        Whether to replace the order by a market order, either after too many attempts or because the price
+        slipped away: from the order price for an entry, from the best price since the start for a close.
+        """
+        max_retries = self.entry_max_retries if state.kind == 'entry' else self.stop_max_retries
+        return state.retries > max_retries or self.slippage_perc(state) > self.slippage_tolerance_perc(state)
+
+    def should_reprice(self, state: ChaseState) -> bool:
+        """
+        Whether the top of the book moved away from the order.
+        """
+        if state.side == 'Buy':
+            return state.bid > state.order_price
+        return state.ask < state.order_price
+
+    def slippage_perc(self, state: ChaseState) -> float:
+        """
+        Adverse price move, in percent: rising for buys, falling for sells.
+        """
+        if state.kind == 'entry':
+            price, reference = (state.bid, state.order_price) if state.side == 'Buy' else (state.ask, state.order_price)
+        else:
+            price, reference = (state.ask, state.lowest_ask) if state.side == 'Buy' else (state.bid, state.highest_bid)
+        move = (price - reference) / reference * 100
+        return move if state.side == 'Buy' else -move
+
+    def slippage_tolerance_perc(self, state: ChaseState) -> float:
+        return state.slippage_perc
+
+
+class AdaptivePolicy(StaticPolicy):
+    """
+    Chase rules reading the book: holds a reprice while it leans towards the order, improves on a wide spread when the queue ahead is long,
+    widens the slippage tolerance and shortens the polls as the volatility rises. Optionally crosses early when
+    the book leans away from an entry and the spread is one tick.
+    """
+
+    name = 'adaptive'
+
+    def __init__(self, imbalance_cross: float = 1, imbalance_hold: float = 0.3, hold_ticks: int = 1,
+                 queue_improve: float = 50, volatility_slippage: float = 0.5, reference_volatility_bps: float = 1,
+                 min_poll_interval: float = 16/1000, **params):
+        """
+        Args:
+            imbalance_cross (float): Imbalance against the order above which an entry crosses a one-tick spread;
+                1 never crosses early, as the fee usually outweighs the tick saved.
+            imbalance_hold (float): Imbalance towards the order above which a reprice is held.
+            hold_ticks (int): Maximum ticks the market may move away while a reprice is held.
+            queue_improve (float): Queue ahead, in contracts, above which the order improves a wide spread by a tick.
+            volatility_slippage (float): Volatility, as a multiple of the poll-to-poll standard deviation,
+                added to the slippage tolerance.
+            reference_volatility_bps (float): Volatility at which polls run at the base interval; faster markets
+                are polled more often.
+            min_poll_interval (float): Minimum seconds between polls.
+            **params: StaticPolicy settings.
+        """
+        super().__init__(**params)
+        self.imbalance_cross = imbalance_cross
+        self.imbalance_hold = imbalance_hold
+        self.hold_ticks = hold_ticks
+        self.queue_improve = queue_improve
+        self.volatility_slippage = volatility_slippage
+        self.reference_volatility_bps = reference_volatility_bps
+        self.min_poll_interval = min_poll_interval
+
+    def should_cross(self, state: ChaseState) -> bool:
+        if super().should_cross(state):
+            return True
+        # The price is about to leave: crossing costs a single tick now
+        return state.kind == 'entry' and state.spread_ticks <= 1 and self._leaning_away(state) > self.imbalance_cross
+
+    def should_reprice(self, state: ChaseState) -> bool:
+        if not super().should_reprice(state):
+            # A long queue at the best price of a wide spread: improve by a tick
+            return state.spread_ticks >= 2 and (state.queue_ahead or 0) > self.queue_improve
+        ticks_away = abs((state.bid if state.side == 'Buy' else state.ask) - state.order_price) / state.tick_size
+        return not (ticks_away <= self.hold_ticks and -self._leaning_away(state) > self.imbalance_hold)
+
+    def limit_price(self, state: ChaseState) -> float:
+        price = super().limit_price(state)
+        if state.spread_ticks >= 2 and (state.queue_ahead or 0) > self.queue_improve:
+            price += state.tick_size if state.side == 'Buy' else -state.tick_size
+        return price
+
+    def wait_interval(self, state: ChaseState) -> float:
+        interval = super().wait_interval(state)
+        volatility = state.volatility_bps
+        if volatility > self.reference_volatility_bps:
+            interval = max(self.min_poll_interval, interval * self.reference_volatility_bps / volatility)
+        return interval
+
+    def slippage_tolerance_perc(self, state: ChaseState) -> float:
+        return state.slippage_perc + self.volatility_slippage * state.volatility_bps / 100
+
+    @staticmethod
+    def _leaning_away(state: ChaseState) -> float:
+        # Positive when the book pushes the price away from the order: buyers heavy for a buy
+        return state.imbalance if state.side == 'Buy' else -state.imbalance
+
+
+POLICIES = {policy.name: policy for policy in (StaticPolicy, AdaptivePolicy)}
+
+
+def create_policy(config: dict = None) -> StaticPolicy:
+    """
+    Creates a policy from its configuration.
+
+    Args:
+        config (dict): "name" of the policy, one of POLICIES, and its settings; the static policy if omitted.
+
+    Returns:
+        StaticPolicy: The policy.
+    """
+    config = dict(config or {})
+    name = config.pop('name', StaticPolicy.name)
+    if name not in POLICIES:
+        raise ValueError(f'Unknown execution policy {name!r}, expected one of {", ".join(POLICIES)}')
+    try:
+        return POLICIES[name](**config)
+    except TypeError as ex:
+        raise ValueError(f'Invalid settings for the {name} execution policy: {ex}') from None
@@ -0,0 +1,538 @@
+"""
+Replay of the live order procedures against recorded market data, on a virtual clock.
+
+Signals are handled as by the AlertManager: the opposite position is closed
+with force_stop_limit_order, then the entry runs place_limit_order_with_retry
+and tighten_limit_order, optionally followed by the trailing stop monitor
+check_for_stop_limit_tsl, or by the stop registered on the exchange with the
+EXCHANGE_TSL and EXCHANGE_SLTP risk management. The procedures are the ones of
+BybitTicker, running against the exchange simulator fed with the recorded
+quotes and trades.
+
+Nothing waits in real time. The order tracker, the cancellation tokens and the
+simulated call latency wait on a virtual clock. The clock applies the
+recorded ticks that fall within the wait, and returns as soon as the order or
+the token the procedure waits on changes. Ticks that cannot fill any order,
+nor move or trigger a stop set on the exchange, are skipped. A replay therefore runs orders of magnitude faster than the
+market it covers. Every execution is kept with the price at the start of its
+procedure, which gives the maker/taker mix, fees and slippage of the
+execution logic.
+
+Signals are handled one after the other, so a close and the following entry
+run in sequence rather than on two threads as in production.
+
+Usage: python app/execution_replay.py ticks.csv signals.csv --ticker ETH --tick-size 0.05 --qty-step 0.01
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import math
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from backtester import CLOSE_SIGNAL
+from bybit_ticker import BybitTicker
+from cancellation import CancellationSource, CancellationToken
+from config.main_config import MainConfig
+from exchange_simulator import ExchangeSimulator
+from execution_policy import create_policy
+from order_tracker import OrderTracker
+
+
+class ReplayExhausted(Exception):
+    """
+    Raised when a procedure waits for an event after the end of the recorded data.
+    """
+
+
+class VirtualClock():
+    """
+    Time of a replay, moved forward by the waits of the procedures instead of elapsing.
+
+    Event sources provide next_time(), the time of their next event or None once exhausted, and
+    fire(horizon), which applies their next event, or any later events up to the horizon, and returns
+    the time reached.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self.sources = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.advance(seconds)
+
+    def advance(self, seconds: float = None, until=None) -> bool:
+        """
+        Moves the time forward, firing the events due on the way.
+
+        Args:
+            seconds (float): Time to move forward; None moves forward until `until` holds.
+            until (callable): Stops at the first event after which it returns True.
+
+        Returns:
+            bool: Whether `until` holds.
+
+        Raises:
+            ReplayExhausted: When waiting for `until` with no events left.
+        """
+        deadline = math.inf if seconds is None else self.now + max(seconds, 0)
+        while until is None or not until():
+            pending = sorted((source.next_time(), index) for index, source in enumerate(self.sources)
+                             if source.next_time() is not None)
+            if not pending and until is not None:
+                raise ReplayExhausted(f'No market data after {self.now}')
+            if not pending or pending[0][0] > deadline:
+                self.now = max(self.now, deadline)
+                return False
+            next_time, index = pending[0]
+            # A source may skip ahead, but not past the next event of another source
+            horizon = min(deadline, pending[1][0]) if len(pending) > 1 else deadline
+            self.now = max(self.now, next_time)
+            self.now = max(self.now, self.sources[index].fire(horizon))
+        return True
+
+    def advance_to(self, timestamp: float) -> None:
+        """
+        Moves the time forward to the given timestamp, firing the events due on the way.
+        """
+        self.advance(timestamp - self.now)
+
+
+class TickFeed():
+    """
+    Recorded quotes and trades of a symbol, applied to the exchange simulator as the virtual clock reaches them.
+    """
+
+    def __init__(self, simulator: ExchangeSimulator, symbol: str, ticks: dict):
+        """
+        Args:
+            simulator (ExchangeSimulator): Simulator receiving the ticks.
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+            ticks (dict): Sorted "ts" (seconds), "bid" and "ask" arrays, and optionally "price" of the trades,
+                NaN for quote-only ticks, and "bid_size" and "ask_size" at the top of the book.
+        """
+        self.simulator = simulator
+        self.symbol = symbol
+        self.ts = ticks['ts']
+        self.bid = ticks['bid']
+        self.ask = ticks['ask']
+        self.price = ticks.get('price')
+        self.bid_size = ticks.get('bid_size')
+        self.ask_size = ticks.get('ask_size')
+        self.index = 0
+
+    @property
+    def end(self) -> float:
+        return float(self.ts[-1])
+
+    def next_time(self) -> float:
+        return float(self.ts[self.index]) if self.index < len(self.ts) else None
+
+    def fire(self, horizon: float) -> float:
+        index = self.index
+        if not self.simulator.has_open_orders(self.symbol) and not self.simulator.has_open_stops(self.symbol):
+            # Nothing can fill or trail: only the last quote before the horizon matters
+            index = max(index, int(np.searchsorted(self.ts, horizon, side='right')) - 1)
+        self.index = index + 1
+        if self.bid_size is not None and self.ask_size is not None:
+            self.simulator.set_price(self.symbol, float(self.bid[index]), float(self.ask[index]),
+                                     float(self.bid_size[index]), float(self.ask_size[index]))
+        else:
+            self.simulator.set_price(self.symbol, float(self.bid[index]), float(self.ask[index]))
+        if self.price is not None and not math.isnan(self.price[index]):
+            self.simulator.trade(self.symbol, float(self.price[index]))
+        return float(self.ts[index])
+
+
+class Schedule():
+    """
+    Callbacks run when the virtual clock reaches their time.
+    """
+
+    def __init__(self):
+        self._events = []
+        self._sequence = itertools.count()
+
+    def add(self, timestamp: float, callback) -> None:
+        heapq.heappush(self._events, (timestamp, next(self._sequence), callback))
+
+    def next_time(self) -> float:
+        return self._events[0][0] if self._events else None
+
+    def fire(self, horizon: float) -> float:
+        timestamp, _, callback = heapq.heappop(self._events)
+        callback()
+        return timestamp
+
+
+class VirtualCancellationToken(CancellationToken):
+    """
+    Cancellation token whose waits move the virtual clock forward.
+    """
+
+    def __init__(self, generation: int, clock: VirtualClock):
+        super().__init__(generation)
+        self.clock = clock
+
+    def wait(self, timeout: float) -> bool:
+        return self.clock.advance(timeout, lambda: self.cancelled)
+
+
+class VirtualOrderTracker(OrderTracker):
+    """
+    Order tracker whose waits move the virtual clock forward until the order changes.
+    """
+
+    def __init__(self, stream, clock: VirtualClock):
+        super().__init__(stream)
+        self.clock = clock
+
+    def wait(self, order_id: str, status: str = None, timeout: float = None, token=None) -> dict:
+        def changed():
+            order = self._orders.get(order_id)
+            return order is not None and order.get('order_status') != status
+
+        self.clock.advance(timeout, lambda: changed() or (token is not None and token.cancelled))
+        with self._cond:
+            if not changed():
+                return None
+            return dict(self._orders[order_id])
+
+
+class ExecutionReplay():
+
+    def __init__(self, ticks: dict, coin_ticker: str = 'ETH', tick_size: float = 0.05, qty_step: float = 0.01,
+                 balance: float = 10000.0, latency: float = 0.05, jitter: float = 0.0, partial_fill_ratio: float = 1.0,
+                 touch_fill_probability: float = 0.1, trailing_stop: bool = False, ticker_settings: dict = None,
+                 execution_policy: dict = None, seed: int = None):
+        """
+        Installs the exchange simulator on a virtual clock and creates the BybitTicker of the replay.
+        The configuration file must hold the ticker, as for the live bot.
+
+        Args:
+            ticks (dict): Recorded market data, as read by load_ticks.
+            coin_ticker (str): Ticker of the configuration file, ex: "ETH".
+            tick_size (float): Price step of the symbol.
+            qty_step (float): Quantity step of the symbol.
+            balance (float): Initial wallet balance.
+            latency (float): Seconds of virtual time every exchange call takes.
+            jitter (float): Maximum random seconds added to the latency.
+            partial_fill_ratio (float): Share of the remaining quantity filled on each match.
+            touch_fill_probability (float): Probability that an order at the price of a quote or trade fills.
+            trailing_stop (bool): Monitor the position with check_for_stop_limit_tsl after each entry.
+            ticker_settings (dict): BybitTicker attributes to override, ex: {"trade_market_on_slippage_perc": 0.05}.
+            execution_policy (dict): Execution policy replacing the one of the configuration file,
+                ex: {"name": "adaptive", "imbalance_cross": 0.6}.
+            seed (int): Seed of the simulator, for reproducible runs.
+        """
+        collateral = MainConfig.getinstance().get_user_data()['collateral']
+        self.symbol = coin_ticker + collateral
+        self.trailing_stop = trailing_stop
+        self.clock = VirtualClock(float(ticks['ts'][0]))
+        self.simulator = ExchangeSimulator(
+            symbols={self.symbol: (float(ticks['bid'][0]), tick_size, qty_step)},
+            collateral=collateral,
+            balance=balance,
+            latency=latency,
+            jitter=jitter,
+            partial_fill_ratio=partial_fill_ratio,
+            touch_fill_probability=touch_fill_probability,
+            seed=seed,
+            clock=self.clock
+        )
+        self.simulator.install()
+        OrderTracker.setinstance(VirtualOrderTracker(self.simulator.private_stream, self.clock))
+
+        self.feed = TickFeed(self.simulator, self.symbol, ticks)
+        self.schedule = Schedule()
+        self.clock.sources.extend((self.feed, self.schedule))
+        self.clock.advance(0)
+
+        self.ticker = BybitTicker(coin_ticker)
+        self.ticker.warm_up()
+        self.ticker.cancellation = CancellationSource(lambda generation: VirtualCancellationToken(generation, self.clock))
+        for name, value in (ticker_settings or dict()).items():
+            setattr(self.ticker, name, value)
+        if execution_policy is not None:
+            self.ticker.execution_policy = create_policy(execution_policy)
+        # Closes are attributed to their own phase, whichever procedure forces them
+        force_stop_limit_order = self.ticker.force_stop_limit_order
+
+        def force_stop_limit_order_phase(position_data):
+            with self._phase('close'):
+                return force_stop_limit_order(position_data)
+
+        self.ticker.force_stop_limit_order = force_stop_limit_order_phase
+        self.ticker.order_tracker.add_execution_listener(self._on_execution)
+
+        self.executions = []
+        self.signals = []
+        self.unfinished = False
+        self._current = None
+        self._wall_time = 0.0
+        self._virtual_time = 0.0
+
+    def run(self, signals: list) -> dict:
+        """
+        Replays the signals in order.
+
+        Args:
+            signals (list): (timestamp, side, comment) tuples sorted by time, ex: (1672531200.0, "Buy", "").
+
+        Returns:
+            dict: The summary of the replay.
+        """
+        started_at = time.perf_counter()
+        started_clock = self.clock.now
+        for index, (timestamp, side, comment) in enumerate(signals):
+            if timestamp > self.feed.end:
+                break
+            self.clock.advance_to(timestamp)
+            # The next signal, or the end of the data, supersedes the procedures of this one
+            superseded_at = signals[index + 1][0] if index + 1 < len(signals) else self.feed.end
+            self.schedule.add(min(superseded_at, self.feed.end), self.ticker.cancel_procedure)
+            try:
+                self._handle_signal(index + 1, timestamp, side, comment)
+            except ReplayExhausted:
+                self.unfinished = True
+                break
+        self._wall_time += time.perf_counter() - started_at
+        self._virtual_time += self.clock.now - started_clock
+        return self.summary()
+
+    def _handle_signal(self, signal_id: int, timestamp: float, side: str, comment: str) -> None:
+        # Same decisions as AlertManager._handle_alert, with the close run before the entry
+        ticker = self.ticker
+        side = side.capitalize()
+        self.signals.append({'signal_id': signal_id, 'ts': float(timestamp), 'side': side,
+                             'delay': float(self.clock.now - timestamp)})
+        ticker.journal.signal(ticker.coin_ticker, side, signal_id)
+        reference = self._mid_price()
+
+        with self._phase('signal', signal_id):
+            long_position, short_position = ticker.fetch_ticker_positions()
+            if 'close' in comment:
+                position = long_position if side == 'Sell' else short_position
+                if float(position['size']) > 0:
+                    ticker.cancel_all_trades_limit(position)
+                return
+
+            position, opposite = (long_position, short_position) if side == 'Buy' else (short_position, long_position)
+            if float(position['size']) > 0:
+                return
+            if float(opposite['size']) > 0:
+                ticker.cancel_all_trades_limit(opposite)
+
+            with self._phase('entry', reference=reference):
+                ticker.execute_limit_order_procedure(side)
+            token = ticker.cancellation.current
+            if self.trailing_stop and not token.cancelled:
+                long_position, short_position = ticker.fetch_ticker_positions()
+                position = long_position if side == 'Buy' else short_position
+                if float(position['size']) > 0:
+                    ticker.check_for_stop_limit_tsl(side, token)
+
+    @contextmanager
+    def _phase(self, phase: str, signal_id: int = None, reference: float = None):
+        previous = self._current
+        self._current = {
+            'phase': phase,
+            'signal_id': signal_id if signal_id is not None else previous['signal_id'],
+            'reference': reference if reference is not None else self._mid_price(),
+            'started_at': self.clock.now,
+        }
+        try:
+            yield
+        finally:
+            self._current = previous
+
+    def _mid_price(self) -> float:
+        bid, ask = self.simulator.quote(self.symbol)
+        return (bid + ask) / 2
+
+    def _on_execution(self, execution: dict) -> None:
+        # Fills outside the procedures are those of the stops set on the exchange
+        current = self._current or {'phase': 'stop', 'signal_id': self.signals[-1]['signal_id'] if self.signals else 0,
+                                    'reference': self._mid_price(), 'started_at': self.clock.now}
+        price = float(execution['price'])
+        direction = 1 if execution['side'] == 'Buy' else -1
+        self.executions.append({
+            'ts': self.clock.now,
+            'signal_id': current['signal_id'],
+            'phase': current['phase'],
+            'side': execution['side'],
+            'price': price,
+            'qty': float(execution['exec_qty']),
+            'fee': float(execution['exec_fee']),
+            'is_maker': bool(execution['is_maker']),
+            'reference': current['reference'],
+            'slippage_bps': direction * (price - current['reference']) / current['reference'] * 10000,
+            'elapsed': self.clock.now - current['started_at'],
+        })
+
+    def summary(self) -> dict:
+        """
+        Returns the maker/taker mix, fees and slippage of the entries and closes, and the replay speed.
+
+        Slippage is measured against the mid price at the signal for entries, and at the start of
+        force_stop_limit_order for closes; positive values are costs. Stops triggered on the exchange, with the
+        EXCHANGE_TSL and EXCHANGE_SLTP risk management, are reported apart, against the mid price at the fill.
+        """
+        phases = dict()
+        for phase in ('entry', 'close', 'stop'):
+            executions = [execution for execution in self.executions if execution['phase'] == phase]
+            qty = sum(execution['qty'] for execution in executions)
+            notional = sum(execution['qty'] * execution['price'] for execution in executions)
+            phases[phase] = {
+                'executions': len(executions),
+                'maker_ratio': sum(execution['qty'] for execution in executions if execution['is_maker']) / qty
+                if qty else None,
+                'slippage_bps': sum(execution['slippage_bps'] * execution['qty'] for execution in executions) / qty
+                if qty else None,
+                'fee_bps': sum(execution['fee'] for execution in executions) / notional * 10000 if notional else None,
+                'max_elapsed': max((execution['elapsed'] for execution in executions), default=None),
+            }
+        return {
+            'signals': len(self.signals),
+            'unfinished': self.unfinished,
+            'limit_count': self.ticker.limit_count,
+            'market_count': self.ticker.market_count,
+            'sl_count': self.ticker.sl_count,
+            'reversal_count': self.ticker.reversal_count,
+            'entry': phases['entry'],
+            'close': phases['close'],
+            'stop': phases['stop'],
+            'exchange_calls': sum(self.simulator.calls.values()),
+            'virtual_seconds': self._virtual_time,
+            'wall_seconds': self._wall_time,
+            'speedup': self._virtual_time / self._wall_time if self._wall_time else None,
+        }
+
+    def write_csv(self, path: str) -> None:
+        """
+        Writes every execution of the replay, with its phase, reference price and slippage.
+        """
+        if not self.executions:
+            return
+        with open(path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=list(self.executions[0]))
+            writer.writeheader()
+            writer.writerows(self.executions)
+
+
+def seconds(timestamps: np.ndarray) -> np.ndarray:
+    # Timestamps in milliseconds, as recorded from Bybit, are converted to seconds
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    return timestamps / 1000 if len(timestamps) and timestamps[0] > 1e11 else timestamps
+
+
+def load_ticks(path: str) -> dict:
+    """
+    Loads recorded market data from a CSV file with a header row and ts, bid and ask columns,
+    plus an optional price column with the trades, empty for quote-only rows, and optional
+    bid_size and ask_size columns with the sizes at the top of the book.
+    Timestamps are seconds or milliseconds.
+
+    Returns:
+        dict: Column arrays sorted by time.
+    """
+    data = np.genfromtxt(path, delimiter=',', names=True, dtype=np.float64)
+    order = np.argsort(data['ts'], kind='stable')
+    ticks = {name: np.ascontiguousarray(data[name][order]) for name in data.dtype.names}
+    ticks['ts'] = seconds(ticks['ts'])
+    return ticks
+
+
+def load_signals(path: str) -> list:
+    """
+    Loads signals from a CSV file with a header row and ts and side columns, plus an optional comment
+    column holding "close" for close signals, as the TradingView alerts.
+
+    Returns:
+        list: (timestamp, side, comment) tuples sorted by time.
+    """
+    with open(path, 'r', newline='') as file:
+        rows = list(csv.DictReader(file))
+    timestamps = seconds([float(row['ts']) for row in rows])
+    return sorted(((float(timestamp), row['side'], row.get('comment') or '') for timestamp, row in zip(timestamps, rows)),
+                  key=lambda signal: signal[0])
+
+
+def signals_from_trades(trades: np.ndarray, timestamps: np.ndarray) -> list:
+    """
+    Converts the trades of a PineBacktester run into the alerts the strategy would have sent:
+    an entry per trade, and a close for the trades closed by the indicator.
+
+    Args:
+        trades (np.ndarray): BacktestResult.trades.
+        timestamps (np.ndarray): Time of every bar, in seconds.
+    """
+    signals = []
+    for trade in trades:
+        side, counter_side = ('Buy', 'Sell') if trade['direction'] > 0 else ('Sell', 'Buy')
+        signals.append((float(timestamps[trade['entry_index']]), side, ''))
+        if trade['exit_reason'] == CLOSE_SIGNAL:
+            signals.append((float(timestamps[trade['exit_index']]), counter_side, 'close'))
+    return sorted(signals, key=lambda signal: signal[0])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('ticks', help='CSV file with ts, bid, ask and optionally price, bid_size and ask_size columns')
+    parser.add_argument('signals', help='CSV file with ts, side and optionally comment columns')
+    parser.add_argument('--config', default=MainConfig.CONFIG_FILENAME)
+    parser.add_argument('--ticker', default='ETH')
+    parser.add_argument('--tick-size', type=float, default=0.05)
+    parser.add_argument('--qty-step', type=float, default=0.01)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--partial-fill-ratio', type=float, default=1.0)
+    parser.add_argument('--touch-fill-probability', type=float, default=0.1)
+    parser.add_argument('--trailing-stop', action='store_true', help='monitor positions with the trailing stop')
+    parser.add_argument('--risk-management', choices=BybitTicker.RISK_MANAGEMENT,
+                        help='risk management replacing the one of the config file, ex: EXCHANGE_TSL')
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE',
+                        help='ticker setting, ex: trade_market_on_slippage_perc=0.05')
+    parser.add_argument('--policy', help='execution policy replacing the one of the config file, ex: adaptive')
+    parser.add_argument('--policy-param', action='append', default=[], metavar='NAME=VALUE',
+                        help='execution policy setting, ex: imbalance_cross=0.6')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='CSV file receiving every execution')
+    args = parser.parse_args()
+
+    execution_policy = None
+    if args.policy or args.policy_param:
+        execution_policy = {name: float(value) for name, value in (param.split('=', 1) for param in args.policy_param)}
+        execution_policy['name'] = args.policy or 'static'
+
+    ticker_settings = {name: float(value) for name, value in (setting.split('=', 1) for setting in args.set)}
+    if args.risk_management:
+        ticker_settings['risk_management'] = args.risk_management
+
+    MainConfig(args.config)
+    replay = ExecutionReplay(
+        load_ticks(args.ticks),
+        coin_ticker=args.ticker,
+        tick_size=args.tick_size,
+        qty_step=args.qty_step,
+        latency=args.latency_ms / 1000,
+        partial_fill_ratio=args.partial_fill_ratio,
+        touch_fill_probability=args.touch_fill_probability,
+        trailing_stop=args.trailing_stop,
+        ticker_settings=ticker_settings,
+        execution_policy=execution_policy,
+        seed=args.seed
+    )
+    for key, value in replay.run(load_signals(args.signals)).items():
+        print(f'{key}: {value}')
+    if args.output:
+        replay.write_csv(args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+HTTP session shared by every ticker, with a rate-limit governor.
+
+All tickers go through a single pybit session whose keep-alive connection pool
+is bounded, instead of one session per ticker. Every call first takes a token
+from the bucket of its endpoint class; the buckets are kept in line with the
+rate_limit_status and rate_limit_reset_ms values returned by the exchange.
+Cancels and reduce-only orders may use a reserve that polling reads cannot,
+so closing a position is never starved by monitoring loops. Every call is
+timed and counted by endpoint and ret_code in the metrics registry.
+"""
+import threading
+import time
+
+from pybit import HTTP
+from requests.adapters import HTTPAdapter
+
+from config.main_config import MainConfig
+from metrics import RequestMetrics
+
+
+class RateLimitBucket():
+
+    def __init__(self, capacity: int, period: float, reserve: int = 0):
+        """
+        Args:
+            capacity (int): Number of requests allowed per period.
+            period (float): Period in seconds.
+            reserve (int): Tokens only high priority requests may take.
+        """
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.reserve = reserve
+        self.tokens = float(capacity)
+        self.blocked_until = 0
+        self._updated_at = time.monotonic()
+        self._cond = threading.Condition()
+
+    def acquire(self, high_priority: bool = False) -> float:
+        """
+        Takes a token, blocking until one is available.
+
+        Args:
+            high_priority (bool): Whether the request may use the reserved tokens.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        started_at = time.monotonic()
+        with self._cond:
+            wait = self._take(high_priority)
+            while wait > 0:
+                self._cond.wait(wait)
+                wait = self._take(high_priority)
+        return time.monotonic() - started_at
+
+    def try_acquire(self, high_priority: bool = False) -> float:
+        """
+        Takes a token if one is available, without blocking.
+
+        Args:
+            high_priority (bool): Whether the request may use the reserved tokens.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds to wait before trying again.
+        """
+        with self._cond:
+            return self._take(high_priority)
+
+    def sync(self, remaining: int, reset_ms: int) -> None:
+        """
+        Aligns the bucket with the limits reported by the exchange.
+
+        Args:
+            remaining (int): Requests left in the current window (rate_limit_status).
+            reset_ms (int): Time at which the window resets, in epoch milliseconds (rate_limit_reset_ms).
+        """
+        with self._cond:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, float(remaining))
+            if remaining <= 0 and reset_ms:
+                wait = max(reset_ms / 1000 - time.time(), 0)
+                self.blocked_until = time.monotonic() + wait
+            self._cond.notify_all()
+
+    def _take(self, high_priority: bool) -> float:
+        # Must be called with the lock held
+        required = 1 if high_priority else 1 + self.reserve
+        now = time.monotonic()
+        self._refill(now)
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= required:
+            self.tokens -= 1
+            return 0
+        return (required - self.tokens) / self.rate
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+
+class RateLimitGovernor():
+
+    # Endpoint classes: (requests, period in seconds, reserve for high priority requests)
+    LIMITS = {
+        'order': (100, 60, 10),
+        'cancel': (100, 60, 0),
+        'query': (600, 60, 60),
+        'account': (120, 60, 12),
+        'public': (50, 1, 5),
+    }
+
+    ENDPOINT_CLASSES = {
+        'place_active_order': 'order',
+        'replace_active_order': 'order',
+        'set_leverage': 'order',
+        'set_trading_stop': 'order',
+        'cancel_active_order': 'cancel',
+        'cancel_all_active_orders': 'cancel',
+        'query_active_order': 'query',
+        'get_active_order': 'query',
+        'my_position': 'account',
+        'get_wallet_balance': 'account',
+    }
+
+    def __init__(self, limits: dict = None):
+        """
+        Args:
+            limits (dict): Overrides for LIMITS, keyed by endpoint class.
+        """
+        self.buckets = {name: RateLimitBucket(*limit) for name, limit in dict(self.LIMITS, **(limits or {})).items()}
+
+    def endpoint_class(self, method: str) -> str:
+        return self.ENDPOINT_CLASSES.get(method, 'public')
+
+    def is_high_priority(self, method: str, kwargs: dict) -> bool:
+        """
+        Cancels and reduce-only orders close exposure and are served first.
+        """
+        return self.endpoint_class(method) == 'cancel' or bool(kwargs.get('reduce_only'))
+
+    def acquire(self, method: str, kwargs: dict) -> float:
+        """
+        Blocks until the call is allowed by its endpoint class.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        return self.buckets[self.endpoint_class(method)].acquire(self.is_high_priority(method, kwargs))
+
+    def try_acquire(self, method: str, kwargs: dict) -> float:
+        """
+        Non-blocking variant of acquire, for callers running on an event loop.
+
+        Returns:
+            float: 0 if the call is allowed, otherwise the seconds to wait before trying again.
+        """
+        return self.buckets[self.endpoint_class(method)].try_acquire(self.is_high_priority(method, kwargs))
+
+    def update(self, method: str, response) -> None:
+        """
+        Reads the rate limit fields of an exchange response.
+        """
+        if isinstance(response, dict) and 'rate_limit_status' in response:
+            self.buckets[self.endpoint_class(method)].sync(
+                int(response['rate_limit_status']),
+                int(response.get('rate_limit_reset_ms') or 0)
+            )
+
+
+class SharedSession():
+    """
+    Proxy to a single pybit session, taking a rate-limit token before every call.
+    """
+
+    ENDPOINT = 'https://api.bybit.com'
+
+    # Maximum number of keep-alive connections to the exchange
+    POOL_SIZE = 16
+
+    _instance = None
+
+    def __init__(self, session=None, governor: RateLimitGovernor = None):
+        """
+        Args:
+            session: Exchange session to share; a pybit HTTP session is created from the config file if omitted.
+            governor (RateLimitGovernor): Rate limit governor; a default one is created if omitted.
+        """
+        if session is None:
+            user_data = MainConfig.getinstance().get_user_data()
+            session = HTTP(self.ENDPOINT, api_key=user_data['api_key'], api_secret=user_data['api_secret'])
+        self.session = session
+        self.governor = governor if governor is not None else RateLimitGovernor()
+        self.metrics = RequestMetrics()
+        self._mount_pool()
+
+    @classmethod
+    def getinstance(cls) -> 'SharedSession':
+        """
+        Returns the session shared by all tickers, creating it on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, session: 'SharedSession') -> None:
+        """
+        Replaces the shared session, e.g. with one wrapping a local exchange.
+        """
+        cls._instance = session
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.session, name)
+        if not callable(attribute):
+            return attribute
+
+        def governed_call(*args, **kwargs):
+            waited = self.governor.acquire(name, kwargs)
+            self.metrics.rate_limit_wait.observe(waited, endpoint_class=self.governor.endpoint_class(name))
+            started_at = time.monotonic()
+            try:
+                response = attribute(*args, **kwargs)
+            except Exception as ex:
+                self.metrics.record(name, time.monotonic() - started_at, exception=ex)
+                raise
+            self.metrics.record(name, time.monotonic() - started_at, response)
+            self.governor.update(name, response)
+            return response
+
+        return governed_call
+
+    def _mount_pool(self) -> None:
+        # pybit keeps a requests.Session as 'client'; bound its keep-alive pool
+        client = getattr(self.session, 'client', None)
+        if client is not None and hasattr(client, 'mount'):
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.POOL_SIZE, pool_block=True)
+            client.mount('https://', adapter)
@@ -0,0 +1,164 @@
+"""
+Registry of instrument metadata, indexed by symbol name.
+
+The whole symbol list is downloaded once and refreshed in the background when
+its TTL expires, so order placement never pays for a query_symbol call. The
+list is persisted to disk and reused on the next start.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+from message_handler import log
+
+
+class InstrumentRegistry():
+
+    CACHE_FILENAME = './app/cache/instruments.json'
+
+    # Seconds before the symbol list is downloaded again
+    TTL = 3600
+
+    # Minimum seconds between downloads triggered by unknown symbols or failed refreshes
+    RETRY_INTERVAL = 60
+
+    _instance = None
+
+    def __init__(self, session, cache_file: str = CACHE_FILENAME, ttl: float = TTL):
+        """
+        Args:
+            session: Exchange session providing query_symbol.
+            cache_file (str): File used to persist the symbol list between runs.
+            ttl (float): Seconds before the symbol list is refreshed.
+        """
+        self.session = session
+        self.cache_file = cache_file
+        self.ttl = ttl
+        self.loaded_at = 0
+        self._last_attempt = 0
+        self._instruments = dict()
+        # Reentrant: the first load indexes the symbol list while holding it
+        self._lock = threading.RLock()
+        self._refresher = None
+
+    @classmethod
+    def getinstance(cls, session) -> 'InstrumentRegistry':
+        """
+        Returns the registry shared by all tickers, creating it with the given session on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls(session)
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, registry: 'InstrumentRegistry') -> None:
+        """
+        Replaces the shared registry.
+        """
+        cls._instance = registry
+
+    def get(self, symbol: str) -> dict:
+        """
+        Returns the metadata of a symbol.
+
+        An unknown symbol triggers a single refresh, in case it was listed after the last download.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+
+        Returns:
+            dict: The symbol details as returned by query_symbol, or None if the symbol does not exist.
+        """
+        self._ensure_loaded()
+        instrument = self._instruments.get(symbol)
+        if instrument is None \
+                and time.time() - self._last_attempt > self.RETRY_INTERVAL \
+                and self.refresh():
+            instrument = self._instruments.get(symbol)
+        return instrument
+
+    def qty_step(self, symbol: str) -> float:
+        return float(self._filter(symbol, 'lot_size_filter').get('qty_step', 0.0))
+
+    def min_qty(self, symbol: str) -> float:
+        return float(self._filter(symbol, 'lot_size_filter').get('min_trading_qty', 0.0))
+
+    def tick_size(self, symbol: str) -> float:
+        return float(self._filter(symbol, 'price_filter').get('tick_size', 0.0))
+
+    def max_leverage(self, symbol: str) -> float:
+        return float(self._filter(symbol, 'leverage_filter').get('max_leverage', 0.0))
+
+    def refresh(self) -> bool:
+        """
+        Downloads the symbol list and persists it to disk.
+
+        Returns:
+            bool: True if the list was updated.
+        """
+        self._last_attempt = time.time()
+        try:
+            response = self.session.query_symbol()
+        except Exception as ex:
+            log(logging.ERROR, 'Failed to download symbol list: %s', ex)
+            return False
+        if response['ret_code'] != 0:
+            log(logging.ERROR, 'Failed to download symbol list: %s', response['ret_msg'])
+            return False
+        self._index(response['result'], time.time())
+        self._save(response['result'])
+        return True
+
+    def _filter(self, symbol: str, name: str) -> dict:
+        return (self.get(symbol) or {}).get(name, {})
+
+    def _index(self, symbols: list, loaded_at: float) -> None:
+        instruments = {symbol['name']: symbol for symbol in symbols}
+        with self._lock:
+            self._instruments = instruments
+            self.loaded_at = loaded_at
+
+    def _ensure_loaded(self) -> None:
+        if self._instruments:
+            return
+        # Concurrent warm ups wait for a single load instead of each downloading the list
+        with self._lock:
+            if self._instruments:
+                return
+            # Nothing loaded after a failed download: wait before hitting the disk and the exchange again
+            if time.time() - self._last_attempt <= self.RETRY_INTERVAL:
+                return
+            # A persisted list is used right away even if expired; the refresher replaces it
+            if not self._load():
+                self.refresh()
+            if self._refresher is None:
+                self._refresher = threading.Thread(target=self._refresh_loop, daemon=True)
+                self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(max(self.loaded_at + self.ttl - time.time(), self.RETRY_INTERVAL))
+            if time.time() - self.loaded_at >= self.ttl:
+                self.refresh()
+
+    def _load(self) -> bool:
+        # Warm start from the symbol list persisted by a previous run
+        try:
+            with open(self.cache_file, 'r') as file:
+                cache = json.loads(file.read())
+        except (OSError, ValueError):
+            return False
+        self._index(cache['symbols'], cache['loaded_at'])
+        return True
+
+    def _save(self, symbols: list) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_file = self.cache_file + '.tmp'
+            with open(tmp_file, 'w') as file:
+                file.write(json.dumps({'loaded_at': self.loaded_at, 'symbols': symbols}))
+            os.replace(tmp_file, self.cache_file)
+        except OSError as ex:
+            log(logging.ERROR, 'Failed to persist symbol list: %s', ex)
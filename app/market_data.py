@@ -0,0 +1,415 @@
+"""
+Local store of historical klines and trades for backtests and replays.
+
+Each dataset, the klines of a symbol and interval or the trades of a symbol,
+is a directory holding one raw little-endian file per column and a JSON
+header. Rows are only appended, sorted by their "ts" column (milliseconds),
+which is the time index: time ranges are found by binary search on the
+memory-mapped timestamps. Readers get NumPy views of the memory-mapped files,
+so opening years of data costs a few system calls and pages are only read
+when they are used.
+
+The downloader only fetches what the store is missing. Klines come from the
+kline endpoint, trades from the daily files of the Bybit public archive, and
+LocalFileSource reads the same data from a directory, for tests and offline
+use. Ranges older than the first stored row are backfilled by rewriting the
+dataset.
+
+Usage: python app/market_data.py klines ETHUSDT --interval 1 --start 2023-01-01 --end 2024-01-01
+       python app/market_data.py trades ETHUSDT --start 2023-01-01 --end 2023-01-31
+       python app/market_data.py info ETHUSDT
+"""
+import argparse
+import csv
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import urllib.error
+import urllib.request
+
+import numpy as np
+from pybit import HTTP
+
+from http_pool import SharedSession
+from message_handler import log
+
+# Columns of the datasets, in file order
+KLINE_COLUMNS = (('ts', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+                 ('volume', '<f8'), ('turnover', '<f8'))
+TRADE_COLUMNS = (('ts', '<i8'), ('price', '<f8'), ('qty', '<f8'), ('side', '<i1'))
+
+# Milliseconds of the kline intervals of Bybit
+INTERVALS = {
+    '1': 60000, '3': 180000, '5': 300000, '15': 900000, '30': 1800000, '60': 3600000, '120': 7200000,
+    '240': 14400000, '360': 21600000, '720': 43200000, 'D': 86400000, 'W': 604800000,
+}
+
+DAY_MS = 86400000
+
+
+class Dataset():
+    """
+    Append-only columnar table, one file per column, sorted by its "ts" column.
+    """
+
+    HEADER_FILENAME = 'columns.json'
+
+    def __init__(self, directory: str, columns: tuple):
+        """
+        Args:
+            directory (str): Directory of the dataset, created if missing.
+            columns (tuple): (name, dtype) of every column, the first one being "ts".
+        """
+        self.directory = directory
+        self.columns = columns
+        os.makedirs(directory, exist_ok=True)
+        header_path = os.path.join(directory, self.HEADER_FILENAME)
+        header = [[name, dtype] for name, dtype in columns]
+        if os.path.exists(header_path):
+            with open(header_path, 'r') as file:
+                if json.load(file) != header:
+                    raise ValueError(f'{directory} holds different columns')
+        else:
+            with open(header_path, 'w') as file:
+                json.dump(header, file)
+        self._repair()
+
+    def __len__(self) -> int:
+        return min(os.path.getsize(self._path(name)) // np.dtype(dtype).itemsize
+                   if os.path.exists(self._path(name)) else 0
+                   for name, dtype in self.columns)
+
+    def first_ts(self) -> int:
+        """
+        Returns the timestamp of the first row, or None if the dataset is empty.
+        """
+        return self._read_ts(0) if len(self) else None
+
+    def last_ts(self) -> int:
+        """
+        Returns the timestamp of the last row, or None if the dataset is empty.
+        """
+        rows = len(self)
+        return self._read_ts(rows - 1) if rows else None
+
+    def append(self, columns: dict) -> int:
+        """
+        Appends rows, dropping the ones not newer than the last stored row.
+
+        Args:
+            columns (dict): Arrays of every column, sorted by "ts".
+
+        Returns:
+            int: Number of rows appended.
+        """
+        ts = np.asarray(columns['ts'], dtype=np.int64)
+        last = self.last_ts()
+        keep = slice(int(np.searchsorted(ts, last, side='right')) if last is not None else 0, len(ts))
+        if keep.start >= len(ts):
+            return 0
+        for name, dtype in self.columns:
+            with open(self._path(name), 'ab') as file:
+                file.write(np.ascontiguousarray(np.asarray(columns[name])[keep], dtype=dtype).tobytes())
+        return len(ts) - keep.start
+
+    def replace(self, columns: dict) -> None:
+        """
+        Rewrites the dataset with the given rows; every column file is swapped in once fully written.
+        """
+        for name, dtype in self.columns:
+            temp_path = self._path(name) + '.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+            os.replace(temp_path, self._path(name))
+
+    def view(self, start: int = None, end: int = None) -> dict:
+        """
+        Returns read-only views of the rows with start <= ts < end, backed by the memory-mapped files.
+
+        Args:
+            start (int): First timestamp, in milliseconds; the first row if omitted.
+            end (int): Timestamp after the last row, in milliseconds; the last row if omitted.
+
+        Returns:
+            dict: Array of every column.
+        """
+        rows = len(self)
+        if not rows:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in self.columns}
+        arrays = {name: np.memmap(self._path(name), dtype=dtype, mode='r', shape=(rows,))
+                  for name, dtype in self.columns}
+        ts = arrays['ts']
+        first = int(np.searchsorted(ts, start, side='left')) if start is not None else 0
+        last = int(np.searchsorted(ts, end, side='left')) if end is not None else rows
+        return {name: array[first:last] for name, array in arrays.items()}
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name + '.bin')
+
+    def _read_ts(self, row: int) -> int:
+        with open(self._path('ts'), 'rb') as file:
+            file.seek(row * 8)
+            return int(np.frombuffer(file.read(8), dtype='<i8')[0])
+
+    def _repair(self) -> None:
+        # An interrupted append may leave some columns longer than others
+        rows = len(self)
+        for name, dtype in self.columns:
+            path = self._path(name)
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+            elif os.path.getsize(path) > rows * np.dtype(dtype).itemsize:
+                os.truncate(path, rows * np.dtype(dtype).itemsize)
+
+
+class MarketDataStore():
+
+    DATA_DIRECTORY = './app/data'
+
+    def __init__(self, directory: str = DATA_DIRECTORY):
+        """
+        Args:
+            directory (str): Root directory of the store, with one directory per symbol.
+        """
+        self.directory = directory
+
+    def klines_dataset(self, symbol: str, interval: str = '1') -> Dataset:
+        return Dataset(os.path.join(self.directory, symbol, 'kline_' + interval), KLINE_COLUMNS)
+
+    def trades_dataset(self, symbol: str) -> Dataset:
+        return Dataset(os.path.join(self.directory, symbol, 'trades'), TRADE_COLUMNS)
+
+    def klines(self, symbol: str, interval: str = '1', start: int = None, end: int = None) -> dict:
+        """
+        Returns views of the stored klines, ex: store.klines("ETHUSDT")["close"].
+        The open, high, low and close views can be passed to PineBacktester.run as they are.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+            interval (str): Kline interval, as in INTERVALS.
+            start (int): First open time, in milliseconds.
+            end (int): Open time after the last kline, in milliseconds.
+        """
+        return self.klines_dataset(symbol, interval).view(start, end)
+
+    def trades(self, symbol: str, start: int = None, end: int = None) -> dict:
+        """
+        Returns views of the stored trades: ts, price, qty and side (1 for buys, -1 for sells).
+        """
+        return self.trades_dataset(symbol).view(start, end)
+
+
+def parse_trade_archive(data: bytes) -> dict:
+    """
+    Parses a daily trade file of the Bybit public archive: a CSV with timestamp (seconds), side, size and price.
+    """
+    reader = csv.DictReader(io.StringIO(data.decode('utf-8')))
+    rows = [(round(float(row['timestamp']) * 1000), float(row['price']), float(row['size']),
+             1 if row['side'] == 'Buy' else -1) for row in reader]
+    rows.sort(key=lambda row: row[0])
+    return {name: np.array([row[index] for row in rows], dtype=dtype)
+            for index, (name, dtype) in enumerate(TRADE_COLUMNS)}
+
+
+class BybitSource():
+    """
+    Klines from the kline endpoint and trades from the daily files of the public archive.
+    """
+
+    ARCHIVE_URL = 'https://public.bybit.com/trading/{symbol}/{symbol}{day}.csv.gz'
+
+    # Klines returned per request
+    KLINE_LIMIT = 200
+
+    def __init__(self, session=None):
+        """
+        Args:
+            session: Exchange session providing query_kline; an unauthenticated shared session if omitted.
+        """
+        self.session = session if session is not None else SharedSession(session=HTTP(SharedSession.ENDPOINT))
+
+    def fetch_klines(self, symbol: str, interval: str, start: int, end: int):
+        """
+        Yields the klines with start <= open time < end, as column arrays, one request at a time.
+        """
+        step = INTERVALS[interval]
+        while start < end:
+            response = self.session.query_kline(symbol=symbol, interval=interval, from_time=start // 1000,
+                                                limit=self.KLINE_LIMIT)
+            if response['ret_code'] != 0:
+                log(logging.ERROR, 'Failed to download klines: %s', response['ret_msg'])
+                return
+            rows = [row for row in response['result'] or [] if start <= row['open_time'] * 1000 < end]
+            if not rows:
+                return
+            yield {name: np.array([row['open_time'] * 1000 if name == 'ts' else float(row[name]) for row in rows],
+                                  dtype=dtype)
+                   for name, dtype in KLINE_COLUMNS}
+            start = rows[-1]['open_time'] * 1000 + step
+
+    def fetch_trades(self, symbol: str, day: datetime.date) -> dict:
+        """
+        Returns the trades of a UTC day, or None if the archive has no file for it yet.
+        """
+        url = self.ARCHIVE_URL.format(symbol=symbol, day=day.isoformat())
+        try:
+            with urllib.request.urlopen(url, timeout=60) as response:
+                return parse_trade_archive(gzip.decompress(response.read()))
+        except urllib.error.HTTPError as ex:
+            if ex.code == 404:
+                return None
+            raise
+
+
+class LocalFileSource():
+    """
+    Klines and trades read from a directory, laid out as <symbol>/kline_<interval>.csv, with ts (milliseconds),
+    open, high, low, close, volume and turnover columns, and <symbol>/<symbol><YYYY-MM-DD>.csv.gz trade files
+    in the format of the public archive.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def fetch_klines(self, symbol: str, interval: str, start: int, end: int):
+        path = os.path.join(self.directory, symbol, f'kline_{interval}.csv')
+        if not os.path.exists(path):
+            return
+        data = np.genfromtxt(path, delimiter=',', names=True, dtype=np.float64)
+        data = data[np.argsort(data['ts'], kind='stable')]
+        data = data[(data['ts'] >= start) & (data['ts'] < end)]
+        if len(data):
+            yield {name: data[name].astype(dtype) for name, dtype in KLINE_COLUMNS}
+
+    def fetch_trades(self, symbol: str, day: datetime.date) -> dict:
+        path = os.path.join(self.directory, symbol, f'{symbol}{day.isoformat()}.csv.gz')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            return parse_trade_archive(gzip.decompress(file.read()))
+
+
+class MarketDataDownloader():
+
+    def __init__(self, store: MarketDataStore, source):
+        """
+        Args:
+            store (MarketDataStore): Store receiving the data.
+            source: BybitSource or LocalFileSource.
+        """
+        self.store = store
+        self.source = source
+
+    def sync_klines(self, symbol: str, interval: str, start: int, end: int) -> int:
+        """
+        Downloads the klines of [start, end) missing from the store.
+
+        Returns:
+            int: Number of klines added.
+        """
+        dataset = self.store.klines_dataset(symbol, interval)
+        added = 0
+        first = dataset.first_ts()
+        if first is not None and start < first:
+            added += self._backfill(dataset, list(self.source.fetch_klines(symbol, interval, start, min(first, end))))
+        last = dataset.last_ts()
+        if last is not None:
+            start = max(start, last + INTERVALS[interval])
+        # Appended chunk by chunk, so an interrupted download resumes where it stopped
+        for chunk in self.source.fetch_klines(symbol, interval, start, end):
+            added += dataset.append(chunk)
+        return added
+
+    def sync_trades(self, symbol: str, start: datetime.date, end: datetime.date) -> int:
+        """
+        Downloads the trades of the UTC days from start to end, both included, missing from the store.
+        Days are added whole, and the download stops at the first day without a file.
+
+        Returns:
+            int: Number of trades added.
+        """
+        dataset = self.store.trades_dataset(symbol)
+        added = 0
+        first, last = dataset.first_ts(), dataset.last_ts()
+        if first is not None and start < self._day(first):
+            chunks = [self.source.fetch_trades(symbol, day) for day in self._days(start, self._day(first))]
+            added += self._backfill(dataset, [chunk for chunk in chunks if chunk is not None])
+        if last is not None:
+            start = max(start, self._day(last) + datetime.timedelta(days=1))
+        for day in self._days(start, end + datetime.timedelta(days=1)):
+            chunk = self.source.fetch_trades(symbol, day)
+            if chunk is None:
+                break
+            added += dataset.append(chunk)
+        return added
+
+    @staticmethod
+    def _backfill(dataset: Dataset, chunks: list) -> int:
+        # Older rows go in front of the stored ones, which requires rewriting the dataset
+        first = dataset.first_ts()
+        chunks = [{name: values[chunk['ts'] < first] for name, values in chunk.items()} for chunk in chunks]
+        chunks = [chunk for chunk in chunks if len(chunk['ts'])]
+        if not chunks:
+            return 0
+        stored = dataset.view()
+        dataset.replace({name: np.concatenate([chunk[name] for chunk in chunks] + [np.asarray(stored[name])])
+                         for name, _ in dataset.columns})
+        return sum(len(chunk['ts']) for chunk in chunks)
+
+    @staticmethod
+    def _day(timestamp: int) -> datetime.date:
+        return datetime.datetime.fromtimestamp(timestamp / 1000, datetime.timezone.utc).date()
+
+    @staticmethod
+    def _days(start: datetime.date, end: datetime.date):
+        day = start
+        while day < end:
+            yield day
+            day += datetime.timedelta(days=1)
+
+
+def timestamp_ms(day: datetime.date) -> int:
+    """
+    Returns the milliseconds timestamp of the start of a UTC day.
+    """
+    return int(datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp() * 1000)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('dataset', choices=('klines', 'trades', 'info'))
+    parser.add_argument('symbol', help='exchange symbol, ex: ETHUSDT')
+    parser.add_argument('--interval', default='1', choices=INTERVALS)
+    parser.add_argument('--start', type=datetime.date.fromisoformat, help='first UTC day, ex: 2023-01-01')
+    parser.add_argument('--end', type=datetime.date.fromisoformat, help='last UTC day, included; today by default')
+    parser.add_argument('--directory', default=MarketDataStore.DATA_DIRECTORY)
+    parser.add_argument('--source-dir', help='read from a local directory instead of Bybit')
+    args = parser.parse_args()
+
+    store = MarketDataStore(args.directory)
+    if args.dataset == 'info':
+        for name, dataset in (('klines ' + args.interval, store.klines_dataset(args.symbol, args.interval)),
+                              ('trades', store.trades_dataset(args.symbol))):
+            first, last = dataset.first_ts(), dataset.last_ts()
+            span = f'{MarketDataDownloader._day(first)} to {MarketDataDownloader._day(last)}' if first is not None else '-'
+            print(f'{name}: {len(dataset)} rows, {span}')
+        return
+
+    if args.start is None:
+        parser.error('--start is required')
+    end = args.end or datetime.datetime.now(datetime.timezone.utc).date()
+    source = LocalFileSource(args.source_dir) if args.source_dir else BybitSource()
+    downloader = MarketDataDownloader(store, source)
+    if args.dataset == 'klines':
+        added = downloader.sync_klines(args.symbol, args.interval, timestamp_ms(args.start),
+                                       timestamp_ms(end + datetime.timedelta(days=1)))
+    else:
+        added = downloader.sync_trades(args.symbol, args.start, end)
+    print(f'{added} {args.dataset} added')
+
+
+if __name__ == '__main__':
+    main()
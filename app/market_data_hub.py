@@ -0,0 +1,260 @@
+"""
+Top of book shared by every order procedure of the process.
+
+Procedures subscribe to the symbols they trade for as long as they run. The
+first subscription to a symbol starts its depth stream, and the stream is
+dropped once the symbol has had no subscriber for LINGER seconds, so a close
+followed by an entry keeps the same feed. Any number of procedures on the
+same symbol, such as an entry chase and the close of the opposite position,
+read the same top of book: it is built once per change by the depth stream,
+so a read is a single attribute access that allocates nothing. Procedures
+may also block until the top of book changes instead of polling it.
+
+While the stream of a symbol is not in sync, the top of book is fetched over
+REST, and concurrent readers of the same symbol share a single request.
+"""
+import threading
+
+from order_book import OrderBookFeed
+
+
+class MarketDataHub():
+
+    # Seconds a symbol stays subscribed once its last subscription is released
+    LINGER = 30
+
+    _instance = None
+
+    def __init__(self, session, feed: OrderBookFeed = None, linger: float = LINGER):
+        """
+        Args:
+            session: Exchange session, usually the SharedSession, for the REST order book.
+            feed (OrderBookFeed): Depth stream feed; the shared feed if omitted.
+            linger (float): Seconds a symbol without subscribers keeps its stream; 0 drops it at once.
+        """
+        self.session = session
+        self.feed = feed if feed is not None else OrderBookFeed.getinstance()
+        self.feed.add_listener(self._on_update)
+        self.linger = linger
+        self.rest_fetches = 0
+        self._channels = dict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def getinstance(cls, session) -> 'MarketDataHub':
+        """
+        Returns the hub shared by all tickers, creating it with the given session on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls(session)
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, hub: 'MarketDataHub') -> None:
+        """
+        Replaces the shared hub; None creates a new one on the next getinstance.
+        """
+        cls._instance = hub
+
+    def subscribe(self, symbol: str) -> 'Subscription':
+        """
+        Keeps the depth stream of a symbol running until the subscription is released, ex:
+        with hub.subscribe("ETHUSDT"): ...
+
+        Returns:
+            Subscription: The subscription, to release once the procedure ends.
+        """
+        channel = self._channel(symbol)
+        # The feed is (un)subscribed under the lock, so a lingering drop cannot race a new subscription
+        with self._lock:
+            channel.refcount += 1
+            if channel.drop_timer is not None:
+                channel.drop_timer.cancel()
+                channel.drop_timer = None
+            if not channel.subscribed:
+                channel.subscribed = True
+                book = self.feed.subscribe(symbol)
+                # The book may already be in sync when it was subscribed outside the hub
+                with channel.cond:
+                    if channel.top is None:
+                        channel.top = book.best_bid_ask()
+        return Subscription(self, symbol)
+
+    def release(self, symbol: str) -> None:
+        """
+        Releases a subscription; the stream of the symbol is dropped after the linger without subscribers.
+        """
+        channel = self._channel(symbol)
+        with self._lock:
+            channel.refcount -= 1
+            if channel.refcount > 0 or not channel.subscribed:
+                return
+            if self.linger <= 0:
+                self._unsubscribe(symbol, channel)
+                return
+            channel.drop_timer = threading.Timer(self.linger, self._drop, args=(symbol,))
+            channel.drop_timer.daemon = True
+            channel.drop_timer.start()
+
+    def subscribers(self, symbol: str) -> int:
+        """
+        Returns the number of active subscriptions to a symbol.
+        """
+        channel = self._channels.get(symbol)
+        return channel.refcount if channel is not None else 0
+
+    def peek(self, symbol: str) -> tuple:
+        """
+        Returns the best buy and sell levels of the depth stream, without any request.
+
+        Returns:
+            tuple: (best_buy, best_sell), shaped like the REST order book entries, or None while the
+                stream of the symbol is not in sync.
+        """
+        channel = self._channels.get(symbol)
+        return channel.top if channel is not None else None
+
+    def top_of_book(self, symbol: str) -> tuple:
+        """
+        Returns the best buy and sell levels of a symbol, from the depth stream when it is in sync, otherwise
+        from a REST order book shared with the concurrent readers of the symbol.
+
+        Returns:
+            tuple: (best_buy, best_sell), shaped like the REST order book entries.
+        """
+        channel = self._channel(symbol)
+        top = channel.top
+        if top is not None:
+            return top
+        return self._fetch(symbol, channel)
+
+    def wait_for_update(self, symbol: str, top: tuple, timeout: float = None) -> tuple:
+        """
+        Blocks until the top of book of the depth stream differs from the given one.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+            top (tuple): Top of book last read by the caller.
+            timeout (float): Maximum seconds to wait.
+
+        Returns:
+            tuple: The new top of book, or None if it did not change before the timeout or the stream is not in sync.
+        """
+        channel = self._channel(symbol)
+        with channel.cond:
+            channel.cond.wait_for(lambda: channel.top is not top, timeout)
+            return channel.top if channel.top is not top else None
+
+    def _channel(self, symbol: str) -> '_Channel':
+        channel = self._channels.get(symbol)
+        if channel is None:
+            with self._lock:
+                channel = self._channels.setdefault(symbol, _Channel())
+        return channel
+
+    def _drop(self, symbol: str) -> None:
+        channel = self._channel(symbol)
+        with self._lock:
+            if channel.refcount > 0 or not channel.subscribed:
+                return
+            self._unsubscribe(symbol, channel)
+
+    def _unsubscribe(self, symbol: str, channel: '_Channel') -> None:
+        # Must be called with the lock held
+        channel.subscribed = False
+        channel.drop_timer = None
+        self.feed.unsubscribe(symbol)
+
+    def _fetch(self, symbol: str, channel: '_Channel') -> tuple:
+        with channel.cond:
+            if channel.fetching:
+                # A request for the symbol is on its way: share its response
+                generation = channel.fetch_generation
+                channel.cond.wait_for(lambda: channel.fetch_generation != generation)
+                if channel.fetch_error is not None:
+                    raise channel.fetch_error
+                return channel.fetched
+            channel.fetching = True
+
+        fetched, error = None, None
+        try:
+            fetched = top_of_book(self.session.orderbook(symbol=symbol)['result'])
+        except Exception as ex:
+            error = ex
+        with channel.cond:
+            self.rest_fetches += 1
+            channel.fetched, channel.fetch_error = fetched, error
+            channel.fetching = False
+            channel.fetch_generation += 1
+            channel.cond.notify_all()
+        if error is not None:
+            raise error
+        return fetched
+
+    def _on_update(self, symbol: str, top: tuple) -> None:
+        # Called from the stream thread with the top of book built by the order book
+        channel = self._channel(symbol)
+        with channel.cond:
+            channel.top = top
+            channel.cond.notify_all()
+
+
+class Subscription():
+    """
+    A procedure's hold on the depth stream of a symbol.
+    """
+
+    def __init__(self, hub: MarketDataHub, symbol: str):
+        self.hub = hub
+        self.symbol = symbol
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.hub.release(self.symbol)
+
+    def __enter__(self) -> 'Subscription':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+class _Channel():
+    """
+    Subscriptions and latest top of book of a symbol.
+    """
+
+    def __init__(self):
+        self.refcount = 0
+        self.subscribed = False
+        self.drop_timer = None
+        self.top = None
+        self.cond = threading.Condition()
+        self.fetching = False
+        self.fetch_generation = 0
+        self.fetched = None
+        self.fetch_error = None
+
+
+def top_of_book(orders: list) -> tuple:
+    """
+    Finds the best buy and sell entries of a REST order book.
+
+    Args:
+        orders (list): The 'result' list of an order book response.
+
+    Returns:
+        tuple: (best_buy, best_sell), or None if a side is empty.
+    """
+    best_buy = None
+    best_sell = None
+    for order in orders:
+        if best_buy is None and order['side'] == 'Buy':
+            best_buy = order
+        if best_sell is None and order['side'] == 'Sell':
+            best_sell = order
+        if best_buy is not None and best_sell is not None:
+            return best_buy, best_sell
+    return None
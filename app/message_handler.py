@@ -1,37 +1,221 @@
 """
-MessageHandler class for printing messages with threading information.
+MessageHandler class for logging messages with ticker, order, signal and thread context.
+
+Trading threads only put records on a queue; a background listener formats
+them and writes them to the console and, as JSON lines, to a log file rotated
+by size. Records below the configured level are dropped before any formatting,
+and messages accept %-style arguments so that the string is only built for
+records that are written.
 """
-import threading
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from contextlib import contextmanager
+
+LOGGER_NAME = 'bybit'
+
+# Context of the signal being handled, e.g. its signal_id; follows threads and asyncio tasks
+_context = contextvars.ContextVar('log_context', default={})
+
+
+def log(level: int, msg: str, *args, **fields) -> None:
+    """
+    Logs a message with the current context, for code without a MessageHandler at hand.
+
+    Args:
+        level (int): Logging level, ex: logging.ERROR.
+        msg (str): The message, with optional %-style placeholders for args.
+        *args: Values formatted into the message only if it is written.
+        **fields: Context fields of the record.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.isEnabledFor(level):
+        context = _context.get()
+        if fields:
+            context = dict(context, **fields)
+        logger.log(level, msg, *args, extra={'context': context})
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as a single JSON line, with its context as top level fields.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'thread': record.thread,
+            'thread_name': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'context', {}))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    Formats a record as the console lines printed by the bot, prefixed by the thread identifier.
+    """
+
+    PREFIXES = {logging.DEBUG: 'debug msg --> ', logging.INFO: '--> ', logging.WARNING: '[!] ', logging.ERROR: '[!] '}
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = getattr(record, 'context', {})
+        ticker = f'[{context["ticker"]}] ' if 'ticker' in context else ''
+        line = f'[{record.thread}] {ticker}{self.PREFIXES.get(record.levelno, "[!] ")}{record.getMessage()}'
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class EnqueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the queue as they are, leaving all formatting to the listener thread.
+    Records are dropped, and counted, when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 
 class MessageHandler:
 
-    def __init__(self) -> None:
-        pass
+    # Records waiting to be written before new ones are dropped
+    QUEUE_SIZE = 10000
+
+    _listener = None
 
-    def msg(self, msg: str) -> None:
+    def __init__(self, level: str = 'INFO', log_file: str = None, max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5, console: bool = True) -> None:
         """
-        Prints a message with the thread identifier.
+        Sets up the logging pipeline; only the first handler created starts the listener.
 
         Args:
-            msg (str): The message to be printed.
+            level (str): Minimum level written: "DEBUG", "INFO", "WARNING" or "ERROR".
+            log_file (str): File receiving the JSON records, None to only log to the console.
+            max_bytes (int): Size at which the log file is rotated.
+            backup_count (int): Number of rotated log files kept.
+            console (bool): Whether records are also written to the console.
         """
-        print(f'[{threading.get_ident()}] --> {msg}')
+        self.logger = logging.getLogger(LOGGER_NAME)
+        self.logger.setLevel(level)
+        self.fields = dict()
+        if MessageHandler._listener is not None:
+            return
 
-    def err(self, msg: str) -> None:
+        handlers = []
+        if console:
+            console_handler = logging.StreamHandler(sys.stdout)
+            console_handler.setFormatter(ConsoleFormatter())
+            handlers.append(console_handler)
+        if log_file:
+            os.makedirs(os.path.dirname(log_file) or '.', exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+
+        log_queue = queue.Queue(self.QUEUE_SIZE)
+        self.logger.handlers = [EnqueueHandler(log_queue)]
+        self.logger.propagate = False
+        # Warnings of the libraries, ex: pybit or websocket, go through the same pipeline
+        logging.getLogger().addHandler(self.logger.handlers[0])
+        MessageHandler._listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+        MessageHandler._listener.start()
+        # Writes the records still queued on exit
+        atexit.register(MessageHandler._listener.stop)
+
+    def bind(self, **fields) -> 'MessageHandler':
+        """
+        Returns a handler adding the given fields to every record, ex: hmsg.bind(ticker="ETH").
+        """
+        bound = object.__new__(MessageHandler)
+        bound.logger = self.logger
+        bound.fields = dict(self.fields, **fields)
+        return bound
+
+    @staticmethod
+    @contextmanager
+    def context(**fields):
+        """
+        Adds fields, ex: signal_id, to every record logged by the current thread or task inside the block.
+        """
+        token = _context.set(dict(_context.get(), **fields))
+        try:
+            yield
+        finally:
+            _context.reset(token)
+
+    @staticmethod
+    def current_context() -> dict:
+        """
+        Returns the fields added by the enclosing context blocks, to carry them to another thread or event loop.
+        """
+        return dict(_context.get())
+
+    def msg(self, msg: str, *args, **fields) -> None:
+        """
+        Logs an informational message.
+
+        Args:
+            msg (str): The message to be logged, with optional %-style placeholders for args.
+            *args: Values formatted into the message only if it is written.
+            **fields: Context fields of the record, ex: order_id.
+        """
+        if self.logger.isEnabledFor(logging.INFO):
+            self._log(logging.INFO, msg, args, fields)
+
+    def err(self, msg: str, *args, **fields) -> None:
         """
-        Prints an error message with the thread identifier.
+        Logs an error message.
 
         Args:
-            msg (str): The error message to be printed.
+            msg (str): The error message to be logged, with optional %-style placeholders for args.
+            *args: Values formatted into the message only if it is written.
+            **fields: Context fields of the record, ex: order_id.
         """
-        print(f'[{threading.get_ident()}] [!] {msg}')
+        if self.logger.isEnabledFor(logging.ERROR):
+            self._log(logging.ERROR, msg, args, fields)
 
-    def debug(self, msg: str) -> None:
+    def debug(self, msg: str, *args, **fields) -> None:
         """
-        Prints a debug message with the thread identifier if DEBUG mode is enabled.
+        Logs a debug message, only written when the level is DEBUG.
 
         Args:
-            msg (str): The debug message to be printed.
+            msg (str): The debug message to be logged, with optional %-style placeholders for args.
+            *args: Values formatted into the message only if it is written.
+            **fields: Context fields of the record, ex: order_id.
+        """
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self._log(logging.DEBUG, msg, args, fields)
+
+    def dropped(self) -> int:
         """
-        # todo: check if DEBUG is true on MainConfig
-        print(f'[{threading.get_ident()}] debug msg --> {msg}')
+        Returns the number of records dropped because the queue was full.
+        """
+        return sum(getattr(handler, 'dropped', 0) for handler in self.logger.handlers)
+
+    def _log(self, level: int, msg, args: tuple, fields: dict) -> None:
+        context = _context.get()
+        if self.fields or fields:
+            context = dict(context, **self.fields, **fields)
+        self.logger.log(level, msg, *args, extra={'context': context})
@@ -0,0 +1,301 @@
+"""
+In-process metrics, exposed in the Prometheus text format on the /metrics route.
+
+Counters and histograms are kept in memory and labelled, e.g. by endpoint and
+ret_code for the REST calls. Values owned by other objects, such as the trade
+counters of each ticker, are read by collectors when the metrics are rendered,
+so they cost nothing on the hot path.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from pybit.exceptions import FailedRequestError, InvalidRequestError
+
+from message_handler import log
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter():
+
+    TYPE = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        """
+        Args:
+            name (str): Metric name, ex: "bybit_requests_total".
+            documentation (str): Help text.
+            labels (tuple): Label names.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labels), 0)
+
+    def samples(self) -> list:
+        with self._lock:
+            return [(self.name + _format_labels(self.labels, key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+
+    TYPE = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram():
+
+    TYPE = 'histogram'
+
+    # Upper bounds, in seconds, suited to REST calls and loop iterations
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = BUCKETS):
+        """
+        Args:
+            name (str): Metric name, ex: "bybit_request_duration_seconds".
+            documentation (str): Help text.
+            labels (tuple): Label names.
+            buckets (tuple): Sorted bucket upper bounds.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Label values: [count per bucket, +Inf included, sum, count]
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self) -> list:
+        samples = []
+        with self._lock:
+            for key, (bucket_counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                    samples.append((f'{self.name}_bucket{labels}', cumulative))
+                samples.append((f'{self.name}_sum{_format_labels(self.labels, key)}', total))
+                samples.append((f'{self.name}_count{_format_labels(self.labels, key)}', count))
+        return samples
+
+
+class MetricsRegistry():
+
+    _instance = None
+
+    def __init__(self):
+        self._metrics = dict()
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def getinstance(cls) -> 'MetricsRegistry':
+        """
+        Returns the registry shared by the whole application, creating it on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def counter(self, name: str, documentation: str, labels: tuple = ()) -> Counter:
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: tuple = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = Histogram.BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labels, buckets)
+
+    def add_collector(self, collector) -> None:
+        """
+        Registers a callable run before every render, to update gauges from values owned elsewhere.
+
+        Args:
+            collector (callable): Called without arguments.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        for collector in list(self._collectors):
+            try:
+                collector()
+            except Exception as ex:
+                log(logging.ERROR, 'Metrics collector failed: %s', ex)
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.TYPE}')
+            lines.extend(f'{name} {_format_value(value)}' for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric_class, name: str, *args):
+        # Metrics are created once and shared by every caller asking for the same name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args)
+            return metric
+
+
+class RequestMetrics():
+    """
+    Latency and outcome metrics of the REST calls, shared by the synchronous and asynchronous clients.
+    """
+
+    def __init__(self, registry: MetricsRegistry = None):
+        registry = registry if registry is not None else MetricsRegistry.getinstance()
+        self.duration = registry.histogram(
+            'bybit_request_duration_seconds', 'Duration of the REST calls, rate limiting excluded.', ('endpoint',))
+        self.requests = registry.counter(
+            'bybit_requests_total', 'REST calls by endpoint and ret_code.', ('endpoint', 'ret_code'))
+        self.errors = registry.counter(
+            'bybit_request_errors_total', 'REST calls that failed or returned a non-zero ret_code.',
+            ('endpoint', 'ret_code'))
+        self.rate_limit_wait = registry.histogram(
+            'bybit_rate_limit_wait_seconds', 'Time spent waiting for the rate-limit governor.', ('endpoint_class',))
+
+    def record(self, endpoint: str, seconds: float, response=None, exception: Exception = None) -> None:
+        """
+        Records one REST call.
+
+        Args:
+            endpoint (str): pybit method name, ex: "place_active_order".
+            seconds (float): Duration of the call.
+            response (dict): Exchange response, if any.
+            exception (Exception): Exception raised by the call, if any.
+        """
+        if isinstance(exception, InvalidRequestError) and getattr(exception, 'status_code', None) is not None:
+            # pybit raises on a non-zero ret_code, which it keeps as the status_code of the exception
+            ret_code = str(exception.status_code)
+        elif isinstance(exception, FailedRequestError) and getattr(exception, 'status_code', None) is not None:
+            ret_code = f'http_{exception.status_code}'
+        elif exception is not None:
+            ret_code = type(exception).__name__
+        elif isinstance(response, dict):
+            ret_code = str(response.get('ret_code'))
+        else:
+            ret_code = 'none'
+        self.duration.observe(seconds, endpoint=endpoint)
+        self.requests.inc(endpoint=endpoint, ret_code=ret_code)
+        if ret_code != '0':
+            self.errors.inc(endpoint=endpoint, ret_code=ret_code)
+
+
+class OrderMetrics():
+    """
+    Metrics of the order chasing loops: iterations, their duration, repricing and crossing to market.
+    """
+
+    # Upper bounds of the number of loop iterations spent on one order
+    ITERATION_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+
+    def __init__(self, registry: MetricsRegistry = None):
+        registry = registry if registry is not None else MetricsRegistry.getinstance()
+        self.iterations = registry.counter(
+            'bybit_chase_iterations_total', 'Iterations of the order chasing loops.', ('ticker', 'procedure'))
+        self.iteration_duration = registry.histogram(
+            'bybit_chase_iteration_seconds', 'Work done by one chasing loop iteration, waits excluded.',
+            ('ticker', 'procedure'))
+        self.iterations_per_order = registry.histogram(
+            'bybit_chase_iterations_per_order', 'Chasing loop iterations spent on one order.', ('procedure',),
+            self.ITERATION_BUCKETS)
+        self.reprices = registry.counter(
+            'bybit_reprices_total', 'Orders cancelled to be placed again at a better price.', ('ticker', 'procedure'))
+        self.market_crosses = registry.counter(
+            'bybit_market_crosses_total', 'Limit orders replaced by market orders.', ('ticker', 'procedure'))
+        self.trades = registry.gauge(
+            'bybit_ticker_trades', 'Trade statistics of each ticker, by type.', ('ticker', 'type'))
+
+    def chase(self, ticker: str, procedure: str) -> 'Chase':
+        """
+        Returns the metrics of the chasing loop of one order.
+
+        Args:
+            ticker (str): Ticker symbol, ex: "ETH".
+            procedure (str): "entry" or "stop".
+        """
+        return Chase(self, ticker, procedure)
+
+
+class Chase():
+    """
+    Context manager following the chasing loop of one order; the iteration count is recorded on exit.
+    """
+
+    def __init__(self, metrics: OrderMetrics, ticker: str, procedure: str):
+        self.metrics = metrics
+        self.ticker = ticker
+        self.procedure = procedure
+        self.iterations = 0
+        self._iteration_started_at = None
+
+    def __enter__(self) -> 'Chase':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.iteration_done()
+        if self.iterations:
+            self.metrics.iterations_per_order.observe(self.iterations, procedure=self.procedure)
+
+    def iteration_started(self) -> None:
+        self.iterations += 1
+        self._iteration_started_at = time.monotonic()
+        self.metrics.iterations.inc(ticker=self.ticker, procedure=self.procedure)
+
+    def iteration_done(self) -> None:
+        if self._iteration_started_at is not None:
+            self.metrics.iteration_duration.observe(
+                time.monotonic() - self._iteration_started_at, ticker=self.ticker, procedure=self.procedure)
+            self._iteration_started_at = None
+
+    def reprice(self) -> None:
+        self.metrics.reprices.inc(ticker=self.ticker, procedure=self.procedure)
+
+    def cross(self) -> None:
+        self.metrics.market_crosses.inc(ticker=self.ticker, procedure=self.procedure)
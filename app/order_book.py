@@ -0,0 +1,258 @@
+"""
+Local order books kept current by the public depth stream.
+
+Each OrderBook applies the snapshots and deltas of a single symbol and caches
+its top of book, so readers get the best bid and ask without a REST call.
+When a sequence gap or an inconsistent delta is detected, the book drops its
+state and the feed asks the stream for a fresh snapshot.
+"""
+import logging
+import threading
+
+from bybit_stream import BybitStream
+from message_handler import log
+
+
+class OrderBook():
+
+    def __init__(self, symbol: str, on_gap=None, on_update=None):
+        """
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+            on_gap (callable): Called with the symbol when the book needs a new snapshot.
+            on_update (callable): Called with the symbol and the new top of book, or None, when it changes.
+        """
+        self.symbol = symbol
+        self.on_gap = on_gap
+        self.on_update = on_update
+        self.seq = 0
+        self.synced = False
+        self._bids = dict()
+        self._asks = dict()
+        self._best = None
+        self._notified = None
+        self._lock = threading.Lock()
+
+    def best_bid_ask(self) -> tuple:
+        """
+        Returns the best buy and sell levels, shaped like the REST order book entries.
+
+        Returns:
+            tuple: (best_buy, best_sell) or None while the book is not synced.
+        """
+        return self._best
+
+    def apply_snapshot(self, levels: list, seq: int) -> None:
+        """
+        Replaces the whole book.
+
+        Args:
+            levels (list): Order book entries with id, side, price and size.
+            seq (int): Sequence number of the snapshot.
+        """
+        with self._lock:
+            self._bids.clear()
+            self._asks.clear()
+            for level in levels:
+                self._side(level)[level['id']] = level
+            self.seq = seq
+            self.synced = True
+            self._update_best()
+        self._notify()
+
+    def apply_delta(self, delete: list, update: list, insert: list, seq: int, prev_seq: int = None) -> bool:
+        """
+        Applies an incremental update.
+
+        Args:
+            delete (list): Entries to remove.
+            update (list): Entries to modify.
+            insert (list): Entries to add.
+            seq (int): Sequence number of the delta.
+            prev_seq (int): Sequence number the delta follows, when the exchange provides it.
+
+        Returns:
+            bool: False if the delta could not be applied and the book must be resynced.
+        """
+        with self._lock:
+            if not self.synced:
+                return False
+            if seq <= self.seq:
+                # Stale message, already reflected in the book
+                return True
+            applied = self._apply_delta(delete, update, insert, seq, prev_seq)
+        self._notify()
+        return applied
+
+    def invalidate(self) -> None:
+        """
+        Drops the book state, e.g. when the stream disconnects.
+        """
+        with self._lock:
+            self.synced = False
+            self._best = None
+        self._notify()
+
+    def _side(self, level: dict) -> dict:
+        return self._bids if level['side'] == 'Buy' else self._asks
+
+    def _apply_delta(self, delete: list, update: list, insert: list, seq: int, prev_seq: int) -> bool:
+        # Must be called with the lock held
+        if prev_seq is not None and prev_seq != self.seq:
+            return self._desync()
+        for level in delete:
+            if self._side(level).pop(level['id'], None) is None:
+                return self._desync()
+        for level in update:
+            book_level = self._side(level).get(level['id'])
+            if book_level is None:
+                return self._desync()
+            book_level.update(level)
+        for level in insert:
+            self._side(level)[level['id']] = level
+        self.seq = seq
+        self._update_best()
+        return True
+
+    def _desync(self) -> bool:
+        # Must be called with the lock held
+        self.synced = False
+        self._best = None
+        self._bids.clear()
+        self._asks.clear()
+        if self.on_gap is not None:
+            self.on_gap(self.symbol)
+        return False
+
+    def _notify(self) -> None:
+        # Called outside the lock, so listeners may read the book; only when the top of book changed
+        best = self._best
+        if best is self._notified:
+            return
+        self._notified = best
+        if self.on_update is not None:
+            self.on_update(self.symbol, best)
+
+    def _update_best(self) -> None:
+        # Recomputed on write so that reads are a single attribute access
+        if not self._bids or not self._asks:
+            self._best = None
+            return
+        best_buy = max(self._bids.values(), key=lambda level: float(level['price']))
+        best_sell = min(self._asks.values(), key=lambda level: float(level['price']))
+        # The previous top of book is kept when deeper levels changed, so readers can tell it apart by identity
+        if self._best is None or self._best[0] != best_buy or self._best[1] != best_sell:
+            self._best = (dict(best_buy), dict(best_sell))
+
+
+class OrderBookFeed():
+    """
+    Routes the depth stream of every subscribed symbol into its OrderBook, and reports top of book changes
+    to the listeners.
+    """
+
+    TOPIC = 'orderBookL2_25.{}'
+
+    _instance = None
+
+    def __init__(self, stream=None):
+        """
+        Args:
+            stream: BybitStream or ReplayStream delivering the public depth topics.
+        """
+        self.stream = stream if stream is not None else BybitStream(BybitStream.PUBLIC_URL)
+        self.stream.add_disconnect_handler(self._on_disconnect)
+        self.books = dict()
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def getinstance(cls) -> 'OrderBookFeed':
+        """
+        Returns the feed shared by all tickers, creating it on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, feed: 'OrderBookFeed') -> None:
+        """
+        Replaces the shared feed, e.g. with one running on a ReplayStream.
+        """
+        cls._instance = feed
+
+    def subscribe(self, symbol: str) -> OrderBook:
+        """
+        Starts maintaining the book of a symbol.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+
+        Returns:
+            OrderBook: The local book of the symbol.
+        """
+        with self._lock:
+            book = self.books.get(symbol)
+            if book is not None:
+                return book
+            book = OrderBook(symbol, on_gap=self._resync, on_update=self._on_update)
+            self.books[symbol] = book
+        self.stream.subscribe(self.TOPIC.format(symbol), self._on_message)
+        return book
+
+    def unsubscribe(self, symbol: str) -> None:
+        """
+        Stops maintaining the book of a symbol.
+        """
+        with self._lock:
+            book = self.books.pop(symbol, None)
+        if book is not None:
+            self.stream.unsubscribe(self.TOPIC.format(symbol))
+            book.invalidate()
+
+    def add_listener(self, listener) -> None:
+        """
+        Registers a callable receiving the symbol and the new top of book, or None while the book is not synced.
+        It runs on the stream thread, so it must not block.
+        """
+        self._listeners.append(listener)
+
+    def get_book(self, symbol: str) -> OrderBook:
+        """
+        Returns the local book of a symbol, or None if it is not subscribed.
+        """
+        return self.books.get(symbol)
+
+    def _on_message(self, message: dict) -> None:
+        symbol = message['topic'].split('.', 1)[1]
+        book = self.books.get(symbol)
+        if book is None:
+            return
+        data = message['data']
+        seq = int(message.get('cross_seq', 0))
+        if message.get('type') == 'snapshot':
+            # Linear symbols nest the levels under 'order_book'
+            levels = data['order_book'] if isinstance(data, dict) else data
+            book.apply_snapshot(levels, seq)
+        elif message.get('type') == 'delta':
+            prev_seq = message.get('prev_cross_seq')
+            book.apply_delta(
+                data.get('delete', []),
+                data.get('update', []),
+                data.get('insert', []),
+                seq,
+                int(prev_seq) if prev_seq is not None else None
+            )
+
+    def _on_update(self, symbol: str, best: tuple) -> None:
+        for listener in self._listeners:
+            listener(symbol, best)
+
+    def _resync(self, symbol: str) -> None:
+        log(logging.WARNING, 'Order book out of sync, requesting snapshot for %s', symbol)
+        self.stream.resubscribe(self.TOPIC.format(symbol))
+
+    def _on_disconnect(self) -> None:
+        for book in list(self.books.values()):
+            book.invalidate()
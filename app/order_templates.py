@@ -0,0 +1,122 @@
+"""
+Precomputed order payloads for the order types placed by the procedures.
+
+A template holds the fixed parameters of one order type for one symbol, so
+placing an order only fills in the side, quantity and price. Templates built
+with API credentials also keep the text of the fixed "key=value" pairs of the
+signed message, and an HMAC state that has already absorbed the fixed pairs
+sorted before the first variable one: signing an order then only hashes the
+variable part of the message.
+"""
+import hashlib
+import hmac
+
+from signing import format_value, normalize_params, normalize_value
+
+
+class OrderTemplate():
+
+    def __init__(self, fields: dict, variables: tuple, api_key: str = None, api_secret: str = None,
+                 recv_window: int = 5000):
+        """
+        Args:
+            fields (dict): Fixed order parameters, ex: {"symbol": "ETHUSDT", "order_type": "Limit"}.
+            variables (tuple): Names of the parameters given for each order, ex: ("side", "qty", "price").
+            api_key (str): API key; the template can only build unsigned parameters if omitted.
+            api_secret (str): API secret.
+            recv_window (int): Validity window of the signed requests, in milliseconds.
+        """
+        self.fields = fields
+        self.variables = variables
+        self._signed_fields = None
+        if api_secret is None:
+            return
+
+        self._signed_fields = normalize_params(dict(fields, api_key=api_key, recv_window=recv_window))
+        variable_keys = set(variables) | {'timestamp'}
+        # (key, "key=value" text, or None when the value is given for each order), in signing order
+        self._layout = [
+            (key, None if key in variable_keys else f'{key}={format_value(self._signed_fields[key])}')
+            for key in sorted(variable_keys | set(self._signed_fields))
+        ]
+        prefix = []
+        for _, text in self._layout:
+            if text is None:
+                break
+            prefix.append(text)
+        self._suffix_layout = self._layout[len(prefix):]
+        self._hmac = hmac.new(api_secret.encode('utf-8'), digestmod=hashlib.sha256)
+        if prefix:
+            self._hmac.update(('&'.join(prefix) + '&').encode('utf-8'))
+
+    def params(self, **values) -> dict:
+        """
+        Builds the parameters of an order, for a client that signs its requests itself.
+
+        Args:
+            **values: The variable parameters of the template.
+
+        Returns:
+            dict: Order parameters.
+        """
+        params = self.fields.copy()
+        params.update(values)
+        return params
+
+    def signed_params(self, timestamp: int, **values) -> dict:
+        """
+        Builds the signed parameters of an order.
+
+        Args:
+            timestamp (int): Request time, in epoch milliseconds.
+            **values: The variable parameters of the template; omitted ones are neither sent nor signed.
+
+        Returns:
+            dict: Order parameters, including the credentials and the signature.
+        """
+        params = self._signed_fields.copy()
+        # Whole floats are signed as integers, so they are sent as integers too
+        for key, value in values.items():
+            params[key] = normalize_value(value)
+        params['timestamp'] = timestamp
+        message = '&'.join(
+            text if text is not None else f'{key}={format_value(params[key])}'
+            for key, text in self._suffix_layout
+            if text is not None or key in params
+        )
+        signature = self._hmac.copy()
+        signature.update(message.encode('utf-8'))
+        params['sign'] = signature.hexdigest()
+        return params
+
+
+class OrderTemplates():
+    """
+    The order templates of one symbol.
+    """
+
+    def __init__(self, symbol: str, api_key: str = None, api_secret: str = None, recv_window: int = 5000):
+        """
+        Args:
+            symbol (str): Trading pair, ex: "ETHUSDT".
+            api_key (str): API key, to build signed templates.
+            api_secret (str): API secret.
+            recv_window (int): Validity window of the signed requests, in milliseconds.
+        """
+        self.symbol = symbol
+
+        def template(order_type, time_in_force, reduce_only, variables):
+            fields = {
+                'symbol': symbol,
+                'order_type': order_type,
+                'time_in_force': time_in_force,
+                'reduce_only': reduce_only,
+                'close_on_trigger': reduce_only,
+            }
+            return OrderTemplate(fields, variables, api_key, api_secret, recv_window)
+
+        self.market = template('Market', 'GoodTillCancel', False, ('side', 'qty'))
+        self.reduce_market = template('Market', 'GoodTillCancel', True, ('side', 'qty'))
+        # Limit orders may carry a client order ID, to be found again if their placement is interrupted
+        self.post_only = template('Limit', 'PostOnly', False, ('side', 'qty', 'price', 'order_link_id'))
+        self.reduce_post_only = template('Limit', 'PostOnly', True, ('side', 'qty', 'price', 'order_link_id'))
@@ -0,0 +1,225 @@
+"""
+Order state cache fed by the private order and execution streams.
+
+Orders are indexed by order_id and order_link_id. Every update wakes the
+threads waiting on the tracker, so an order procedure learns about a fill,
+partial fill or cancellation as soon as it is pushed by the exchange instead
+of on its next REST poll.
+"""
+import threading
+
+from bybit_stream import BybitStream
+
+
+class OrderTracker():
+
+    FINAL_STATUSES = ('Filled', 'Cancelled', 'Rejected', 'Deactivated')
+
+    # Number of orders kept before the oldest finished ones are evicted
+    MAX_ORDERS = 10000
+
+    _instance = None
+
+    def __init__(self, stream=None):
+        """
+        Args:
+            stream: BybitStream or ReplayStream delivering the private "order" and "execution" topics.
+        """
+        self.stream = stream if stream is not None else BybitStream.getprivate()
+        self._orders = dict()
+        self._link_ids = dict()
+        self._cond = threading.Condition()
+        self._listeners = []
+        self._execution_listeners = []
+        self.stream.subscribe('order', self._on_order)
+        self.stream.subscribe('execution', self._on_execution)
+        self.stream.add_disconnect_handler(self._on_disconnect)
+
+    @classmethod
+    def getinstance(cls) -> 'OrderTracker':
+        """
+        Returns the tracker shared by all tickers, creating it on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, tracker: 'OrderTracker') -> None:
+        """
+        Replaces the shared tracker, e.g. with one running on a ReplayStream.
+        """
+        cls._instance = tracker
+
+    def is_live(self) -> bool:
+        """
+        Returns True while the private stream is connected and the cache can be trusted.
+        """
+        return self.stream.is_connected()
+
+    def get(self, order_id: str = None, order_link_id: str = None) -> dict:
+        """
+        Returns the cached state of an order.
+
+        Args:
+            order_id (str): Exchange order ID.
+            order_link_id (str): Client order ID, used when order_id is not given.
+
+        Returns:
+            dict: A copy of the order, or None if it is unknown or the stream is down.
+        """
+        if not self.is_live():
+            return None
+        with self._cond:
+            order = self._find(order_id, order_link_id)
+            return dict(order) if order is not None else None
+
+    def open_orders(self, symbol: str) -> list:
+        """
+        Returns the cached orders of a symbol that are not in a final status.
+
+        Args:
+            symbol (str): Exchange symbol, ex: "ETHUSDT".
+
+        Returns:
+            list: Copies of the orders, or None if the stream is down.
+        """
+        if not self.is_live():
+            return None
+        with self._cond:
+            return [dict(order) for order in self._orders.values()
+                    if order.get('symbol') == symbol and order.get('order_status') not in self.FINAL_STATUSES]
+
+    def wait(self, order_id: str, status: str = None, timeout: float = None, token=None) -> dict:
+        """
+        Blocks until the order is reported in a status other than the given one.
+
+        Args:
+            order_id (str): Exchange order ID.
+            status (str): Last status known by the caller; None waits for any status.
+            timeout (float): Maximum number of seconds to wait.
+            token (CancellationToken): Returns early when the token is cancelled;
+                the token must call interrupt() on cancellation.
+
+        Returns:
+            dict: A copy of the order, or None if nothing new arrived before the timeout.
+        """
+        def changed():
+            order = self._orders.get(order_id)
+            return order is not None and order.get('order_status') != status
+
+        with self._cond:
+            self._cond.wait_for(lambda: changed() or (token is not None and token.cancelled), timeout)
+            if not changed() or not self.is_live():
+                return None
+            return dict(self._orders[order_id])
+
+    def interrupt(self) -> None:
+        """
+        Wakes every waiting thread so it can check its cancellation token.
+        """
+        with self._cond:
+            self._cond.notify_all()
+
+    def add_listener(self, listener) -> None:
+        """
+        Registers a callable invoked with a copy of every updated order,
+        for consumers that cannot block on the tracker, e.g. an event loop.
+
+        Args:
+            listener (callable): Called with the updated order dictionary.
+        """
+        self._listeners.append(listener)
+
+    def add_execution_listener(self, listener) -> None:
+        """
+        Registers a callable invoked with every execution pushed by the exchange, e.g. the trade journal.
+        Registering the same listener twice has no effect.
+
+        Args:
+            listener (callable): Called with the execution dictionary.
+        """
+        if listener not in self._execution_listeners:
+            self._execution_listeners.append(listener)
+
+    def record(self, order: dict) -> None:
+        """
+        Merges an order update into the cache and wakes the waiting threads.
+
+        Args:
+            order (dict): Order fields; must contain order_id.
+        """
+        with self._cond:
+            updated = [self._merge(order)]
+            self._cond.notify_all()
+        self._notify(updated)
+
+    def _find(self, order_id: str, order_link_id: str) -> dict:
+        if order_id is None and order_link_id:
+            order_id = self._link_ids.get(order_link_id)
+        return self._orders.get(order_id)
+
+    def _merge(self, update: dict) -> dict:
+        # Returns a copy of the merged order; must be called with the lock held
+        order_id = update['order_id']
+        order = self._orders.get(order_id)
+        if order is None:
+            if len(self._orders) >= self.MAX_ORDERS:
+                self._evict()
+            order = self._orders[order_id] = dict()
+        elif order.get('order_status') in self.FINAL_STATUSES \
+                and update.get('order_status') not in self.FINAL_STATUSES:
+            # Late message: a final status is never rolled back
+            update = {key: value for key, value in update.items() if key != 'order_status'}
+        order.update(update)
+        if order.get('order_link_id'):
+            self._link_ids[order['order_link_id']] = order_id
+        return dict(order)
+
+    def _evict(self) -> None:
+        # Drops the oldest half of the finished orders; must be called with the lock held
+        finished = [order_id for order_id, order in self._orders.items()
+                    if order.get('order_status') in self.FINAL_STATUSES]
+        for order_id in finished[:len(finished) // 2 + 1]:
+            order = self._orders.pop(order_id)
+            self._link_ids.pop(order.get('order_link_id'), None)
+
+    def _on_order(self, message: dict) -> None:
+        with self._cond:
+            updated = [self._merge(order) for order in message['data']]
+            self._cond.notify_all()
+        self._notify(updated)
+
+    def _on_execution(self, message: dict) -> None:
+        updated = []
+        with self._cond:
+            for execution in message['data']:
+                if execution['order_id'] not in self._orders:
+                    # The order topic carries the full order and is expected to follow
+                    continue
+                updated.append(self._merge({
+                    'order_id': execution['order_id'],
+                    'last_exec_price': execution['price'],
+                    'leaves_qty': execution['leaves_qty'],
+                    'is_maker': execution.get('is_maker'),
+                    'order_status': 'Filled' if float(execution['leaves_qty']) == 0 else 'PartiallyFilled'
+                }))
+            self._cond.notify_all()
+        self._notify(updated)
+        for listener in self._execution_listeners:
+            for execution in message['data']:
+                listener(execution)
+
+    def _notify(self, orders: list) -> None:
+        # Listeners are called outside the lock
+        for listener in self._listeners:
+            for order in orders:
+                listener(order)
+
+    def _on_disconnect(self) -> None:
+        # Updates may be lost while disconnected: forget every order that is still open
+        with self._cond:
+            for order_id in [order_id for order_id, order in self._orders.items()
+                             if order.get('order_status') not in self.FINAL_STATUSES]:
+                del self._orders[order_id]
+            self._cond.notify_all()
@@ -0,0 +1,164 @@
+"""
+Dispatcher running the TradingView signals on a fixed pool of worker threads.
+
+Signals are queued per ticker and a ticker is never handled by two workers at
+once. While an entry signal is pending, a newer entry signal for the same
+ticker replaces it, so only the latest one runs; a pending close is never
+replaced by another kind of signal, which is queued behind it instead. The
+entry procedure currently running for the ticker is only preempted by an
+entry on the other side, as a duplicate of the running entry would be ignored
+anyway once its position is open. When too many tickers have pending signals,
+new signals are rejected so the webhook can answer 429.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from message_handler import log
+
+
+class SignalDispatcher():
+
+    WORKERS = 16
+
+    # Maximum number of tickers with a pending signal
+    MAX_PENDING = 128
+
+    # Maximum number of signals queued for a single ticker
+    MAX_QUEUED = 8
+
+    # Number of dispatch latency samples kept for the statistics
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, handler, preempt=None, workers: int = WORKERS, max_pending: int = MAX_PENDING):
+        """
+        Starts the worker threads.
+
+        Args:
+            handler (callable): Called with the alert dictionary on a worker thread.
+            preempt (callable): Called with the ticker name when an entry on the other side arrives for a ticker
+                running an entry.
+            workers (int): Number of worker threads.
+            max_pending (int): Maximum number of tickers with a pending signal.
+        """
+        self.handler = handler
+        self.preempt = preempt
+        self.max_pending = max_pending
+        self.dispatched_count = 0
+        self.coalesced_count = 0
+        self.rejected_count = 0
+        self._pending = dict()
+        self._ready = deque()
+        # Signal being handled, per ticker
+        self._running = dict()
+        self._latencies = deque(maxlen=self.LATENCY_SAMPLES)
+        self._cond = threading.Condition()
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, data: dict) -> bool:
+        """
+        Queues a signal, replacing the last one still pending for the same ticker when they are both entries,
+        or both closes of the same side.
+
+        Args:
+            data (dict): Alert dictionary; must contain the ticker.
+
+        Returns:
+            bool: False if the queue is saturated and the signal was rejected.
+        """
+        ticker = data['ticker']
+        with self._cond:
+            queued = self._pending.get(ticker)
+            if queued is not None:
+                if self._supersedes(data, queued[-1][0]):
+                    self.coalesced_count += 1
+                    queued[-1] = (data, time.monotonic())
+                elif len(queued) >= self.MAX_QUEUED:
+                    self.rejected_count += 1
+                    return False
+                else:
+                    queued.append((data, time.monotonic()))
+            elif len(self._pending) >= self.max_pending:
+                self.rejected_count += 1
+                return False
+            else:
+                self._pending[ticker] = deque([(data, time.monotonic())])
+                if ticker not in self._running:
+                    self._ready.append(ticker)
+                    self._cond.notify()
+            running = self._running.get(ticker)
+        if running is not None and self.preempt is not None and self._reverses(data, running):
+            self.preempt(ticker)
+        return True
+
+    def queue_depth(self) -> int:
+        """
+        Returns the number of tickers with a pending signal.
+        """
+        return len(self._pending)
+
+    def stats(self) -> dict:
+        """
+        Returns the queue depth, counters and dispatch latency percentiles, in milliseconds.
+        """
+        with self._cond:
+            latencies = sorted(self._latencies)
+            stats = {
+                'queue_depth': len(self._pending),
+                'running': len(self._running),
+                'dispatched': self.dispatched_count,
+                'coalesced': self.coalesced_count,
+                'rejected': self.rejected_count,
+            }
+        for name, quantile in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            stats[f'dispatch_latency_{name}_ms'] = \
+                latencies[int(quantile * (len(latencies) - 1))] * 1000 if latencies else None
+        stats['dispatch_latency_max_ms'] = latencies[-1] * 1000 if latencies else None
+        return stats
+
+    @staticmethod
+    def _is_close(data: dict) -> bool:
+        return 'close' in data.get('comment', '')
+
+    @classmethod
+    def _supersedes(cls, data: dict, pending: dict) -> bool:
+        # Only the latest of several pending entries matters; a close must run, whatever follows it
+        if cls._is_close(data) or cls._is_close(pending):
+            return cls._is_close(data) and cls._is_close(pending) \
+                and data['side'].lower() == pending['side'].lower()
+        return True
+
+    @classmethod
+    def _reverses(cls, data: dict, running: dict) -> bool:
+        # A new entry or reversal interrupts the running entry, a close or a duplicate entry waits for it
+        if cls._is_close(data) or cls._is_close(running):
+            return False
+        return data['side'].lower() != running['side'].lower()
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                ticker = self._ready.popleft()
+                queued = self._pending[ticker]
+                data, queued_at = queued.popleft()
+                if not queued:
+                    del self._pending[ticker]
+                self._running[ticker] = data
+                self._latencies.append(time.monotonic() - queued_at)
+                self.dispatched_count += 1
+            try:
+                self.handler(data)
+            except Exception as ex:
+                log(logging.ERROR, 'Failed to handle signal %s: %s', data, ex)
+            finally:
+                with self._cond:
+                    del self._running[ticker]
+                    # A signal received while running is handled next
+                    if ticker in self._pending:
+                        self._ready.append(ticker)
+                        self._cond.notify()
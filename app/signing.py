@@ -0,0 +1,53 @@
+"""
+Request signing for the Bybit REST API.
+"""
+import hashlib
+import hmac
+
+
+def sign(api_secret: str, params: dict) -> str:
+    """
+    Signs request parameters: HMAC-SHA256 of the sorted "key=value" pairs joined by "&".
+
+    Args:
+        api_secret (str): API secret.
+        params (dict): Request parameters, without the signature.
+
+    Returns:
+        str: Hexadecimal signature.
+    """
+    return hmac.new(
+        api_secret.encode('utf-8'),
+        encode_params(params).encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
+
+def encode_params(params: dict) -> str:
+    """
+    Builds the sorted query string used for signing.
+    """
+    return '&'.join(f'{key}={format_value(value)}' for key, value in sorted(params.items()) if value is not None)
+
+
+def normalize_params(params: dict) -> dict:
+    """
+    Returns the parameters as they must be both signed and sent: without None values and with whole floats
+    as integers, as the exchange rebuilds the signed string from the values it decodes.
+    """
+    return {key: normalize_value(value) for key, value in params.items() if value is not None}
+
+
+def normalize_value(value):
+    if isinstance(value, float) and value == int(value):
+        return int(value)
+    return value
+
+
+def format_value(value) -> str:
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value == int(value):
+        # Whole floats must be sent as integers, or the signature does not match
+        return str(int(value))
+    return str(value)
@@ -0,0 +1,412 @@
+"""
+Append-only journal of the trading activity, persisted as fixed-width binary records.
+
+Signals, order placements, reprices, fills (with their fee and liquidity) and
+position closes are appended to a single file, one 80-byte record each. The
+execution threads only put records on a queue; a background thread packs and
+writes them, so journaling never blocks an order procedure.
+
+Records are read back through a memory map. They are appended in time order,
+so a time range is located by binary search without scanning the file, and
+the columns of the matching records are returned as arrays. TradeJournal.stats
+derives slippage, maker/taker ratio, fees and PnL per ticker from them.
+"""
+import array
+import atexit
+import hashlib
+import logging
+import mmap
+import os
+import queue
+import struct
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+from config.main_config import MainConfig
+from message_handler import MessageHandler, log
+
+
+# ts, signal_id, order_id, ticker, event, side, liquidity, reason, price, qty, fee, value
+RECORD = struct.Struct('<dQ16s12sBbBB4d')
+
+Record = namedtuple('Record', ('ts', 'signal_id', 'order_id', 'ticker', 'event', 'side', 'liquidity', 'reason',
+                               'price', 'qty', 'fee', 'value'))
+
+# Array typecode of every column, in record order
+COLUMN_TYPES = dict(zip(Record._fields, ('d', 'Q', None, None, 'B', 'b', 'B', 'B', 'd', 'd', 'd', 'd')))
+
+
+class TradeJournal():
+
+    JOURNAL_FILENAME = './app/journal/trades.bin'
+
+    # Events
+    SIGNAL = 1
+    ORDER = 2
+    REPRICE = 3
+    FILL = 4
+    CLOSE = 5
+
+    # Liquidity of a fill
+    MAKER = 1
+    TAKER = 2
+
+    # Reasons of a close
+    REVERSAL = 1
+    STOP_LOSS = 2
+    TAKE_PROFIT = 3
+
+    REASONS = {REVERSAL: 'reversal', STOP_LOSS: 'stop_loss', TAKE_PROFIT: 'take_profit'}
+
+    # Maximum number of records packed into a single write
+    BATCH_SIZE = 512
+
+    _instance = None
+
+    def __init__(self, journal_file: str = JOURNAL_FILENAME):
+        """
+        Args:
+            journal_file (str): File the records are appended to; created with its directory if missing.
+        """
+        self.journal_file = journal_file
+        self.dropped = 0
+        self._collateral = None
+        self._queue = queue.SimpleQueue()
+        self._pending = 0
+        self._idle = threading.Condition()
+        os.makedirs(os.path.dirname(journal_file) or '.', exist_ok=True)
+        self._file = open(journal_file, 'ab')
+        # A record cut short by a crash is ignored by the readers and overwritten by the next write
+        self._file.truncate(self._file.tell() - self._file.tell() % RECORD.size)
+        self._file.seek(0, os.SEEK_END)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    @classmethod
+    def getinstance(cls) -> 'TradeJournal':
+        """
+        Returns the journal shared by all tickers, creating it on first use.
+        """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    @classmethod
+    def setinstance(cls, journal: 'TradeJournal') -> None:
+        """
+        Replaces the shared journal, e.g. with one writing to a temporary file.
+        """
+        cls._instance = journal
+
+    def signal(self, ticker: str, side: str, signal_id: int) -> None:
+        """
+        Records a signal received from TradingView.
+        """
+        self.record(self.SIGNAL, ticker, side=side, signal_id=signal_id)
+
+    def order(self, ticker: str, side: str, qty: float, price: float, response: dict) -> None:
+        """
+        Records an order accepted by the exchange; price is 0 for market orders.
+
+        Args:
+            response (dict): Exchange response of the order placement; rejected orders are not recorded.
+        """
+        if response and response.get('ret_code') == 0:
+            self.record(self.ORDER, ticker, side=side, order_id=response['result']['order_id'], price=price, qty=qty)
+
+    def reprice(self, ticker: str, order_id: str) -> None:
+        """
+        Records an order cancelled to be placed again at a better price.
+        """
+        self.record(self.REPRICE, ticker, order_id=order_id)
+
+    def close(self, ticker: str, position: dict, reason: int) -> None:
+        """
+        Records the start of a position close.
+
+        Args:
+            position (dict): Position being closed, with its side and size.
+            reason (int): REVERSAL, STOP_LOSS or TAKE_PROFIT.
+        """
+        self.record(self.CLOSE, ticker, side=position['side'], qty=float(position['size']), reason=reason)
+
+    def on_execution(self, execution: dict) -> None:
+        """
+        Records a fill pushed by the private execution stream.
+
+        Args:
+            execution (dict): Execution message entry, ex: {"symbol": "ETHUSDT", "side": "Buy", "price": 1800.5, ...}.
+        """
+        if execution.get('exec_type', 'Trade') != 'Trade':
+            return
+        price, qty = float(execution['price']), float(execution['exec_qty'])
+        self.record(
+            self.FILL,
+            self._ticker(execution['symbol']),
+            side=execution['side'],
+            order_id=execution['order_id'],
+            liquidity=self.MAKER if execution.get('is_maker') else self.TAKER,
+            price=price,
+            qty=qty,
+            fee=float(execution.get('exec_fee') or 0),
+            value=price * qty
+        )
+
+    def _ticker(self, symbol: str) -> str:
+        # Read on the first fill, as the journal may be created before the config file is loaded
+        if self._collateral is None:
+            self._collateral = MainConfig.getinstance().get_user_data()['collateral']
+        return symbol[:-len(self._collateral)] if symbol.endswith(self._collateral) else symbol
+
+    def record(self, event: int, ticker: str, side: str = None, order_id: str = None, signal_id: int = None,
+               liquidity: int = 0, reason: int = 0, price: float = 0, qty: float = 0, fee: float = 0,
+               value: float = 0) -> None:
+        """
+        Queues a record for writing. The signal_id defaults to the one of the log context.
+        """
+        if signal_id is None:
+            signal_id = MessageHandler.current_context().get('signal_id') or 0
+        entry = (time.time(), signal_id, order_id, ticker, event, side, liquidity, reason, price, qty, fee, value)
+        with self._idle:
+            self._pending += 1
+        self._queue.put(entry)
+
+    def flush(self, timeout: float = 5) -> bool:
+        """
+        Waits until the queued records are written.
+
+        Returns:
+            bool: False if records were still queued when the timeout expired.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _write_loop(self) -> None:
+        while True:
+            entries = [self._queue.get()]
+            while len(entries) < self.BATCH_SIZE:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            data = bytearray(RECORD.size * len(entries))
+            written = 0
+            for entry in entries:
+                try:
+                    RECORD.pack_into(data, written * RECORD.size, *self._encode(entry))
+                    written += 1
+                except (struct.error, TypeError, ValueError) as ex:
+                    self.dropped += 1
+                    log(logging.ERROR, 'Trade journal record dropped: %s', ex)
+            try:
+                self._file.write(data[:written * RECORD.size])
+                self._file.flush()
+            except OSError as ex:
+                self.dropped += written
+                log(logging.ERROR, 'Failed to write the trade journal: %s', ex)
+            with self._idle:
+                self._pending -= len(entries)
+                self._idle.notify_all()
+
+    @staticmethod
+    def _encode(entry: tuple) -> tuple:
+        ts, signal_id, order_id, ticker, event, side, liquidity, reason, price, qty, fee, value = entry
+        return (ts, signal_id, encode_order_id(order_id), ticker.encode('ascii')[:12], event,
+                1 if side == 'Buy' else -1 if side == 'Sell' else 0, liquidity, reason,
+                float(price or 0), float(qty or 0), float(fee or 0), float(value or 0))
+
+    @staticmethod
+    def read(journal_file: str = JOURNAL_FILENAME, since: float = None, until: float = None):
+        """
+        Yields the records written between two timestamps.
+
+        Args:
+            journal_file (str): Journal file.
+            since (float): Epoch seconds of the first record, None to start at the beginning.
+            until (float): Epoch seconds after the last record, None to read to the end.
+
+        Yields:
+            Record: Decoded record; ticker and order_id are strings and side is "Buy", "Sell" or "".
+        """
+        with JournalView(journal_file) as view:
+            start, stop = view.bounds(since, until)
+            for values in view.iter_unpack(start, stop):
+                record = Record._make(values)
+                yield record._replace(
+                    order_id=decode_order_id(record.order_id),
+                    ticker=record.ticker.rstrip(b'\0').decode('ascii'),
+                    side='Buy' if record.side > 0 else 'Sell' if record.side < 0 else ''
+                )
+
+    @staticmethod
+    def columns(journal_file: str = JOURNAL_FILENAME, since: float = None, until: float = None,
+                fields: tuple = Record._fields) -> dict:
+        """
+        Returns the records written between two timestamps as columns.
+
+        Numeric columns are array.array objects, ticker and order_id columns are lists of bytes.
+
+        Args:
+            journal_file (str): Journal file.
+            since (float): Epoch seconds of the first record, None to start at the beginning.
+            until (float): Epoch seconds after the last record, None to read to the end.
+            fields (tuple): Names of the columns to return.
+        """
+        with JournalView(journal_file) as view:
+            start, stop = view.bounds(since, until)
+            rows = list(view.iter_unpack(start, stop))
+        columns = dict()
+        for field in fields:
+            index = Record._fields.index(field)
+            values = [row[index] for row in rows]
+            typecode = COLUMN_TYPES[field]
+            columns[field] = array.array(typecode, values) if typecode else values
+        return columns
+
+    @classmethod
+    def stats(cls, journal_file: str = JOURNAL_FILENAME, since: float = None, until: float = None) -> dict:
+        """
+        Computes the execution statistics of every ticker.
+
+        Slippage compares each fill to the price of the first order placed on the same side for the same
+        signal, in basis points, positive when the fill is worse. PnL is the net cash flow of the fills
+        minus fees, i.e. the realized PnL as long as the positions are flat at both ends of the range.
+
+        Args:
+            journal_file (str): Journal file.
+            since (float): Epoch seconds of the first record, None to start at the beginning.
+            until (float): Epoch seconds after the last record, None to read to the end.
+
+        Returns:
+            dict: Statistics keyed by ticker, ex: {"ETH": {"fills": 12, "maker_ratio": 0.75, "pnl": 3.2, ...}}.
+        """
+        stats = dict()
+        order_signals = dict()
+        reference_prices = dict()
+        slippage = dict()
+
+        def ticker_stats(ticker):
+            entry = stats.get(ticker)
+            if entry is None:
+                entry = stats[ticker] = {
+                    'signals': 0, 'orders': 0, 'reprices': 0, 'fills': 0, 'maker_fills': 0, 'taker_fills': 0,
+                    'maker_qty': 0.0, 'taker_qty': 0.0, 'volume': 0.0, 'fees': 0.0, 'cash_flow': 0.0,
+                    'closes': {reason: 0 for reason in cls.REASONS.values()},
+                }
+                slippage[ticker] = [0.0, 0.0]
+            return entry
+
+        for record in cls.read(journal_file, since, until):
+            entry = ticker_stats(record.ticker)
+            if record.event == cls.SIGNAL:
+                entry['signals'] += 1
+            elif record.event == cls.ORDER:
+                entry['orders'] += 1
+                order_signals[record.order_id] = record.signal_id
+                key = (record.signal_id, record.side)
+                if record.signal_id and record.price and key not in reference_prices:
+                    reference_prices[key] = record.price
+            elif record.event == cls.REPRICE:
+                entry['reprices'] += 1
+            elif record.event == cls.FILL:
+                entry['fills'] += 1
+                if record.liquidity == cls.MAKER:
+                    entry['maker_fills'] += 1
+                    entry['maker_qty'] += record.qty
+                else:
+                    entry['taker_fills'] += 1
+                    entry['taker_qty'] += record.qty
+                entry['volume'] += record.value
+                entry['fees'] += record.fee
+                entry['cash_flow'] += record.value if record.side == 'Sell' else -record.value
+                reference = reference_prices.get((order_signals.get(record.order_id), record.side))
+                if reference:
+                    direction = 1 if record.side == 'Buy' else -1
+                    slippage[record.ticker][0] += direction * (record.price - reference) / reference * record.qty
+                    slippage[record.ticker][1] += record.qty
+            elif record.event == cls.CLOSE:
+                reason = cls.REASONS.get(record.reason)
+                if reason:
+                    entry['closes'][reason] += 1
+
+        for ticker, entry in stats.items():
+            filled_qty = entry['maker_qty'] + entry['taker_qty']
+            entry['maker_ratio'] = entry['maker_qty'] / filled_qty if filled_qty else None
+            weighted_slippage, slippage_qty = slippage[ticker]
+            entry['slippage_bps'] = weighted_slippage / slippage_qty * 10000 if slippage_qty else None
+            entry['reprices_per_order'] = entry['reprices'] / entry['orders'] if entry['orders'] else None
+            entry['pnl'] = entry['cash_flow'] - entry['fees']
+        return stats
+
+
+class JournalView():
+    """
+    Read-only memory map of a journal file, limited to its complete records.
+    """
+
+    def __init__(self, journal_file: str):
+        self.journal_file = journal_file
+        self.count = 0
+        self._file = None
+        self._map = None
+
+    def __enter__(self) -> 'JournalView':
+        if os.path.exists(self.journal_file):
+            self._file = open(self.journal_file, 'rb')
+            self.count = os.fstat(self._file.fileno()).st_size // RECORD.size
+            if self.count:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        if self._map is not None:
+            self._map.close()
+        if self._file is not None:
+            self._file.close()
+
+    def timestamp(self, index: int) -> float:
+        return struct.unpack_from('<d', self._map, index * RECORD.size)[0]
+
+    def bounds(self, since: float = None, until: float = None) -> tuple:
+        """
+        Returns the index range of the records written in [since, until), found by binary search.
+        """
+        return (self._search(since) if since is not None else 0,
+                self._search(until) if until is not None else self.count)
+
+    def iter_unpack(self, start: int, stop: int):
+        if self._map is None or start >= stop:
+            return iter(())
+        # Slicing copies the range, so the map can be closed while the records are still being read
+        return RECORD.iter_unpack(self._map[start * RECORD.size:stop * RECORD.size])
+
+    def _search(self, ts: float) -> int:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp(middle) < ts:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+
+def encode_order_id(order_id: str) -> bytes:
+    """
+    Packs an order id into 16 bytes: Bybit order ids are UUIDs, anything else is hashed.
+    """
+    if not order_id:
+        return b''
+    try:
+        return uuid.UUID(order_id).bytes
+    except ValueError:
+        return hashlib.md5(order_id.encode()).digest()
+
+
+def decode_order_id(order_id: bytes) -> str:
+    if order_id == bytes(16):
+        return ''
+    return str(uuid.UUID(bytes=order_id))
@@ -1,21 +1,7 @@
-import ast
+import logging
 import math
 
-
-DEBUG = False
-
-
-def parse_webhook(webhook_data: str) -> dict:
-    """
-    This function takes the string from tradingview and turns it into a python dict.
-    :param webhook_data: POST data from tradingview, as a string.
-    :return: Dictionary version of string.
-    """
-    try:
-        data = ast.literal_eval(webhook_data)
-        return data
-    except:
-        return None
+from message_handler import log
 
 
 def handle_exchange_response(response: dict, if_error_message: str='') -> bool:
@@ -25,17 +11,12 @@ def handle_exchange_response(response: dict, if_error_message: str='') -> bool:
     :param if_error_message: message to be displayed if an error occurs.
     :return: True if the response is successful, False otherwise.
     """
-    if DEBUG:
-        print('json from bybit:')
-        print(response)
+    log(logging.DEBUG, 'json from bybit: %s', response)
     if response['ret_code'] != 0:
         if if_error_message:
             err(if_error_message)
-        print('[!] Msg:', response['ret_msg'])
+        log(logging.ERROR, 'Msg: %s', response['ret_msg'])
         return False
-    else:
-        if DEBUG:
-            print('Bybit:', response['ret_msg'])
     return True
 
 
@@ -44,7 +25,7 @@ def err(msg: str) -> None:
     This function handles error messages.
     :param msg: error message.
     """
-    print(f'[!] {msg}')
+    log(logging.ERROR, msg)
 
 
 def round_down(non_rounded_entry_size: float, step: float) -> float:
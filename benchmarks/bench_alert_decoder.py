@@ -0,0 +1,40 @@
+"""
+Microbenchmark of the webhook parsing path: the former ast.literal_eval parser
+against the AlertDecoder, from POST body to an alert ready to be dispatched.
+
+Usage: python benchmarks/bench_alert_decoder.py [iterations]
+"""
+import ast
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+import alert_decoder
+from alert_decoder import AlertDecoder
+
+BODY = b'{"ticker": "ETH", "side": "buy", "comment": "entry"}'
+
+
+def literal_eval_path(tickers: dict):
+    data = ast.literal_eval(BODY.decode())
+    return tickers[data['ticker']]
+
+
+def main(iterations: int = 100000) -> None:
+    tickers = {'ETH': object(), 'CRO': object()}
+    decoder = AlertDecoder(tickers)
+    assert decoder.decode(BODY)['client'] is tickers['ETH']
+
+    print('JSON parser:', 'orjson' if alert_decoder._loads is not alert_decoder.json.loads else 'json')
+    for name, function in (
+        ('ast.literal_eval', lambda: literal_eval_path(tickers)),
+        ('AlertDecoder.decode', lambda: decoder.decode(BODY)),
+    ):
+        best = min(timeit.repeat(function, number=iterations, repeat=5))
+        print(f'{name:<22} {best / iterations * 1e6:8.2f} us/alert')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
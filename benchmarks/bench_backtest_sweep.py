@@ -0,0 +1,49 @@
+"""
+Benchmark of parallel parameter sweeps of the Pine strategy backtester.
+
+A grid over the trailing stop percentages and the ATR settings is run on
+synthetic 1-minute klines, and the throughput and ten best parameter sets are
+reported.
+
+Usage: python benchmarks/bench_backtest_sweep.py [combinations] [years] [processes]
+"""
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backtest_sweep import ParameterSweep
+from backtester import ATR, TSL
+from bench_backtester import MINUTES_PER_YEAR, synthetic_klines
+
+
+def main(combinations: int = 10000, years: float = 1, processes: int = None) -> None:
+    bars = int(years * MINUTES_PER_YEAR)
+    open_, high, low, close, signal = synthetic_klines(bars)
+    columns = {'open': open_, 'high': high, 'low': low, 'close': close, 'signal': signal}
+
+    # 100 ATR settings, the rest of the sets over the percentage trailing stops
+    atr_space = {'risk_management': [ATR], 'atr_period': [14, 21, 28, 42],
+                 'atr_multiplier': [round(value, 4) for value in np.linspace(1, 5, 25)]}
+    side = max(1, int(math.sqrt(max(1, combinations - 100))))
+    stops = [round(value, 4) for value in np.linspace(0.25, 10, side)]
+    tsl_space = {'risk_management': [TSL], 'long_tsl_perc': stops, 'short_tsl_perc': stops}
+    candidates = list(ParameterSweep.grid(tsl_space)) + list(ParameterSweep.grid(atr_space))
+    print(f'{len(candidates)} parameter sets over {bars} bars ({years} years of 1-minute klines)')
+
+    started_at = time.perf_counter()
+    with ParameterSweep(columns, processes=processes, min_trades=10) as sweep:
+        print(f'{sweep.processes} processes')
+        table = sweep.run(candidates)
+    elapsed = time.perf_counter() - started_at
+    print(f'{elapsed:.1f} s, {len(table) / elapsed:.1f} parameter sets/s')
+    print(table.format(10))
+
+
+if __name__ == '__main__':
+    main(*(cast(value) for cast, value in zip((int, float, int), sys.argv[1:])))
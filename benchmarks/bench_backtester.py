@@ -0,0 +1,53 @@
+"""
+Benchmark of the Pine strategy backtester on synthetic 1-minute klines.
+
+A random-walk series with sparse indicator signals is generated for the
+requested number of years, and every risk management mode is run over it.
+
+Usage: python benchmarks/bench_backtester.py [years]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+
+from backtester import ATR, BKOUT, REV_SIGNAL, SLTP, TSL, PineBacktester, atr_trailing_stops
+
+MINUTES_PER_YEAR = 525600
+
+
+def synthetic_klines(bars: int, seed: int = 1) -> tuple:
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.001, bars)))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.0005, bars)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.0005, bars)))
+    # Indicator values matching the default start and end deal conditions now and then
+    signal = np.where(rng.random(bars) < 0.002, rng.integers(0, 40, bars), 0).astype(np.float64)
+    return open_, high, low, close, signal
+
+
+def main(years: float = 1) -> None:
+    bars = int(years * MINUTES_PER_YEAR)
+    open_, high, low, close, signal = synthetic_klines(bars)
+    print(f'{bars} bars ({years} years of 1-minute klines)')
+
+    started_at = time.perf_counter()
+    atr_stops = atr_trailing_stops(high, low, close, 21, 2.8)
+    print(f'{"ATR trailing stops":<24} {time.perf_counter() - started_at:6.2f} s')
+
+    for risk_management in (SLTP, TSL, ATR, BKOUT, REV_SIGNAL):
+        backtester = PineBacktester(risk_management=risk_management)
+        started_at = time.perf_counter()
+        result = backtester.run(open_, high, low, close, signal, atr_stops=atr_stops)
+        elapsed = time.perf_counter() - started_at
+        summary = result.summary()
+        print(f'{risk_management:<24} {elapsed:6.2f} s | {summary["trades"]:>5} trades | '
+              f'net {summary["net_profit_perc"]:+7.2f} % | max drawdown {summary["max_drawdown_perc"]:6.2f} %')
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 1)
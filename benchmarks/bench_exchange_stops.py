@@ -0,0 +1,122 @@
+"""
+Cost of protecting open positions with the client-side trailing stop and with stops on the exchange.
+
+Every simulated ticker holds a long position while the market moves. With
+the TSL risk management, each position is watched by its own
+check_for_stop_limit_tsl thread, as the bot does when the trailing stop
+monitor runs. With EXCHANGE_TSL, the trailing stop is registered once on
+the exchange and nothing runs on the client. The script reports the client
+CPU time and the exchange calls made while the positions are held, and how
+many positions their stop closed. The CPU time includes the thread moving the
+simulated market, which runs in the same process.
+
+Usage: python benchmarks/bench_exchange_stops.py [--positions 200] [--duration 10] [--tsl-perc 0.2]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from config.main_config import MainConfig
+from exchange_simulator import ExchangeSimulator
+from http_pool import RateLimitGovernor
+
+
+def write_config(tickers: list, risk_management: str, tsl_perc: float) -> str:
+    config = {
+        'user_data': {'api_key': 'SIMULATOR', 'api_secret': 'SIMULATOR', 'collateral': 'USDT'},
+        'logging': {'console': False},
+        'tickers': {ticker: {'wallet_perc': 0.01, 'long_leverage': 5, 'short_leverage': 5,
+                             'risk_management': risk_management, 'long_tsl_perc': tsl_perc,
+                             'short_tsl_perc': tsl_perc} for ticker in tickers},
+    }
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as file:
+        file.write(json.dumps(config))
+    return path
+
+
+def run(names: list, risk_management: str, args) -> None:
+    symbols = [name + 'USDT' for name in names]
+    simulator = ExchangeSimulator(
+        symbols={symbol: (100.0, 0.01, 0.01) for symbol in symbols},
+        balance=1000000.0,
+        latency=args.latency_ms / 1000,
+        seed=args.seed
+    )
+    simulator.install()
+    MainConfig(write_config(names, risk_management, args.tsl_perc))
+
+    from bybit_ticker import BybitTicker
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tickers = [BybitTicker(name) for name in names]
+        for ticker in tickers:
+            ticker.warm_up()
+            ticker.place_order(ticker.coin_ticker, 'Buy', 1)
+
+        threads = []
+        tokens = []
+        if risk_management == 'TSL':
+            for ticker in tickers:
+                token = ticker.start_procedure()
+                thread = threading.Thread(target=ticker.check_for_stop_limit_tsl, args=('Buy', token), daemon=True)
+                thread.start()
+                tokens.append(token)
+                threads.append(thread)
+        else:
+            for ticker in tickers:
+                ticker.register_exchange_stop('Buy')
+
+        simulator.calls.clear()
+        simulator.run(args.step_ms / 1000)
+        cpu_started_at = time.process_time()
+        time.sleep(args.duration)
+        cpu = time.process_time() - cpu_started_at
+        calls = dict(simulator.calls)
+        closed = sum(simulator.my_position(symbol)['result'][0]['size'] == 0 for symbol in symbols)
+
+        # Stopping the monitors closes the positions they still watch
+        for token in tokens:
+            token.cancel()
+        for thread in threads:
+            thread.join()
+        simulator.stop()
+
+    public = sum(count for method, count in calls.items()
+                 if RateLimitGovernor.ENDPOINT_CLASSES.get(method, 'public') == 'public')
+    print(f'{risk_management:<13} {len(names)} positions | CPU {cpu:6.2f} s ({cpu / args.duration * 100:5.1f}%) | '
+          f'{sum(calls.values()) / args.duration:8.1f} calls/s, {public / args.duration:8.1f} public/s | '
+          f'{closed} closed by their stop')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--positions', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10, help='seconds the positions are held')
+    parser.add_argument('--tsl-perc', type=float, default=0.2, help='trailing stop distance in percent')
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--step-ms', type=float, default=50, help='interval between market moves')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # Paths in the config module are relative to the repository root
+    os.chdir(ROOT)
+    os.makedirs('./app/log', exist_ok=True)
+
+    names = [f'SIM{i}' for i in range(args.positions)]
+    print(f'Public endpoint budget: {RateLimitGovernor.LIMITS["public"][0]} calls/s')
+    for risk_management in ('TSL', 'EXCHANGE_TSL'):
+        run(names, risk_management, args)
+
+
+if __name__ == '__main__':
+    main()
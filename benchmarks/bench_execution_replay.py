@@ -0,0 +1,84 @@
+"""
+Replay of the order procedures on synthetic tick data, on a virtual clock.
+
+Quotes move on a random walk every 250 ms with trades printed at the bid or
+the ask, and signals alternate between buy and sell. The script reports the
+maker/taker mix, fees and slippage of the entries and closes, and how much
+faster than the market the replay ran.
+
+Usage: python benchmarks/bench_execution_replay.py [--hours 24] [--signal-minutes 30] [--trailing-stop]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from config.main_config import MainConfig
+
+
+def write_config(ticker: str) -> str:
+    config = {
+        'user_data': {'api_key': 'SIMULATOR', 'api_secret': 'SIMULATOR', 'collateral': 'USDT'},
+        # Records still go to the JSON log file, as in production
+        'logging': {'console': False},
+        'tickers': {ticker: {'wallet_perc': 0.05, 'long_leverage': 5, 'short_leverage': 5}},
+    }
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as file:
+        file.write(json.dumps(config))
+    return path
+
+
+def synthetic_ticks(hours: float, tick_size: float, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    count = int(hours * 3600 * 4)
+    ts = 1672531200.0 + np.arange(count) * 0.25
+    bid = np.round((1800 / tick_size + np.cumsum(rng.integers(-1, 2, count))) * tick_size, 8)
+    ask = np.round(bid + tick_size, 8)
+    # A trade every second on average, at the bid or the ask
+    price = np.where(rng.random(count) < 0.25, np.where(rng.random(count) < 0.5, bid, ask), np.nan)
+    return {'ts': ts, 'bid': bid, 'ask': ask, 'price': price}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--signal-minutes', type=float, default=30)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--trailing-stop', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # Paths in the config module are relative to the repository root
+    os.chdir(ROOT)
+    os.makedirs('./app/log', exist_ok=True)
+    MainConfig(write_config('SIM'))
+
+    from execution_replay import ExecutionReplay
+
+    ticks = synthetic_ticks(args.hours, 0.05, args.seed)
+    interval = args.signal_minutes * 60
+    signals = [(float(ticks['ts'][0]) + interval * (i + 1), 'Buy' if i % 2 == 0 else 'Sell', '')
+               for i in range(int(args.hours * 3600 / interval) - 1)]
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        replay = ExecutionReplay(ticks, coin_ticker='SIM', tick_size=0.05, qty_step=0.01, balance=100000.0,
+                                 latency=args.latency_ms / 1000, trailing_stop=args.trailing_stop,
+                                 ticker_settings={'long_tsl_perc': 0.5, 'short_tsl_perc': 0.5}, seed=args.seed)
+        summary = replay.run(signals)
+
+    print(f'{len(ticks["ts"])} ticks ({args.hours} hours), {len(signals)} signals, {args.latency_ms} ms latency')
+    for key, value in summary.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
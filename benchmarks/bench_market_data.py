@@ -0,0 +1,75 @@
+"""
+Benchmark of the memory-mapped market data store.
+
+A year of synthetic 1-minute ETHUSDT klines is written as a CSV file in the
+layout of LocalFileSource and synced into a temporary store in monthly
+steps, then opening the year from the store is compared with parsing the
+CSV file, and a backtest is run on the store views.
+
+Usage: python benchmarks/bench_market_data.py [years]
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from backtester import TSL, PineBacktester, load_csv
+from bench_backtester import MINUTES_PER_YEAR, synthetic_klines
+from market_data import INTERVALS, LocalFileSource, MarketDataDownloader, MarketDataStore, timestamp_ms
+
+SYMBOL = 'ETHUSDT'
+
+
+def main(years: float = 1) -> None:
+    bars = int(years * MINUTES_PER_YEAR)
+    open_, high, low, close, _ = synthetic_klines(bars)
+    start = timestamp_ms(datetime.date(2023, 1, 1))
+    ts = start + np.arange(bars, dtype=np.int64) * INTERVALS['1']
+    volume = np.full(bars, 10.0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source_dir = os.path.join(directory, 'source')
+        os.makedirs(os.path.join(source_dir, SYMBOL))
+        csv_path = os.path.join(source_dir, SYMBOL, 'kline_1.csv')
+        np.savetxt(csv_path, np.column_stack((ts, open_, high, low, close, volume, volume * close)),
+                   delimiter=',', header='ts,open,high,low,close,volume,turnover', comments='',
+                   fmt=['%d'] + ['%.6f'] * 6)
+        print(f'{bars} klines ({years} years of 1-minute klines), CSV {os.path.getsize(csv_path) / 1e6:.1f} MB')
+
+        store = MarketDataStore(os.path.join(directory, 'store'))
+        downloader = MarketDataDownloader(store, LocalFileSource(source_dir))
+        end = int(ts[-1]) + INTERVALS['1']
+        started_at = time.perf_counter()
+        # The first month, then the rest incrementally, then an up-to-date sync that adds nothing
+        added = downloader.sync_klines(SYMBOL, '1', start, start + 30 * 86400000)
+        added += downloader.sync_klines(SYMBOL, '1', start, end)
+        added += downloader.sync_klines(SYMBOL, '1', start, end)
+        print(f'{"sync (3 passes)":<24} {time.perf_counter() - started_at:8.3f} s | {added} klines added')
+
+        started_at = time.perf_counter()
+        columns = load_csv(csv_path)
+        print(f'{"load_csv":<24} {(time.perf_counter() - started_at) * 1000:8.1f} ms')
+
+        started_at = time.perf_counter()
+        klines = store.klines(SYMBOL, '1')
+        print(f'{"open store":<24} {(time.perf_counter() - started_at) * 1000:8.1f} ms | {len(klines["ts"])} rows')
+
+        started_at = time.perf_counter()
+        month = store.klines(SYMBOL, '1', start + 180 * 86400000, start + 210 * 86400000)
+        print(f'{"open one month":<24} {(time.perf_counter() - started_at) * 1000:8.1f} ms | {len(month["ts"])} rows')
+
+        assert np.array_equal(klines['close'], columns['close'])
+        backtester = PineBacktester(risk_management=TSL)
+        started_at = time.perf_counter()
+        summary = backtester.run(klines['open'], klines['high'], klines['low'], klines['close']).summary()
+        print(f'{"backtest on views":<24} {time.perf_counter() - started_at:8.3f} s | {summary["trades"]} trades')
+
+
+if __name__ == '__main__':
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 1)
@@ -0,0 +1,182 @@
+"""
+Benchmark of the top of book shared by concurrent procedures through the market data hub.
+
+REST path: several procedures per symbol poll the top of book of the
+simulated exchange at the same time, as an entry chase and the close of the
+opposite position do, either with their own order book request each or
+through the hub, which shares one request between the concurrent readers of
+a symbol. The script reports the order book requests sent for the reads.
+
+Stream path: the hub is fed by a replayed depth stream. The script reports
+the cost and the allocations of a top of book read, and how many consumers
+blocked on wait_for_update are woken by the deltas. The stream is dropped
+once the last subscription is released.
+
+Usage: python benchmarks/bench_market_data_hub.py [--symbols 4] [--procedures 4] [--duration 3]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from bybit_stream import ReplayStream
+from config.main_config import MainConfig
+from exchange_simulator import ExchangeSimulator
+from market_data_hub import MarketDataHub
+from order_book import OrderBookFeed
+
+SYMBOL = 'ETHUSDT'
+
+
+def write_config(tickers: list) -> str:
+    config = {
+        'user_data': {'api_key': 'SIMULATOR', 'api_secret': 'SIMULATOR', 'collateral': 'USDT'},
+        'logging': {'console': False},
+        'tickers': {ticker: {'wallet_perc': 0.05, 'long_leverage': 5, 'short_leverage': 5} for ticker in tickers},
+    }
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as file:
+        file.write(json.dumps(config))
+    return path
+
+
+def poll(read, duration: float, interval: float, reads: list) -> None:
+    count = 0
+    ends_at = time.perf_counter() + duration
+    while time.perf_counter() < ends_at:
+        read()
+        count += 1
+        time.sleep(interval)
+    reads.append(count)
+
+
+def run_rest(names: list, shared: bool, args) -> None:
+    simulator = ExchangeSimulator(
+        symbols={name + 'USDT': (100.0, 0.01, 0.01) for name in names},
+        latency=args.latency_ms / 1000,
+        seed=args.seed
+    )
+    simulator.install()
+    MainConfig(write_config(names))
+
+    from bybit_base import BybitBase
+    from bybit_ticker import BybitTicker
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        tickers = [BybitTicker(name) for name in names]
+        simulator.run(args.step_ms / 1000)
+        simulator.calls.clear()
+        reads = []
+        threads = []
+        for ticker in tickers:
+            if shared:
+                read = lambda ticker=ticker: ticker.get_latest_buy_and_sell_orders(ticker.coin_ticker)
+            else:
+                read = lambda ticker=ticker: BybitBase.get_top_of_book(ticker.get_order_book(ticker.coin_ticker)['result'])
+            for _ in range(args.procedures):
+                threads.append(threading.Thread(target=poll, args=(read, args.duration, args.poll_ms / 1000, reads)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        simulator.stop()
+
+    requests = simulator.calls['orderbook']
+    print(f'{"hub" if shared else "own requests":<13} {len(names)} symbols x {args.procedures} procedures | '
+          f'{sum(reads)} reads, {requests} order book requests ({requests / args.duration:7.1f}/s)')
+
+
+def run_stream(args) -> None:
+    stream = ReplayStream()
+    feed = OrderBookFeed(stream)
+    hub = MarketDataHub(session=None, feed=feed, linger=0)
+    topic = OrderBookFeed.TOPIC.format(SYMBOL)
+    subscription = hub.subscribe(SYMBOL)
+    stream.push({'topic': topic, 'type': 'snapshot', 'cross_seq': 1, 'data': {'order_book': [
+        {'id': '1', 'price': '99.99', 'side': 'Buy', 'size': 10},
+        {'id': '2', 'price': '100.01', 'side': 'Sell', 'size': 10},
+    ]}})
+
+    reads = 1000000
+    started_at = time.perf_counter()
+    for _ in range(reads):
+        hub.top_of_book(SYMBOL)
+    elapsed = time.perf_counter() - started_at
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(reads // 10):
+        hub.top_of_book(SYMBOL)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename')
+                    if stat.traceback[0].filename.endswith('market_data_hub.py'))
+    print(f'{"stream read":<13} {elapsed / reads * 1e9:7.1f} ns per read | '
+          f'{allocated} bytes allocated over {reads // 10} reads')
+
+    wakes = []
+    stopped = threading.Event()
+
+    def consume():
+        count = 0
+        top = hub.peek(SYMBOL)
+        while not stopped.is_set():
+            update = hub.wait_for_update(SYMBOL, top, timeout=0.1)
+            if update is not None:
+                top = update
+                count += 1
+        wakes.append(count)
+
+    consumers = [threading.Thread(target=consume) for _ in range(args.consumers)]
+    for consumer in consumers:
+        consumer.start()
+    for seq in range(2, args.deltas + 2):
+        stream.push({'topic': topic, 'type': 'delta', 'cross_seq': seq, 'prev_cross_seq': seq - 1,
+                     'data': {'update': [{'id': '1', 'side': 'Buy', 'size': seq}]}})
+        time.sleep(args.delta_ms / 1000)
+    time.sleep(0.2)
+    stopped.set()
+    for consumer in consumers:
+        consumer.join()
+    print(f'{"fan out":<13} {args.deltas} deltas to {args.consumers} consumers | '
+          f'{sum(wakes)} wake ups, min {min(wakes)} per consumer')
+
+    subscription.release()
+    print(f'{"release":<13} book kept after the last release: {feed.get_book(SYMBOL) is not None}, '
+          f'top of book: {hub.peek(SYMBOL)}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--symbols', type=int, default=4)
+    parser.add_argument('--procedures', type=int, default=4, help='concurrent readers per symbol')
+    parser.add_argument('--duration', type=float, default=3, help='seconds the readers poll')
+    parser.add_argument('--poll-ms', type=float, default=10, help='interval between the reads of a procedure')
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--step-ms', type=float, default=50, help='interval between market moves')
+    parser.add_argument('--consumers', type=int, default=8)
+    parser.add_argument('--deltas', type=int, default=200)
+    parser.add_argument('--delta-ms', type=float, default=2, help='interval between depth deltas')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # Paths in the config module are relative to the repository root
+    os.chdir(ROOT)
+    os.makedirs('./app/log', exist_ok=True)
+
+    names = [f'SIM{i}' for i in range(args.symbols)]
+    for shared in (False, True):
+        run_rest(names, shared, args)
+    run_stream(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Load test of the order procedures against the exchange simulator, without network.
+
+Every simulated ticker runs rounds of place_limit_order_with_retry followed by
+force_stop_limit_order on its own thread, while the simulated market moves.
+The script reports the throughput and the latency percentiles of both
+procedures, and the number of calls the exchange received.
+
+Usage: python benchmarks/bench_order_procedures.py [--tickers 4] [--rounds 10] [--latency-ms 5]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from config.main_config import MainConfig
+from exchange_simulator import ExchangeSimulator
+
+
+def percentile(samples: list, quantile: float) -> float:
+    samples = sorted(samples)
+    return samples[int(quantile * (len(samples) - 1))]
+
+
+def write_config(tickers: list) -> str:
+    config = {
+        'user_data': {'api_key': 'SIMULATOR', 'api_secret': 'SIMULATOR', 'collateral': 'USDT'},
+        # Records still go to the JSON log file, as in production
+        'logging': {'console': False},
+        'tickers': {ticker: {'wallet_perc': 0.05, 'long_leverage': 5, 'short_leverage': 5} for ticker in tickers},
+    }
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as file:
+        file.write(json.dumps(config))
+    return path
+
+
+def run_ticker(ticker, rounds: int, timings: dict) -> None:
+    for i in range(rounds):
+        side = 'Buy' if i % 2 == 0 else 'Sell'
+        started_at = time.perf_counter()
+        filled_side = ticker.place_limit_order_with_retry(side)
+        timings['entry'].append(time.perf_counter() - started_at)
+        if not filled_side:
+            continue
+
+        long_position, short_position = ticker.fetch_ticker_positions()
+        position = long_position if side == 'Buy' else short_position
+        started_at = time.perf_counter()
+        ticker.force_stop_limit_order(position)
+        timings['exit'].append(time.perf_counter() - started_at)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tickers', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--jitter-ms', type=float, default=2)
+    parser.add_argument('--partial-fill-ratio', type=float, default=0.5)
+    parser.add_argument('--step-ms', type=float, default=10, help='interval between market moves')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # Paths in the config module are relative to the repository root
+    os.chdir(ROOT)
+    os.makedirs('./app/log', exist_ok=True)
+
+    names = [f'SIM{i}' for i in range(args.tickers)]
+    simulator = ExchangeSimulator(
+        symbols={name + 'USDT': (100.0, 0.01, 0.01) for name in names},
+        balance=100000.0,
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        partial_fill_ratio=args.partial_fill_ratio,
+        seed=args.seed
+    )
+    simulator.install()
+    MainConfig(write_config(names))
+
+    from bybit_ticker import BybitTicker
+
+    timings = {'entry': [], 'exit': []}
+    with contextlib.redirect_stdout(io.StringIO()):
+        tickers = [BybitTicker(name) for name in names]
+        for ticker in tickers:
+            ticker.warm_up()
+        simulator.run(args.step_ms / 1000)
+        started_at = time.perf_counter()
+        threads = [threading.Thread(target=run_ticker, args=(ticker, args.rounds, timings)) for ticker in tickers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started_at
+        simulator.stop()
+
+    procedures = len(timings['entry']) + len(timings['exit'])
+    print(f'{args.tickers} tickers x {args.rounds} rounds, {args.latency_ms} ms latency: '
+          f'{procedures} procedures in {elapsed:.2f} s ({procedures / elapsed:.1f}/s)')
+    for name, samples in (('place_limit_order_with_retry', timings['entry']), ('force_stop_limit_order', timings['exit'])):
+        if samples:
+            print(f'{name:<30} n={len(samples):<5} mean {statistics.mean(samples) * 1000:8.1f} ms | '
+                  f'p50 {percentile(samples, 0.5) * 1000:8.1f} ms | p99 {percentile(samples, 0.99) * 1000:8.1f} ms')
+    print('Exchange calls:', ', '.join(f'{method}={count}' for method, count in sorted(simulator.calls.items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark of a multi-symbol reversal.
+
+Every simulated ticker starts with a long position, then a sell alert for all
+of them is dispatched at once, as when a strategy fires on many symbols in the
+same bar. The run ends when every long position is closed and every short
+position is open. The script reports the duration, the time until the first
+close and the first entry order of every ticker reached the exchange, and the
+order and cancel requests the exchange received.
+
+Usage: python benchmarks/bench_reversal.py [--tickers 30] [--latency-ms 20] [--workers 16]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from config.main_config import MainConfig
+from exchange_simulator import ExchangeSimulator
+
+# Requests that place or cancel orders
+ORDER_METHODS = ('place_active_order', 'cancel_active_order', 'cancel_all_active_orders')
+
+
+def write_config(tickers: list) -> str:
+    config = {
+        'user_data': {'api_key': 'SIMULATOR', 'api_secret': 'SIMULATOR', 'collateral': 'USDT'},
+        'logging': {'console': False},
+        'tickers': {ticker: {'wallet_perc': 0.01, 'long_leverage': 5, 'short_leverage': 5} for ticker in tickers},
+    }
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as file:
+        file.write(json.dumps(config))
+    return path
+
+
+def reversed_all(simulator: ExchangeSimulator, symbols: list) -> bool:
+    positions = [simulator.my_position(symbol)['result'] for symbol in symbols]
+    return all(long['size'] == 0 and short['size'] > 0 for long, short in positions)
+
+
+def run(names: list, args) -> None:
+    symbols = [name + 'USDT' for name in names]
+    simulator = ExchangeSimulator(
+        symbols={symbol: (100.0, 0.01, 0.01) for symbol in symbols},
+        balance=1000000.0,
+        latency=args.latency_ms / 1000,
+        touch_fill_probability=0.5,
+        seed=args.seed
+    )
+    simulator.install()
+    MainConfig(write_config(names))
+
+    from alert_manager import AlertManager
+    from signal_dispatcher import SignalDispatcher
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        alert_manager = AlertManager()
+        alert_manager.warm_up_executor.shutdown(wait=True)
+        for ticker in alert_manager.tickers.values():
+            ticker.place_order(ticker.coin_ticker, 'Buy', 1)
+        dispatcher = SignalDispatcher(alert_manager.handle_alert, preempt=alert_manager.preempt, workers=args.workers)
+
+        # Time at which the first close (reduce-only) and the first entry order of every symbol reach the exchange
+        first_orders = {}
+        place = simulator._place
+
+        def timed_place(symbol, side, order_type, qty, time_in_force, price=None, reduce_only=False, *args, **kwargs):
+            first_orders.setdefault((symbol, reduce_only), time.perf_counter())
+            return place(symbol, side, order_type, qty, time_in_force, price, reduce_only, *args, **kwargs)
+
+        simulator._place = timed_place
+        simulator.calls.clear()
+        simulator.run(args.step_ms / 1000)
+        started_at = time.perf_counter()
+        for name in names:
+            dispatcher.submit({'ticker': name, 'side': 'Sell', 'comment': 'entry', 'client': alert_manager.tickers[name],
+                               'signal_id': 0})
+        deadline = started_at + args.timeout
+        while not reversed_all(simulator, symbols) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - started_at
+        simulator.stop()
+
+    requests = {method: simulator.calls.get(method, 0) for method in ORDER_METHODS if simulator.calls.get(method)}
+    done = 'done' if reversed_all(simulator, symbols) else 'timed out'
+    latencies = ''
+    for name, reduce_only in (('close', True), ('entry', False)):
+        samples = [at - started_at for (symbol, kind), at in first_orders.items() if kind == reduce_only]
+        if samples:
+            latencies += f'first {name} p50 {statistics.median(samples) * 1000:5.0f} ms, max {max(samples) * 1000:5.0f} ms | '
+    print(f'{"reversal":<12} {done} in {elapsed:6.2f} s | {latencies}'
+          f'{sum(requests.values())} order requests {requests}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tickers', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--step-ms', type=float, default=50, help='interval between market moves')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=16, help='signal dispatcher workers')
+    args = parser.parse_args()
+
+    # Paths in the config module are relative to the repository root
+    os.chdir(ROOT)
+    os.makedirs('./app/log', exist_ok=True)
+
+    names = [f'SIM{i}' for i in range(args.tickers)]
+    run(names, args)
+
+
+if __name__ == '__main__':
+    main()
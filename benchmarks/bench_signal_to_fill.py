@@ -0,0 +1,311 @@
+"""
+End-to-end benchmark from TradingView alert to filled order, against the exchange simulator.
+
+Alerts are posted to the /webhook route of the Flask application at a fixed
+rate, round-robin across the tickers and alternating buy and sell, so every
+alert after the first one of a ticker reverses its position. The stages of
+each alert are timed:
+
+    parse            decoding and validating the webhook body
+    dispatch         webhook request until a worker starts handling the alert
+    position_fetch   fetch_ticker_positions
+    entry_sizing     calculate_entry_size
+    order_placement  place_limit_order_po, until the exchange answers
+    fill             order placement until the exchange fills the order
+    fill_detection   exchange fill until the entry procedure returns
+    reversal_close   closing the previous position (cancel_all_trades_limit)
+    signal_to_order  webhook request until the first entry order is accepted
+    signal_to_fill   webhook request until the entry order is filled
+
+Results are written as JSON. Passing the results of a previous run with
+--baseline prints the change of every stage and exits with status 1 when a
+p50 or p99 got slower than the threshold, so regressions show up before deploy.
+Order procedures run on the default threads engine.
+
+Usage: python benchmarks/bench_signal_to_fill.py [--tickers 8] [--rate 4] [--duration 20]
+           [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+
+from config.main_config import MainConfig
+from exchange_simulator import ExchangeSimulator
+
+STAGES = ('parse', 'dispatch', 'position_fetch', 'entry_sizing', 'order_placement', 'fill', 'fill_detection',
+          'reversal_close', 'signal_to_order', 'signal_to_fill')
+
+
+class StageRecorder():
+    """
+    Collects stage durations, following each alert from the webhook to its fill.
+    """
+
+    def __init__(self):
+        self.samples = {stage: [] for stage in STAGES}
+        self.posted_at = dict()
+        self._traces = threading.local()
+        self._orders = dict()
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.samples[stage].append(seconds)
+
+    def trace(self) -> dict:
+        return getattr(self._traces, 'current', None)
+
+    def start_trace(self, ticker: str) -> dict:
+        # The trace of the alert being handled by this worker thread
+        trace = {'ticker': ticker, 'posted_at': self.posted_at.get(ticker), 'order_placed': False}
+        self._traces.current = trace
+        return trace
+
+    def order_placed(self, order_id: str, placed_at: float) -> None:
+        trace = self.trace()
+        if trace is None:
+            return
+        with self._lock:
+            self._orders[order_id] = (trace, placed_at)
+        if not trace['order_placed'] and trace['posted_at'] is not None:
+            trace['order_placed'] = True
+            self.add('signal_to_order', placed_at - trace['posted_at'])
+
+    def on_order(self, order: dict) -> None:
+        # Order tracker listener: the simulator pushes the fill as soon as it happens
+        if order.get('order_status') != 'Filled':
+            return
+        with self._lock:
+            entry = self._orders.pop(order['order_id'], None)
+        if entry is None:
+            return
+        trace, placed_at = entry
+        filled_at = time.perf_counter()
+        trace['filled_at'] = filled_at
+        self.add('fill', filled_at - placed_at)
+        if trace['posted_at'] is not None:
+            self.add('signal_to_fill', filled_at - trace['posted_at'])
+
+    def summary(self) -> dict:
+        summary = dict()
+        for stage, samples in self.samples.items():
+            samples = sorted(samples)
+            if not samples:
+                summary[stage] = {'count': 0}
+                continue
+            summary[stage] = {
+                'count': len(samples),
+                'mean_ms': sum(samples) / len(samples) * 1000,
+                'p50_ms': samples[int(0.5 * (len(samples) - 1))] * 1000,
+                'p90_ms': samples[int(0.9 * (len(samples) - 1))] * 1000,
+                'p99_ms': samples[int(0.99 * (len(samples) - 1))] * 1000,
+                'max_ms': samples[-1] * 1000,
+            }
+        return summary
+
+
+def timed(function, callback):
+    # Wraps a callable, passing its start time, end time and result to the callback
+    def wrapper(*args, **kwargs):
+        started_at = time.perf_counter()
+        result = function(*args, **kwargs)
+        callback(started_at, time.perf_counter(), result)
+        return result
+    return wrapper
+
+
+def instrument_ticker(ticker, recorder: StageRecorder) -> None:
+    ticker.fetch_ticker_positions = timed(
+        ticker.fetch_ticker_positions, lambda start, end, result: recorder.add('position_fetch', end - start))
+    ticker.calculate_entry_size = timed(
+        ticker.calculate_entry_size, lambda start, end, result: recorder.add('entry_sizing', end - start))
+    ticker.cancel_all_trades_limit = timed(
+        ticker.cancel_all_trades_limit, lambda start, end, result: recorder.add('reversal_close', end - start))
+
+    def on_placed(start, end, result):
+        recorder.add('order_placement', end - start)
+        if result['ret_code'] == 0:
+            recorder.order_placed(result['result']['order_id'], end)
+    ticker.place_limit_order_po = timed(ticker.place_limit_order_po, on_placed)
+
+    def on_entry_done(start, end, result):
+        trace = recorder.trace()
+        if result and trace is not None and 'filled_at' in trace:
+            recorder.add('fill_detection', end - trace['filled_at'])
+    ticker.place_limit_order_with_retry = timed(ticker.place_limit_order_with_retry, on_entry_done)
+
+
+def timed_alert_handler(handle_alert, recorder: StageRecorder):
+    def wrapper(data):
+        trace = recorder.start_trace(data['ticker'])
+        if trace['posted_at'] is not None:
+            recorder.add('dispatch', time.perf_counter() - trace['posted_at'])
+        return handle_alert(data)
+    return wrapper
+
+
+def load_webhook_app():
+    # app/__main__.py holds the Flask application; load it without running the server
+    spec = importlib.util.spec_from_file_location('webhook_app', os.path.join(ROOT, 'app', '__main__.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def write_config(tickers: list) -> str:
+    config = {
+        'user_data': {'api_key': 'SIMULATOR', 'api_secret': 'SIMULATOR', 'collateral': 'USDT'},
+        # Records still go to the JSON log file, as in production
+        'logging': {'console': False},
+        'execution_engine': 'threads',
+        'tickers': {ticker: {'wallet_perc': 0.02, 'long_leverage': 5, 'short_leverage': 5} for ticker in tickers},
+    }
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as file:
+        file.write(json.dumps(config))
+    return path
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, threshold: float, min_delta_ms: float) -> bool:
+    """
+    Prints the change of every stage against a baseline run.
+
+    Returns:
+        bool: True if a stage p50 or p99 regressed by more than the threshold and by more than min_delta_ms.
+    """
+    regressed = False
+    print(f'\nAgainst {baseline.get("commit") or "baseline"}:')
+    for stage in STAGES:
+        current, previous = results['stages'].get(stage, {}), baseline['stages'].get(stage, {})
+        if not current.get('count') or not previous.get('count'):
+            continue
+        changes = []
+        for key in ('p50_ms', 'p99_ms'):
+            change = (current[key] - previous[key]) / previous[key] if previous[key] else 0
+            flag = ''
+            # Sub-millisecond stages are noisy: small absolute changes are not reported
+            if change > threshold and current[key] - previous[key] > min_delta_ms:
+                flag = ' REGRESSION'
+                regressed = True
+            changes.append(f'{key[:3]} {previous[key]:8.2f} -> {current[key]:8.2f} ms ({change:+.0%}){flag}')
+        print(f'  {stage:<16} ' + ' | '.join(changes))
+    return regressed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tickers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=4, help='alerts per second, across all tickers')
+    parser.add_argument('--duration', type=float, default=20, help='seconds of alerts')
+    parser.add_argument('--latency-ms', type=float, default=5, help='simulated exchange latency')
+    parser.add_argument('--jitter-ms', type=float, default=2)
+    parser.add_argument('--step-ms', type=float, default=10, help='interval between market moves')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='file receiving the JSON results; printed if omitted')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slowdown reported as a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='smallest slowdown reported as a regression')
+    args = parser.parse_args()
+
+    # Paths in the config module are relative to the repository root
+    os.chdir(ROOT)
+    os.makedirs('./app/log', exist_ok=True)
+
+    names = [f'SIM{i}' for i in range(args.tickers)]
+    symbols = {name + 'USDT': (100.0, 0.01, 0.01) for name in names}
+    # The application creates its default tickers as well
+    symbols.update(ExchangeSimulator.SYMBOLS)
+    simulator = ExchangeSimulator(symbols=symbols, balance=1000000.0, latency=args.latency_ms / 1000,
+                                  jitter=args.jitter_ms / 1000, seed=args.seed)
+    simulator.install()
+    MainConfig(write_config(names + [symbol[:-len('USDT')] for symbol in ExchangeSimulator.SYMBOLS]))
+
+    from bybit_ticker import BybitTicker
+    from order_tracker import OrderTracker
+
+    recorder = StageRecorder()
+    OrderTracker.getinstance().add_listener(recorder.on_order)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        webhook_app = load_webhook_app()
+        alert_manager = webhook_app.alert_manager
+        for name in names:
+            alert_manager.tickers[name] = BybitTicker(name)
+            alert_manager.tickers[name].warm_up()
+            instrument_ticker(alert_manager.tickers[name], recorder)
+
+        decoder = webhook_app.decoder
+        decoder.decode = timed(decoder.decode, lambda start, end, result: recorder.add('parse', end - start))
+        alert_manager.handle_alert = timed_alert_handler(alert_manager.handle_alert, recorder)
+        webhook_app.dispatcher.handler = alert_manager.handle_alert
+
+        client = webhook_app.app.test_client()
+        simulator.run(args.step_ms / 1000)
+        sent, rejected = 0, 0
+        started_at = time.perf_counter()
+        while time.perf_counter() - started_at < args.duration:
+            name = names[sent % len(names)]
+            side = 'buy' if (sent // len(names)) % 2 == 0 else 'sell'
+            recorder.posted_at[name] = time.perf_counter()
+            response = client.post('/webhook', data=json.dumps({'ticker': name, 'side': side, 'comment': 'entry'}))
+            if response.status_code != 200:
+                rejected += 1
+            sent += 1
+            time.sleep(max(started_at + sent / args.rate - time.perf_counter(), 0))
+
+        # Let the last procedures finish
+        deadline = time.perf_counter() + 30
+        while webhook_app.dispatcher.stats()['running'] + webhook_app.dispatcher.queue_depth() > 0 \
+                and time.perf_counter() < deadline:
+            time.sleep(0.1)
+        simulator.stop()
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        'alerts_sent': sent,
+        'alerts_rejected': rejected,
+        'dispatcher': webhook_app.dispatcher.stats(),
+        'exchange_calls': simulator.calls,
+        'stages': recorder.summary(),
+    }
+
+    for stage, stats in results['stages'].items():
+        if stats['count']:
+            print(f'{stage:<16} n={stats["count"]:<5} p50 {stats["p50_ms"]:8.2f} ms | '
+                  f'p90 {stats["p90_ms"]:8.2f} ms | p99 {stats["p99_ms"]:8.2f} ms')
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            if compare(results, json.loads(file.read()), args.threshold, args.min_delta_ms):
+                return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
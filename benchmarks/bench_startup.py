@@ -0,0 +1,61 @@
+"""
+Benchmark of the AlertManager startup against the exchange simulator.
+
+The alert manager is created with a growing number of configured tickers,
+on a simulated exchange with the given REST latency. The script reports the
+time until it can take alerts, and until every ticker is warmed up on the
+background pool.
+
+Usage: python benchmarks/bench_startup.py [--tickers 1 10 50] [--latency-ms 50]
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'app'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_order_procedures import write_config
+from config.main_config import MainConfig
+from exchange_simulator import ExchangeSimulator
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--tickers', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--latency-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    # Paths in the config module are relative to the repository root
+    os.chdir(ROOT)
+    os.makedirs('./app/log', exist_ok=True)
+
+    names = [f'SIM{i}' for i in range(max(args.tickers))]
+    simulator = ExchangeSimulator(
+        symbols={name + 'USDT': (100.0, 0.01, 0.01) for name in names},
+        latency=args.latency_ms / 1000,
+        jitter=0
+    )
+    simulator.install()
+
+    for count in args.tickers:
+        MainConfig(write_config(names[:count]))
+        from alert_manager import AlertManager
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            started_at = time.perf_counter()
+            alert_manager = AlertManager()
+            ready = time.perf_counter() - started_at
+            alert_manager.warm_up_executor.shutdown(wait=True)
+            warmed_up = time.perf_counter() - started_at
+        failed = sum(not ticker.warmed_up for ticker in alert_manager.tickers.values())
+        print(f'{count:>4} tickers | taking alerts after {ready * 1000:7.1f} ms | '
+              f'warmed up after {warmed_up * 1000:7.1f} ms | {failed} failed')
+
+
+if __name__ == '__main__':
+    main()